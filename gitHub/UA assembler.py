@@ -1,31 +1,62 @@
 # This program is an assembler which generates machine code to the universal architecture
-# specification. Since the python versions of the emulator and this assembler are mere proofs of
-# concept, the output of the assembler, and the input of the emulator are hex code. The final
-# version will output binaries, and the final emulator will execute binaries.
+# specification. By default its output is a binary image (see uaImage.py for the format) which
+# the emulator can map straight into its memory. The hex code output of the original proof of
+# concept is still available as an export format. With '-c' a source file is assembled into a
+# relocatable object instead (see uaObject.py) which uaLinker.py combines with others into a
+# program.
+#
+# Other programs use the assembler through the Assembler class (see uaAssembler.py for how to
+# import it.) Each Assembler has its own symbol table and operand aliases, so any number of them
+# can be used one after another or at the same time in different threads, and errors in the
+# source code are raised as AssemblyErrors.
+import argparse
+import concurrent.futures
+import os
 import sys
 import re
+import types
+
+import uaImage
+import uaObject
 
 def main ():
 
     # This program can take the source file and the destination file as command line arguments
     # but for the sake of ease of use, if these command line args are omitted, the assembler will
     # prompt the user for them.
+    argParser = argparse.ArgumentParser(description="Assemble a UA assembly source file.")
+    argParser.add_argument("source", nargs="?", help="the source file containing main")
+    argParser.add_argument("output", nargs="?", help="the file to write the assembled program to")
+    argParser.add_argument("-f", "--format", choices=("bin", "hex"), default="bin",
+                           help="write a binary image (the default) or the program as hex code")
+    argParser.add_argument("-c", "--object", action="store_true",
+                           help="write a relocatable object to be linked with uaLinker.py instead of a program")
+    argParser.add_argument("-m", "--map", help="also write a symbol map of the program's labels to this file")
+    argParser.add_argument("-s", "--stream", action="store_true",
+                           help="read the source a line at a time and write the output as it's assembled, "
+                                "for sources too large to hold in memory")
+    argParser.add_argument("-O", "--optimize", action="store_true",
+                           help="rewrite the code to be smaller and faster with the peephole optimizer")
+    args = argParser.parse_args()
+
     sourceFilePath = ""
-    if len(sys.argv) <= 1:
+    if args.source is None:
         # Check whether the user entered the source file as a command line argument and prompt
         # them for it if they haven't.
         sourceFilePath = input("Pleas enter the path of the source file containing main: ")
 
     else:
-        sourceFilePath = sys.argv[1]
+        sourceFilePath = args.source
 
     # Read the source code from the file specified and store it in a variable. If the file cannot be
-    # accessed, prompt the user to re-enter the file name.
+    # accessed, prompt the user to re-enter the file name. When streaming, the file is read as it's
+    # assembled instead.
     sourceCode = ""
     while True:
         try:
             with open(sourceFilePath, "r") as f:
-                sourceCode = f.read()
+                if not args.stream:
+                    sourceCode = f.read()
                 break
 
         except FileNotFoundError:
@@ -35,37 +66,107 @@ def main ():
 
     if sourceFilePath == "": exit()
 
-    # Assemble the source code and store the output in a variable.
-    hexcode = assemble(sourceCode)
+    # Assemble the source code and package it in the output format requested. A source which is
+    # streamed is assembled while the output is written instead.
+    assembler = Assembler(args.optimize)
+    outputFormat = "object" if args.object else args.format
+    try:
+        if args.stream:
+            output = None
+        elif args.object:
+            output = uaObject.packObject(assembler.assembleObject(sourceCode))
+        elif args.format == "hex":
+            program = assembler.assemble(sourceCode)
+            output = uaImage.formatHex(program)
+        else:
+            program = assembler.assemble(sourceCode)
+            output = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    except AssemblyError as error:
+        print(error)
+        exit()
 
     # Check whether the user entered the output file as a command line argument and prompt them for one if
     # they haven't.
     outputFilePath = ""
-    if len(sys.argv) <= 2:
+    if args.output is None:
         print("Please type the name of the file to which you would like to write")
         outputFilePath = input("your assembled program: ")
 
     else:
-        outputFilePath = sys.argv[2]
+        outputFilePath = args.output
 
-    # Attempt to write the assembler output to a hex file. Failing that, prompt the user to retype the
+    # Attempt to write the assembler output to the output file. Failing that, prompt the user to retype the
     # path to their output.
     while True:
         try:
-            with open(outputFilePath, "w") as f:
-                f.write(hexcode)
-                break
+            if args.stream:
+                with open(sourceFilePath, "r") as source, open(outputFilePath, "w+b") as f:
+                    try:
+                        assembler.assembleStream(source, f, outputFormat)
+                    except AssemblyError as error:
+                        print(error)
+                        f.close()
+                        os.remove(outputFilePath)
+                        exit()
+            elif args.format == "hex" and not args.object:
+                with open(outputFilePath, "w") as f:
+                    f.write(output)
+            else:
+                with open(outputFilePath, "wb") as f:
+                    f.write(output)
+            break
 
         except FileNotFoundError:
             print("A directory in the specified path to your output file was inaccessible")
             outputFilePath = input("or non-existent. Please retype the file path or press ENTER to exit: ")
             if outputFilePath == "": break
     if outputFilePath == "": exit()
+
+    if args.map:
+        with open(args.map, "w") as f:
+            f.write(uaImage.formatSymbolMap(assembler.labels()))
+
+    if args.optimize:
+        print("Peephole optimizations: {}.".format(", ".join(
+            "{} {}".format(count, rewrite) for rewrite, count in assembler.optimizations.items())))
     print("Assembler output written to {}.".format(outputFilePath))
 
-# Named values go in here. Operands can also be aliased, but if it isn't
-# data-pool, it goes in oper_ID.pneumonics.
-labelsAliasesAndStructMembers = {}
+# An error in the source code being assembled. The error type is the kind of error; "Syntax",
+# "Naming", "Aliasing" or "Size". The message may span several lines.
+class AssemblyError(Exception):
+    def __init__(self, errorType, lineNumber, message):
+        super().__init__(errorType, lineNumber, message)
+        self.errorType = errorType
+        self.lineNumber = lineNumber
+        self.message = message
+
+    def __str__ (self):
+        return "{} error on line {}. {}".format(self.errorType, self.lineNumber, self.message)
+
+# Names which are used but never defined are reported together. 'errors' holds an AssemblyError
+# for every reference to one of them.
+class UnresolvedNamesError(AssemblyError):
+    def __init__(self, errors):
+        super().__init__(errors[0].errorType, errors[0].lineNumber, errors[0].message)
+        self.errors = errors
+
+    def __str__ (self):
+        lines = [str(error) for error in self.errors]
+        lines.append("{} unresolved reference{}.".format(len(self.errors), "" if len(self.errors) == 1 else "s"))
+        return "\n".join(lines)
+
+# The value of a name in an Assembler's symbol table. The value type is "a" for
+# address labels, "l" for literals (aliased literals and struct members) and "d"
+# for aliased data-pool addresses. The size is the number of bytes the value
+# occupies when it's written into the program.
+class NamedValue:
+    def __init__(self, valueType, value, size):
+        self.valueType = valueType
+        self.value = value
+        self.size = size
+
+    def toBytes (self):
+        return (self.value & ((1 << (self.size * 8)) - 1)).to_bytes(self.size, "big")
 # various patterns for identifying special tokens
 validNamePattern = re.compile(r"\A[a-zA-Z_][a-zA-Z_0-9]*\Z")
 memoryWindowAddrPattern = re.compile(r"\Aw[0-9A-Fa-f]{2}\Z")
@@ -74,312 +175,913 @@ intLiteralPattern = re.compile(r"\A0[bwdq][dx]([0-9A-Fa-f]+)\Z")
 charLiteralPattern = re.compile(r"\A\'(.|\n)\Z")
 strLiteralPattern = re.compile(r"\A\"(.|\n)*\Z")
 regValAddrPattern = re.compile(r"\A(@[a-z]+[0-9]?)\Z")
-regOffsetPattern = re.compile(r"\A(@[a-z]+[0-9]?\+)((0x[0-9a-fA-F]+)|([0-9]+))|([a-zA-Z_][a-zA-Z_0-9]*)|([a-zA-Z_][a-zA-Z_0-9]*\.[a-zA-Z_][a-zA-Z_0-9]*)\Z")
+regOffsetPattern = re.compile(r"\A@?([a-z]+[0-9]?)\+((0x[0-9a-fA-F]+)|([0-9]+)|([a-zA-Z_][a-zA-Z_0-9]*)|([a-zA-Z_][a-zA-Z_0-9]*\.[a-zA-Z_][a-zA-Z_0-9]*))\Z")
+plainIntPattern = re.compile(r"\A(0x[0-9A-Fa-f]+|[0-9]+)\Z")
 flagBitPattern = re.compile(r"\A[A-Z]{2,3}\Z")
 SIMDGroupPattern = re.compile(r"\A(w|p)(sg)(0|1)\Z")
 structMemberPattern = re.compile(r"\A[a-zA-Z_][a-zA-Z_0-9]*\.[a-zA-Z_][a-zA-Z_0-9]*\Z")
-# Assemble the program passed to it in the 'sourceCode' parameter. Output is a hex-string.
-def assemble (sourceCode):
-    # The parse tree is a list of lists Each line goes into an inner
-    # list with the inner list containing one element for each sequence of
-    # non-white space characters and character literals prefixed with an '
-    # and string literals prefixed with ". Comments are also removed. We
-    # don't care here what a programmer has to say about their program.
-    parseTree = parse(sourceCode)
-
-    # The hex code for the program goes here, but as the values of address
-    # labels haven't been calculated, they're just inserted into the hex code
-    # between colons :<address label>:
-    partiallyAssembledProgram = ""
-    # Structs span multiple lines, so we need a special boolean flag to tell
-    # whether we're inside a struct.
-    scanningStruct = False
-    # The name of a struct followed by a period is prepended onto the name of
-    # every struct member. This name mangling means that a programmer
-    # can access a struct member with dot notation familiar to anybody
-    # who has ever done object-oriented programming. This also gets rid
-    # of naming conflicts.
-    currentStructName = ""
-    # This gets incremented by the size of every instruction or defined memory
-    # (dm) segment as the program gets assembled. Basically, the values of
-    # address labels are calculated as the assembler works.
-    currentAddr = 0
-    for i, v in enumerate(parseTree):
-
-        # Check whether or not to start scanning a struct, get the struct name,
-        # and ensure the struct header is syntactically correct.
-        if v[0] == "struct":
-            scanningStruct = True
-            if v[1][-1] != "{":
-                currentStructName = v[1]
-            else:
-                currentStructName = v[1][:-1]
-
-            if v[2] != "{" and v[1][-1] != '{':
-                print("Syntax error on line {}. Expected '{' at end of struct header.".format(i+1))
-                exit()
 
-        # Everything not struct scanning related goes here.
-        if not scanningStruct:
-            # If the line begins with an instruction pneumonic, assemble the instruction.
-            if v[0] in op_codes.pneumonics:
-                assembledInstr, size = op_codes.pneumonics[v[0]].assembleFunc(v)
-                currentAddr += size
-                partiallyAssembledProgram += assembledInstr
+# Machine code is written into an Emitter. The whole UA address space is only 64 KiB, so the
+# buffer is allocated at that size up front and never has to grow or be copied while the
+# program is assembled. Names whose values aren't known yet, and address labels, are written as
+# zeroes and recorded in 'references' as (offset, width, name, line number) so they can be
+# filled in later. Once they are, 'relocations' lists the (offset, width) of every address.
+class Emitter:
+    def __init__(self, size = 0x10000):
+        self.size = size
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.position = 0
+        self.references = []
+        self.relocations = []
+
+    def reserve (self, size, lineNumber):
+        if self.position + size > self.size:
+            raise AssemblyError("Size", lineNumber, "The program no longer fits in the {} byte address space.".format(
+                self.size))
+        start = self.position
+        self.position += size
+        return start
+
+    def emitByte (self, value, lineNumber):
+        self.buffer[self.reserve(1, lineNumber)] = value & 0xFF
+
+    def emitBytes (self, data, lineNumber):
+        start = self.reserve(len(data), lineNumber)
+        self.view[start:self.position] = data
+
+    def emitInt (self, value, width, lineNumber):
+        start = self.reserve(width, lineNumber)
+        self.view[start:self.position] = (value & ((1 << (width * 8)) - 1)).to_bytes(width, "big")
+
+    def emitReference (self, name, width, lineNumber):
+        self.references.append((self.reserve(width, lineNumber), width, name, lineNumber))
+
+    # Emit an operand payload as returned by parseOperand; either bytes or the name of a value
+    # which hasn't been defined yet.
+    def emitPayload (self, payload, payloadSize, lineNumber):
+        if isinstance(payload, str):
+            self.emitReference(payload, payloadSize, lineNumber)
+        else:
+            self.emitBytes(payload, lineNumber)
+
+    # Overwrite bytes which have already been emitted, like the zeroes left for a reference.
+    def patch (self, offset, data):
+        self.buffer[offset:offset + len(data)] = data
+
+    def getProgram (self):
+        return bytes(self.view[:self.position])
+
+# An emitter which writes the machine code straight to a file as it's emitted instead of keeping
+# it, so only the references are held in memory. 'file' is a binary file opened for writing and
+# reading which the code starts at 'start' in, and with 'hexCode' every byte is written as two
+# hex digits. References are patched by seeking back to them.
+class FileEmitter(Emitter):
+    def __init__(self, file, start = 0, hexCode = False, size = 0x10000):
+        self.size = size
+        self.file = file
+        self.start = start
+        self.hexCode = hexCode
+        self.position = 0
+        self.references = []
+        self.relocations = []
+
+    def emitByte (self, value, lineNumber):
+        self.emitBytes(bytes((value & 0xFF,)), lineNumber)
+
+    def emitBytes (self, data, lineNumber):
+        self.reserve(len(data), lineNumber)
+        self.file.write(bytes(data).hex().encode("ascii") if self.hexCode else data)
+
+    def emitInt (self, value, width, lineNumber):
+        self.emitBytes((value & ((1 << (width * 8)) - 1)).to_bytes(width, "big"), lineNumber)
+
+    def emitReference (self, name, width, lineNumber):
+        self.references.append((self.position, width, name, lineNumber))
+        self.emitBytes(bytes(width), lineNumber)
+
+    def patch (self, offset, data):
+        end = self.file.tell()
+        if self.hexCode:
+            self.file.seek(self.start + offset * 2)
+            self.file.write(bytes(data).hex().encode("ascii"))
+        else:
+            self.file.seek(self.start + offset)
+            self.file.write(data)
+        self.file.seek(end)
+
+# An assembler and the names defined in the source code it has assembled. The op-code and operand
+# tables are shared by every Assembler and never change. Names defined in the source code go in
+# the Assembler's own symbol table and operand aliases in its own copy of the operand table, so
+# nothing one Assembler does is seen by another. An Assembler assembles one program; use a new
+# one for each. With 'optimize' the source code goes through a PeepholeOptimizer first, and
+# 'optimizations' counts the rewrites it made.
+class Assembler:
+    def __init__(self, optimize = False):
+        # Named values go in here. Operands can also be aliased, but if it isn't
+        # data-pool, it goes in operandPneumonics. This is the symbol table; forward
+        # references to it are patched in by resolveReferences once the whole program
+        # has been assembled.
+        self.labelsAliasesAndStructMembers = {}
+        self.operandPneumonics = dict(oper_ID.pneumonics)
+        # Operand tokens which have been parsed before and what they were parsed into; see
+        # parseOperand.
+        self.operandCache = {}
+        self.optimize = optimize
+        self.optimizations = dict.fromkeys(peepholeRewrites, 0)
+
+    # Assemble the program passed to it in the 'sourceCode' parameter. Output is the machine code
+    # as bytes, starting at address 0.
+    def assemble (self, sourceCode):
+        emitter = self.assembleSource(sourceCode)
+
+        # The second pass. Every name which was referenced before it was defined is still zeroes
+        # in the emitter, so now that the symbol table is complete they are patched in place.
+        self.resolveReferences(emitter)
+
+        return emitter.getProgram()
+
+    # Assemble a single source file of a program into a relocatable object. Names the file doesn't
+    # define are left for the linker to resolve, and every address label it defines is exported.
+    def assembleObject (self, sourceCode):
+        emitter = self.assembleSource(sourceCode, True)
+        imports = []
+        self.resolveReferences(emitter, imports)
+        return uaObject.ObjectFile(emitter.getProgram(), self.labels(), emitter.relocations, imports)
+
+    # Assemble source code read a line at a time from 'lines', like an open file, and write the
+    # output straight to 'file', a binary file opened for writing and reading. The output format
+    # is "bin" for a binary image, "hex" for hex code or "object" for a relocatable object and the
+    # output is the same as the other methods produce. Only the symbol table and the references
+    # are kept in memory, so how much memory it takes doesn't depend on how long the source code is
+    # or how much machine code it assembles into. Returns the size of the machine code in bytes.
+    def assembleStream (self, lines, file, outputFormat = "bin"):
+        # The header of an image or object is written last, when the sizes in it are known.
+        start = file.tell()
+        headerSize = {"bin": uaImage.imageHeaderSize(1), "hex": 0, "object": uaObject.headerFormat.size}[outputFormat]
+        file.write(bytes(headerSize))
+        emitter = FileEmitter(file, start + headerSize, outputFormat == "hex")
+        parseTree = parseLines(lines)
+        if self.optimize:
+            optimizer = PeepholeOptimizer()
+            parseTree = map(optimizer.rewriteLine, parseTree)
+        self.assembleParseTree(parseTree, emitter)
+        if self.optimize:
+            self.optimizations = optimizer.counts
+
+        if outputFormat == "object":
+            imports = []
+            self.resolveReferences(emitter, imports)
+            objectFile = uaObject.ObjectFile(None, self.labels(), emitter.relocations, imports)
+            file.write(uaObject.packObjectTables(objectFile))
+            header = uaObject.packObjectHeader(objectFile, emitter.position)
+        else:
+            self.resolveReferences(emitter)
+            header = uaImage.packImageHeader([(0, uaImage.sectionCode, emitter.position)], self.entryPoint())
+        if headerSize:
+            end = file.tell()
+            file.seek(start)
+            file.write(header)
+            file.seek(end)
+        return emitter.position
+
+    # The address labels defined in the source code and their addresses, for symbol maps.
+    def labels (self):
+        return {name: namedValue.value for name, namedValue in self.labelsAliasesAndStructMembers.items()
+                if namedValue.valueType == "a"}
+
+    # Programs start executing at the main label. If there isn't one, execution starts at address 0.
+    def entryPoint (self):
+        main = self.labelsAliasesAndStructMembers.get("main")
+        if main is not None and main.valueType == "a":
+            return main.value
+        return 0
+
+    # The first pass; assemble every line of the source code into an emitter, recording the values of
+    # names as they're defined. 'isObject' is true when the labels are exported to other files.
+    def assembleSource (self, sourceCode, isObject = False):
+        # The parse tree is a list of lists Each line goes into an inner
+        # list with the inner list containing one element for each sequence of
+        # non-white space characters and character literals prefixed with an '
+        # and string literals prefixed with ". Comments are also removed. We
+        # don't care here what a programmer has to say about their program.
+        parseTree = parse(sourceCode)
+        if self.optimize:
+            optimizer = PeepholeOptimizer(isObject)
+            parseTree = optimizer.optimize(parseTree)
+            self.optimizations = optimizer.counts
+        return self.assembleParseTree(parseTree)
+
+    def assembleParseTree (self, parseTree, emitter = None):
+        labelsAliasesAndStructMembers = self.labelsAliasesAndStructMembers
+        operandPneumonics = self.operandPneumonics
+
+        # The machine code for the program goes here, but as the values of address
+        # labels haven't all been calculated, forward references are left as zeroes
+        # and recorded in emitter.references.
+        if emitter is None:
+            emitter = Emitter()
+        # Structs span multiple lines, so we need a special boolean flag to tell
+        # whether we're inside a struct.
+        scanningStruct = False
+        # The name of a struct followed by a period is prepended onto the name of
+        # every struct member. This name mangling means that a programmer
+        # can access a struct member with dot notation familiar to anybody
+        # who has ever done object-oriented programming. This also gets rid
+        # of naming conflicts.
+        currentStructName = ""
+        for v in parseTree:
+            lineNumber = v.lineNumber
+
+            # Check whether or not to start scanning a struct, get the struct name,
+            # and ensure the struct header is syntactically correct.
+            if v[0] == "struct":
+                if len(v) < 2 or v[1] == "{":
+                    raise AssemblyError("Syntax", lineNumber, "Expected a struct name after 'struct'.")
+                scanningStruct = True
+                if v[1][-1] != "{":
+                    currentStructName = v[1]
+                else:
+                    currentStructName = v[1][:-1]
 
-            # If the line isn't an instruction, do something else.
-            else:
-                # Assign address values to labels.
-                if v[0][0] == ":":
-                    if v[0][-1] != ":":
-                        print("Syntax error on line {}. Expected ':' at end of address label.".format(i+1))
-                        exit()
-                    if validNamePattern.search(v[1][1:-1]):
-                        # The convoluted slicing expression seen here takes the '0x' off the output of the
-                        # hex function and creates a fixed-length hex value. In this case, a 16-bit address
-                        # (2 hex digits per byte.)
-                        labelsAliasesAndStructMembers[v[1][1:-1]] = "a" + ("0000" + hex(currentAddr)[2:])[-4:]
-                    else:
-                        print("Syntax error on line {}. A name must begin with a letter or an".format(i + 1))
-                        print("underscore followed by zero or more letters, numbers, or underscores")
-                        exit()
-                elif v[0] == "alias":
-                    # The syntax is "alias <The alias of the operand>:\s<The operand to be aliased>"
-                    # The use of this feature is strictly limited to data-pool addresses,
-                    # register value addresses, registers and literals. First we check whether the alias
-                    # is a valid name and inform the programmer if the name they chose is invalid.
-                    if v[1][-1] != ":":
-                        print("Syntax error on line {}. Expected ':' after alias name.".format(i+1))
-
-                    if validNamePattern.search(v[1][:-1]):
-                        # Here's what happens when the programmer wants to alias a memory window or parameter
-                        # space operand:
-                        if memoryWindowAddrPattern.search(v[2]) or parameterSpaceAddrPattern.search(v[2]):
-                            dataPoolAddr = int(v[2][1:], 16)
-                            if dataPoolAddr > 0x7F:
-                                print("Syntax error on line {}. Parameter space and memory window addresses".format(
-                                    i + 1))
-                                print("may not be larger than 127 (0x7F).")
-                                exit()
-                            if v[0] == "p":
-
-                                dataPoolAddr += 0x80
-                            elif v[0] == "w":
-                                # Here, we don't need to do anything further to dataPoolAddr,
-                                # we just need to yell at the programmer and exit the program
-                                # if they give us a number greater that 127.
-                                pass
-
-                            labelsAliasesAndStructMembers[v[1][:-1]] = "d" + ("0000" + hex(dataPoolAddr)[2:])[-2:]
-
-                        elif v[2] in oper_ID.pneumonics:
-                            # No need to check whether the programmer tried to alias a register offset. The offset
-                            # would be in the same token, thereby preventing a match. Example: @wi3+42
-                            oper_ID.pneumonics[v[1]] = oper_ID.pneumonics[v[2]]
-
-                        elif charLiteralPattern.search(v[2]):
-                            labelsAliasesAndStructMembers[v[1][-1]] = "l" + ("0000" + hex(ord(v[2][1]))[2:])[-2:]
-
-                        elif intLiteralPattern.search(v[2]):
-                            labelsAliasesAndStructMembers[v[1][-1]] = "l" + convertIntLiteral(v[2])
+                if v[1][-1] != '{' and (len(v) < 3 or v[2] != "{"):
+                    raise AssemblyError("Syntax", lineNumber, "Expected '{' at end of struct header.")
 
-                    else:
-                        print("Syntax error on line {}. A name must begin with a letter or an".format(i+1))
-                        print("underscore followed by zero or more letters, numbers, or underscores")
-                        exit()
+            # Everything not struct scanning related goes here.
+            if not scanningStruct:
+                # If the line begins with an instruction pneumonic, assemble the instruction.
+                if v[0] in op_codes.pneumonics:
+                    op_codes.pneumonics[v[0]].assembleInstruction(self, v, emitter)
 
-                elif v[0] == "dm":
+                # If the line isn't an instruction, do something else.
+                else:
+                    # Assign address values to labels. The address of a label is the address of
+                    # whatever is emitted after it.
+                    if v[0][0] == ":":
+                        if v[0][-1] != ":" or len(v[0]) < 3:
+                            raise AssemblyError("Syntax", lineNumber, "Expected ':' at end of address label.")
+                        if validNamePattern.search(v[0][1:-1]):
+                            if v[0][1:-1] in labelsAliasesAndStructMembers:
+                                raise AssemblyError("Naming", lineNumber, "'{}' has already been defined.".format(v[0][1:-1]))
+                            labelsAliasesAndStructMembers[v[0][1:-1]] = NamedValue("a", emitter.position, 2)
+                            self.operandCache.pop(v[0][1:-1], None)
+                        else:
+                            raise AssemblyError("Syntax", lineNumber, "A name must begin with a letter or an\n"
+                                                "underscore followed by zero or more letters, numbers, or underscores")
+                    elif v[0] == "alias":
+                        # The syntax is "alias <The alias of the operand>:\s<The operand to be aliased>"
+                        # The use of this feature is strictly limited to data-pool addresses,
+                        # register value addresses, registers and literals. First we check whether the alias
+                        # is a valid name and inform the programmer if the name they chose is invalid.
+                        if len(v) < 3 or v[1][-1] != ":":
+                            raise AssemblyError("Syntax", lineNumber, "Expected ':' after alias name.")
+
+                        if validNamePattern.search(v[1][:-1]):
+                            # A name which was a register until now isn't one anymore.
+                            self.operandCache.pop(v[1][:-1], None)
+
+                            # Here's what happens when the programmer wants to alias a memory window or parameter
+                            # space operand:
+                            if memoryWindowAddrPattern.search(v[2]) or parameterSpaceAddrPattern.search(v[2]):
+                                dataPoolAddr = int(v[2][1:], 16)
+                                if dataPoolAddr > 0x7F:
+                                    raise AssemblyError("Syntax", lineNumber, "Parameter space and memory window addresses\n"
+                                                        "may not be larger than 127 (0x7F).")
+                                if v[2][0] == "p":
+
+                                    dataPoolAddr += 0x80
+                                elif v[2][0] == "w":
+                                    # Here, we don't need to do anything further to dataPoolAddr,
+                                    # we just need to yell at the programmer and stop assembling
+                                    # if they give us a number greater that 127.
+                                    pass
+
+                                labelsAliasesAndStructMembers[v[1][:-1]] = NamedValue("d", dataPoolAddr, 1)
+
+                            elif v[2] in operandPneumonics and operandPneumonics[v[2]].payloadSize == 0:
+                                # No need to check whether the programmer tried to alias a register offset. The offset
+                                # would be in the same token, thereby preventing a match. Example: @wi3+42
+                                operandPneumonics[v[1][:-1]] = operandPneumonics[v[2]]
+
+                            elif charLiteralPattern.search(v[2]):
+                                labelsAliasesAndStructMembers[v[1][:-1]] = NamedValue("l", ord(v[2][1]), 1)
+
+                            elif intLiteralPattern.search(v[2]):
+                                labelsAliasesAndStructMembers[v[1][:-1]] = NamedValue(
+                                    "l", int(self.parseIntLiteral(v[2], lineNumber), 16), oper_ID.pneumonics[v[2][0:2]].payloadSize)
 
-                    for dmToken in v[1:]:
+                            else:
+                                raise AssemblyError("Syntax", lineNumber, "Only data-pool addresses, registers and literals\n"
+                                                    "can be aliased. '{}' is none of these.".format(v[2]))
 
-                        # Insert all the values listed in the defined memory section into the program and add their
-                        # sizes in bytes to currentAddr for continued address calculation
-                        if strLiteralPattern.search(dmToken):
-                            if len(dmToken) > 1:
-                                for singleChar in dmToken[1:]:
-                                    partiallyAssembledProgram += ("0000" + hex(ord(singleChar))[2:])[-2:]
-                                    currentAddr += 1
+                        else:
+                            raise AssemblyError("Syntax", lineNumber, "A name must begin with a letter or an\n"
+                                                "underscore followed by zero or more letters, numbers, or underscores")
 
-                        elif charLiteralPattern.search(dmToken):
-                            partiallyAssembledProgram += ("0000" + hex(ord(dmToken[1]))[2:])[-2:]
-                            currentAddr += 1
+                    elif v[0] == "dm":
 
-                        elif intLiteralPattern.search(dmToken):
-                            newNumStr = convertIntLiteral(dmToken)
-                            currentAddr = newNumStr // 2
-                            partiallyAssembledProgram += newNumStr
+                        for dmToken in v[1:]:
 
-                        elif dmToken in labelsAliasesAndStructMembers:
-                            currentAddr += len(labelsAliasesAndStructMembers[dmToken]) // 2
-                            partiallyAssembledProgram += "l" + labelsAliasesAndStructMembers[dmToken][1:]
+                            # Insert all the values listed in the defined memory section into the program.
+                            # The emitter keeps track of the address of the next byte.
+                            if strLiteralPattern.search(dmToken):
+                                try:
+                                    emitter.emitBytes(dmToken[1:].encode("latin-1"), lineNumber)
+                                except UnicodeEncodeError:
+                                    raise AssemblyError("Syntax", lineNumber, "Characters in defined memory must fit in a byte.")
 
-                        else:
-                            if dmToken not in oper_ID.pneumonics:
-                                # This is necessary because if the size of something isn't known and it's going into
-                                # memory, it thwarts any attempt to calculate addresses automatically.
-                                print("Naming error on line {}. Names used in defined memory sections must be defined".format(i+1))
-                                print("prior to reference. '{}' was not recognized.".format(dmToken))
-                                exit()
-                            else:
-                                print("Aliasing error on line {}. Neither operands, nor their aliases may be included".format(i+1))
-                                print("in a defined memory section.")
-                                exit()
+                            elif charLiteralPattern.search(dmToken):
+                                emitter.emitByte(ord(dmToken[1]), lineNumber)
 
-        else:
-            # Struct scanning goes here. Struct members are assigned literal values with the syntax:
-            # structMemberName:  decimalValue
-            # Struct members are meant to be used as offsets, so they are always 16-bit.
-            if v[0] != "struct" and v[2] != "{":
-                if validNamePattern.search(v[0][:-1]):
-                    if v[0][-1] != ":":
-                        print("Syntax error on line {}. Expected ':' at the end of struct member name.".format(i+1))
-                    try:
-                        if v[1][-1] == "}":
-                            labelsAliasesAndStructMembers[currentStructName + "." + v[0][:-1]] = "l" + ("0000" + hex(int(v[1]))[2:])[-4:]
-                        else:
-                            labelsAliasesAndStructMembers[currentStructName + "." + v[0][:-1]] = "l" + ("0000" + hex(int(v[1][:-1]))[2:])[-4:]
-                    except ValueError:
-                        print("Syntax Error on line {}. The value assingned to {}".format(i+1, currentStructName + "." + v[0][:-1]))
-                        print("Cannot be converted to an integer.")
-                        exit()
-                else:
-                    print("Syntax error on line {}. Names must begin in a letter or an".format(i+1))
-                    print("underscore followed by 0 or more letters, numbers and underscores.")
+                            elif intLiteralPattern.search(dmToken):
+                                emitter.emitBytes(bytes.fromhex(self.parseIntLiteral(dmToken, lineNumber)), lineNumber)
 
+                            elif dmToken in labelsAliasesAndStructMembers:
+                                namedValue = labelsAliasesAndStructMembers[dmToken]
+                                if namedValue.valueType == "a":
+                                    emitter.emitReference(dmToken, namedValue.size, lineNumber)
+                                else:
+                                    emitter.emitBytes(namedValue.toBytes(), lineNumber)
 
-        if v[-1][-1] == "}": scanningStruct = False
+                            else:
+                                if dmToken not in operandPneumonics:
+                                    # This is necessary because if the size of something isn't known and it's going into
+                                    # memory, it thwarts any attempt to calculate addresses automatically.
+                                    raise AssemblyError("Naming", lineNumber, "Names used in defined memory sections must be defined\n"
+                                                        "prior to reference. '{}' was not recognized.".format(dmToken))
+                                else:
+                                    raise AssemblyError("Aliasing", lineNumber, "Neither operands, nor their aliases may be included\n"
+                                                        "in a defined memory section.")
 
-    assembledProgram = ""
-    scanningNamedValue = False
-    for v in partiallyAssembledProgram:
+                    else:
+                        raise AssemblyError("Syntax", lineNumber, "'{}' is not an instruction, label or directive.".format(v[0]))
 
-        pass
+            else:
+                # Struct scanning goes here. Struct members are assigned literal values with the syntax:
+                # structMemberName:  decimalValue
+                # Struct members are meant to be used as offsets, so they are always 16-bit.
+                if v[0] != "struct" and v[0] != "}":
+                    if validNamePattern.search(v[0][:-1]):
+                        if v[0][-1] != ":" or len(v) < 2:
+                            raise AssemblyError("Syntax", lineNumber, "Expected ':' at the end of struct member name.")
+                        try:
+                            if v[1][-1] == "}":
+                                labelsAliasesAndStructMembers[currentStructName + "." + v[0][:-1]] = NamedValue("l", int(v[1][:-1]), 2)
+                            else:
+                                labelsAliasesAndStructMembers[currentStructName + "." + v[0][:-1]] = NamedValue("l", int(v[1]), 2)
+                        except ValueError:
+                            raise AssemblyError("Syntax", lineNumber, "The value assingned to {}\n"
+                                                "Cannot be converted to an integer.".format(currentStructName + "." + v[0][:-1]))
+                    else:
+                        raise AssemblyError("Syntax", lineNumber, "Names must begin in a letter or an\n"
+                                            "underscore followed by 0 or more letters, numbers and underscores.")
+
+
+            if v[-1][-1] == "}": scanningStruct = False
+
+        return emitter
+
+    # Patch the value of every reference recorded by the emitter into the machine code. Each
+    # reference is a single dictionary lookup and slice assignment, so resolution takes time in
+    # proportion to the number of references regardless of the size of the program or the symbol
+    # table. Names which are never defined are reported together once every reference has been
+    # checked, unless an 'imports' list is passed, in which case they're added to it for the linker.
+    def resolveReferences (self, emitter, imports = None):
+        labelsAliasesAndStructMembers = self.labelsAliasesAndStructMembers
+        undefinedNames = []
+        relocations = emitter.relocations
+        for offset, width, name, lineNumber in emitter.references:
+            namedValue = labelsAliasesAndStructMembers.get(name)
+            if namedValue is None or namedValue.valueType == "d":
+                if namedValue is None and imports is not None:
+                    imports.append((offset, width, name, lineNumber))
+                else:
+                    undefinedNames.append((lineNumber, name))
+                continue
+            if namedValue.valueType == "a":
+                relocations.append((offset, width))
+            emitter.patch(offset, (namedValue.value & ((1 << (width * 8)) - 1)).to_bytes(width, "big"))
+
+        if undefinedNames:
+            errors = []
+            for lineNumber, name in undefinedNames:
+                if name in labelsAliasesAndStructMembers:
+                    errors.append(AssemblyError("Naming", lineNumber, "'{}' is a data-pool alias and can't be used as an address.".format(name)))
+                else:
+                    errors.append(AssemblyError("Naming", lineNumber, "'{}' is never defined.".format(name)))
+            raise UnresolvedNamesError(errors)
+
+    # Parse an operand token. Returns a tuple with a boolean which is true for non-data-pool operands
+    # (the operand type bit,) the operand field (a data-pool address or an operand ID,) the payload
+    # and the size of the payload in bytes. The payload is None if there isn't one, the bytes of the
+    # payload if its value is known or the name it refers to if it's an address label or the name
+    # hasn't been defined yet. Addresses are always left as references so they can be relocated.
+    # Programs use the same operands over and over, so what tokens were parsed into is kept in a
+    # cache, which defining a name removes the name from.
+    def parseOperand (self, token, lineNumber):
+        operandCache = self.operandCache
+        parsed = operandCache.get(token)
+        if parsed is None:
+            parsed, cacheable = self.classifyOperand(token, lineNumber)
+            if cacheable:
+                if len(operandCache) >= operandCacheSize:
+                    # Evict the token which has been in the cache the longest.
+                    del operandCache[next(iter(operandCache))]
+                operandCache[token] = parsed
+        return parsed
+
+    # Parse an operand token without looking in the cache. Returns what parseOperand returns and
+    # whether it can be cached; the addresses, literals and numeric register offsets whose meaning
+    # no name can change, and registers, which stay cached until a name of the same spelling is
+    # defined.
+    def classifyOperand (self, token, lineNumber):
+        labelsAliasesAndStructMembers = self.labelsAliasesAndStructMembers
+        # Parse the operand, determine whether it's data-pool or non-data-pool, set its operand type
+        # bit accordingly, and get the appropriate operand ID and payload.
+        if memoryWindowAddrPattern.search(token):
+            dataPoolAddr = int(token[1:], 16)
+            if dataPoolAddr > 0x7F:
+                raise AssemblyError("Syntax", lineNumber, "Parameter space and memory window addresses\n"
+                                    "may not be larger than 127 (0x7F).")
+            return (False, dataPoolAddr, None, 0), True
+
+        elif parameterSpaceAddrPattern.search(token):
+            dataPoolAddr = int(token[1:], 16)
+            if dataPoolAddr > 0x7F:
+                raise AssemblyError("Syntax", lineNumber, "Parameter space and memory window addresses\n"
+                                    "may not be larger than 127 (0x7F).")
+            return (False, dataPoolAddr + 0x80, None, 0), True
+
+        elif intLiteralPattern.search(token):
+            operObject = oper_ID.pneumonics[token[0:2]]
+            return (True, operObject.operandID, bytes.fromhex(self.parseIntLiteral(token, lineNumber)), operObject.payloadSize), True
+
+        elif charLiteralPattern.search(token):
+            operObject = oper_ID.pneumonics["0b"]
+            return (True, operObject.operandID, bytes((ord(token[1]) & 0xFF,)), operObject.payloadSize), True
+
+        elif plainIntPattern.search(token):
+            # Integers without a word size prefix are 16-bit literals; most often they're addresses.
+            operObject = oper_ID.pneumonics["0w"]
+            return (True, operObject.operandID, (int(token, 0) & 0xFFFF).to_bytes(2, "big"), operObject.payloadSize), True
+
+        elif token in labelsAliasesAndStructMembers:
+            namedValue = labelsAliasesAndStructMembers[token]
+            if namedValue.valueType == "a":
+                operObject = oper_ID.pneumonics["@"]
+                return (True, operObject.operandID, token, operObject.payloadSize), False
+
+            elif namedValue.valueType == "l":
+                operObject = oper_ID.pneumonics[literalPrefixes[namedValue.size]]
+                return (True, operObject.operandID, namedValue.toBytes(), operObject.payloadSize), False
 
-    return assembledProgram
+            else:
+                return (False, namedValue.value, None, 0), False
+
+        elif token in self.operandPneumonics:
+            # Only registers and flags stand on their own. The operand IDs of literals, addresses and
+            # register offsets need the value which follows them in the same token.
+            operObject = self.operandPneumonics[token]
+            if operObject.payloadSize:
+                raise AssemblyError("Syntax", lineNumber, "'{}' must be followed by a value.".format(token))
+            return (True, operObject.operandID, None, 0), True
+
+        elif regOffsetPattern.search(token):
+            opPneumonic = "@" + token[:token.find("+")].lstrip("@") + "+"
+            if opPneumonic not in oper_ID.pneumonics:
+                raise AssemblyError("Syntax", lineNumber, "'{}' is not a register which can be offset.".format(token))
+            operObject = oper_ID.pneumonics[opPneumonic]
+            offset = token[token.find("+") + 1:]
+            if plainIntPattern.search(offset):
+                payload = (int(offset, 0) & 0xFFFF).to_bytes(2, "big")
+                return (True, operObject.operandID, payload, operObject.payloadSize), True
+            elif offset in labelsAliasesAndStructMembers and labelsAliasesAndStructMembers[offset].valueType == "l":
+                payload = (labelsAliasesAndStructMembers[offset].value & 0xFFFF).to_bytes(2, "big")
+            else:
+                payload = offset
+            return (True, operObject.operandID, payload, operObject.payloadSize), False
 
-# Convert UA assembly integer literals into a plain hexadecimal notation of the length specified in the word length field of the literal.
-def convertIntLiteral (intLiteral):
-    if intLiteral[0] != "0":
-        raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
+        elif regValAddrPattern.search(token):
+            raise AssemblyError("Syntax", lineNumber, "'{}' is not a register whose value can be used as an address.".format(token))
 
-    returnValue = ""
-    if intLiteral[1] == "b":
-        if intLiteral[2] == "x":
-            returnValue = ("00" + intLiteral[3:])[-2:]
-        elif intLiteral[2] == "d":
-            returnValue = ("00" + hex(int(intLiteral[3:]))[2:])[-2:]
         else:
-            raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
-
-    elif intLiteral[1] == "w":
-        if intLiteral[2] == "x":
-            returnValue = ("0000" + intLiteral[3:])[-4:]
-        elif intLiteral[2] == "d":
-            returnValue = ("0000" + hex(int(intLiteral[3:]))[2:])[-4:]
+            # Anything else should be the name of an address label which hasn't been defined yet.
+            if not validNamePattern.search(token) and not structMemberPattern.search(token):
+                raise AssemblyError("Syntax", lineNumber, "'{}' is not a valid operand.".format(token))
+            operObject = oper_ID.pneumonics["@"]
+            return (True, operObject.operandID, token, operObject.payloadSize), False
+
+    # Parse a token which must be a constant known at assembly time, like the exit code of an exit
+    # instruction. Returns its value as an integer.
+    def parseConstant (self, token, lineNumber):
+        if intLiteralPattern.search(token):
+            return int(self.parseIntLiteral(token, lineNumber), 16)
+        elif charLiteralPattern.search(token):
+            return ord(token[1])
+        elif plainIntPattern.search(token):
+            return int(token, 0)
+        elif token in self.labelsAliasesAndStructMembers and self.labelsAliasesAndStructMembers[token].valueType == "l":
+            return self.labelsAliasesAndStructMembers[token].value
+        raise AssemblyError("Syntax", lineNumber, "Expected a constant but found '{}'.".format(token))
+
+    # Parse an integer literal token. Returns its value in hexadecimal, like convertIntLiteral, but
+    # raises an AssemblyError if the literal is invalid or its value doesn't fit in its word length.
+    def parseIntLiteral (self, token, lineNumber):
+        try:
+            return convertIntLiteral(token)
+        except ValueError as error:
+            raise AssemblyError("Syntax", lineNumber, str(error))
+
+    # Emit a 16-bit address used as the target of a branch or call. The address can be an address
+    # label, defined or not, or an integer.
+    def emitAddress (self, token, lineNumber, emitter):
+        if intLiteralPattern.search(token) or plainIntPattern.search(token):
+            emitter.emitInt(self.parseConstant(token, lineNumber), 2, lineNumber)
+        elif validNamePattern.search(token):
+            emitter.emitReference(token, 2, lineNumber)
         else:
-            raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
+            raise AssemblyError("Syntax", lineNumber, "Expected an address but found '{}'.".format(token))
 
-    elif intLiteral[1] == "d":
-        if intLiteral[2] == "x":
-            returnValue = ("00000000" + intLiteral[3:])[-8:]
-        elif intLiteral[2] == "d":
-            returnValue = ("00000000" + hex(int(intLiteral[3:]))[2:])[-8:]
-        else:
-            raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
+# Assemble a program with a new Assembler. Returns the machine code as bytes.
+def assemble (sourceCode):
+    return Assembler().assemble(sourceCode)
+
+# Assemble a single source file of a program into a relocatable object with a new Assembler.
+def assembleObject (sourceCode):
+    return Assembler().assembleObject(sourceCode)
+
+# Assemble a batch of sources at the same time in a pool of threads, each with its own Assembler.
+# Returns a list with the result for each source in the order they were given; the machine code,
+# or the object if 'objects' is true, or the AssemblyError raised if the source has an error, so
+# that one bad source doesn't keep the others from being assembled. The results are exactly those
+# of assembling the sources one at a time.
+def assembleBatch (sources, workers = None, objects = False):
+    def assembleOne (sourceCode):
+        assembler = Assembler()
+        try:
+            if objects:
+                return assembler.assembleObject(sourceCode)
+            return assembler.assemble(sourceCode)
+        except AssemblyError as error:
+            return error
 
-    elif intLiteral[1] == "q":
-        if intLiteral[2] == "x":
-            returnValue = ("0000000000000000" + intLiteral[3:])[-16:]
-        elif intLiteral[2] == "d":
-            returnValue = ("0000000000000000" + hex(int(intLiteral[3:]))[2:])[-16:]
-        else:
-            raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(assembleOne, sources))
 
-    else :
+# Convert UA assembly integer literals into a plain hexadecimal notation of the length specified in the word length field of the literal.
+# A ValueError is raised if the value of the literal doesn't fit in that word length.
+def convertIntLiteral (intLiteral):
+    if intLiteral[0:1] != "0" or intLiteral[1:2] not in literalWordLengths or intLiteral[2:3] not in ("x", "d"):
         raise ValueError("UA assembly integer literals must begin with 0 followed by b, w, d, or q to indicate word size followed by x or d for hexadecimal or decimal respectively.")
 
-    return returnValue
+    digits = intLiteral[3:]
+    if intLiteral[2] == "d" and not digits.isdecimal():
+        raise ValueError("'{}' is not a decimal number.".format(digits))
+    value = int(digits, 16 if intLiteral[2] == "x" else 10)
+
+    wordLength, wordName = literalWordLengths[intLiteral[1]]
+    if value >> (wordLength * 8):
+        raise ValueError("'{}' doesn't fit in a {}.".format(intLiteral, wordName))
+    return "{:0{}x}".format(value, wordLength * 2)
+
+# Token kinds produced by lex(). Words are runs of non-whitespace characters outside literals,
+# string and character literals are produced with their escape sequences already decoded.
+class token_kinds:
+    word = 0; string = 1; char = 2
+
+# A single master pattern that splits source code into line breaks, literals and words. Each
+# match swallows the separators in front of it and comments are swallowed along with the line
+# break that ends them, so there is one match per token or line and every character of the
+# source is consumed by exactly one match. Commas are treated as separators so
+# 'dm "text", 0bx00' yields the string and the literal.
+tokenPattern = re.compile(r"""
+    (?:[^\S\n]|,)*
+    (?:
+        (?P<word>(?:[^\s,"'/]|/(?!/))+)
+      | (?P<newline>(?://[^\n]*)?\n)
+      | (?P<string>"(?:[^"\\\n]|\\.)*")
+      | (?P<char>'(?:[^'\\\n]|\\.)*')
+      | (?P<unterminated>["'])
+      | (?://[^\n]*)?\Z
+    )
+""", re.VERBOSE)
+escapePattern = re.compile(r"\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|[0-7]{1,3}|.)")
+simpleEscapes = {"n": "\n", "t": "\t", "r": "\r", "a": "\a", "b": "\b", "f": "\f", "v": "\v",
+                 "\\": "\\", "\"": "\"", "'": "'"}
+
+# Replace the escape sequence matched by escapePattern with the character it stands for. Escapes
+# follow the same rules as python string literals, which is what literals used to be evaluated as.
+def decodeEscape (match):
+    escape = match.group(1)
+    if escape in simpleEscapes:
+        return simpleEscapes[escape]
+    if escape[0] in "xu":
+        return chr(int(escape[1:], 16))
+    if escape[0] in "01234567":
+        return chr(int(escape, 8))
+    return "\\" + escape
+
+# Split the source code into typed tokens in a single pass. Yields (kind, value, lineNumber)
+# tuples where kind is one of the token_kinds. Comments and whitespace are dropped. Lines are
+# numbered from 'lineNumber'.
+def lex (sourceCode, lineNumber = 1):
+    for match in tokenPattern.finditer(sourceCode):
+        group = match.lastgroup
+        if group == "word":
+            yield token_kinds.word, match.group(group), lineNumber
+        elif group == "newline":
+            lineNumber += 1
+        elif group == "string":
+            text = match.group(group)[1:-1]
+            if "\\" in text:
+                text = escapePattern.sub(decodeEscape, text)
+            yield token_kinds.string, text, lineNumber
+        elif group == "char":
+            text = match.group(group)[1:-1]
+            if "\\" in text:
+                text = escapePattern.sub(decodeEscape, text)
+            if len(text) != 1:
+                raise AssemblyError("Syntax", lineNumber, "The expression in a character literal\n"
+                                    "must resolve to a single character!")
+            yield token_kinds.char, text, lineNumber
+        elif group == "unterminated":
+            literalType = "string" if match.group(group) == "\"" else "character"
+            raise AssemblyError("Syntax", lineNumber, "Expected end of {} literal but found\n"
+                                "end of line.".format(literalType))
+
+# A line of the parse tree. It behaves exactly like the list of tokens on the line, but also
+# remembers which line of the source file it came from so errors can be reported accurately.
+class SourceLine(list):
+    def __init__(self, lineNumber):
+        super().__init__()
+        self.lineNumber = lineNumber
 
 # Parse the code into a list of lists with the outer list containing
-# one list for each line of code and the elements of the inner lists
+# one list for each non-blank line of code and the elements of the inner lists
 # containing all non-whitespace character sequences, string and char
-# literals in the order they appear in the source code.
+# literals in the order they appear in the source code. String literals
+# are prefixed with " and character literals with ' so they can be told
+# apart from other tokens.
 def parse (sourceCode):
-    parsedCode = [[""]]         # The parse tree goes here
-    scanningStrLiteral = False  # String and character literals may contain spaces, so they
-    scanningChrLiteral = False  # require special treatment.
-    ignoringComment = False     #
-    for charIndex, charValue in enumerate(sourceCode):
-
-        if charValue == "/" and sourceCode[charIndex + 1] == "/":
-            ignoringComment = True
-
-        if charValue == "\n":
-            ignoringComment = False
-
-        if not ignoringComment:
-            if charValue == "\"" and not scanningChrLiteral and sourceCode[charIndex - 1] != "\\":
-                scanningStrLiteral = not scanningStrLiteral
-                if not scanningStrLiteral: # This runs when the end of a string literal is reached.
-                    parsedCode[-1][-1] += "\""
-                    parsedCode[-1][-1] = eval(parsedCode[-1][-1])
-                    parsedCode[-1][-1] = "\"" + parsedCode[-1][-1]
-                    parsedCode[-1].append("")
-
-            if charValue == "'" and not scanningStrLiteral and sourceCode[charIndex - 1] != "\\":
-                scanningChrLiteral = not scanningChrLiteral
-                if not scanningChrLiteral: # This runs when the end of a char literal is reached.
-                    parsedCode[-1][-1] += "'"
-                    parsedCode[-1][-1] = eval(parsedCode[-1][-1])
-                    if len(parsedCode[-1][-1]) > 1:
-                        print("Syntax error on line {}. The expression in a character literal".format(len(parsedCode)))
-                        print("must resolve to a single character!")
-                        exit()
-                    parsedCode[-1][-1] = "'" + parsedCode[-1][-1]
-                    parsedCode[-1].append("")
-
-            if charValue != "\n":
-                if scanningChrLiteral or scanningStrLiteral:
-                    # Character literals may only be one character long. Otherwise, they are treated
-                    # the same way as strings.
-                    parsedCode[-1][-1] += charValue
-                else:
-                    # Every sequence of non-whitespace characters outside string and character
-                    # literals is a single token.
-                    if charValue != " " and charValue != "\t":
-                        parsedCode[-1][-1] += charValue
-                    else:
-                        parsedCode[-1].append("")
-            else:
-                # When linebreaks are found, create a new list to represent the next line.
-                if scanningStrLiteral:
-                    print("Syntax error on line {}. Expected end of string literal but found".format(len(parsedCode)))
-                    print("end of line.")
-                    exit()
-                if scanningChrLiteral:
-                    print("Syntax error on line {}. Expected end of character literal but found".format(len(parsedCode)))
-                    print("end of line.")
-                    exit()
-                parsedCode.append([""])
-
-    # Remove the blank lines and empty strings that occur when the algorithm above is applied.
-    parseTreeWithEmptyStrings = parsedCode
-    parsedCode = []
-    for line in parseTreeWithEmptyStrings:
-        if line != [""] and line != []:
-            parsedCode.append([])
-            for token in line:
-                if token != "":
-                    parsedCode[-1].append(token)
-
-    parseTreeWithBlankLines = parsedCode
     parsedCode = []
-    for line in parseTreeWithBlankLines:
-        if line != []:
-            parsedCode.append(line)
+    currentLine = None
+    currentLineNumber = 0
+    literalPrefixes = ("", "\"", "'")
+    for kind, value, lineNumber in lex(sourceCode):
+        if lineNumber != currentLineNumber:
+            currentLineNumber = lineNumber
+            currentLine = SourceLine(lineNumber)
+            parsedCode.append(currentLine)
+        if kind == token_kinds.word:
+            currentLine.append(value)
+        else:
+            currentLine.append(literalPrefixes[kind] + value)
 
     return parsedCode
 
+# Parse source code a line at a time, yielding the lines of the parse tree parse() would return
+# one by one. 'lines' is any iterable of the lines of the source code, like an open file, so the
+# source code and its parse tree never have to be held in memory all at once. No token can span
+# lines, so every line can be lexed on its own.
+def parseLines (lines):
+    literalPrefixes = ("", "\"", "'")
+    for lineNumber, text in enumerate(lines, 1):
+        currentLine = None
+        for kind, value, tokenLineNumber in lex(text, lineNumber):
+            if currentLine is None:
+                currentLine = SourceLine(lineNumber)
+            if kind == token_kinds.word:
+                currentLine.append(value)
+            else:
+                currentLine.append(literalPrefixes[kind] + value)
+        if currentLine is not None:
+            yield currentLine
+
+# The peephole optimizer run over the parse tree with '-O' (Assembler(optimize=True)) before any
+# of it is assembled, so the addresses of labels are worked out from the rewritten code. Every
+# rewrite leaves what a program does the same, as long as it refers to its code and data through
+# labels rather than fixed addresses; the code gets smaller and so does the number of
+# instructions executed. The rewrites are
+#
+#     literals narrowed  a literal source is written in the fewest bytes that hold its value,
+#                        e.g. 'add p00 0dd5' becomes 'add p00 0bx05'. Literals are sign extended
+#                        to the width of the operation, so this is only done where that width
+#                        comes from somewhere else; arithmetic and logic, alloc, mov to anything
+#                        but memory and cmp with a data-pool or register first operand.
+#     sub ap to alloc    'sub ap x' becomes 'alloc x', which is a byte shorter and sets ap and
+#                        the flags the same way.
+#     NOPs removed
+#     jumps removed      jfl and sfl to the instruction right after them, and sfl TF, which never
+#                        jumps.
+#     jumps threaded     jfl, sfl and call to a 'jfl TF' go where it jumps instead.
+#
+# An instruction is only removed when the one after it doesn't test EF, since a pending error
+# halts the machine at the next instruction which doesn't, and when no label on it is used as
+# anything but a branch target; it might be read or written as data. In an object every label is
+# exported, so no labelled instruction is removed at all. A streamed source is optimized a line at
+# a time, so it only gets the rewrites of single lines; narrowing literals and alloc.
+peepholeRewrites = ("literals narrowed", "sub ap rewritten as alloc", "NOPs removed", "jumps removed", "jumps threaded")
+narrowableOpCodes = frozenset(("add", "sub", "mul", "div", "and", "or", "nor", "xor", "mov", "alloc", "cmp"))
+registerOperands = frozenset(("wi0", "wi1", "wi2", "wi3", "pi0", "pi1", "pi2", "pi3", "ar0", "ar1", "ar2", "ar3",
+                              "ip", "sp", "ap", "wl", "flg", "rs"))
+SIMDOperands = frozenset(("wsg0", "wsg1", "psg0", "psg1"))
+branchPneumonics = frozenset(("jfl", "sfl", "call", "inth"))
+
+class PeepholeOptimizer:
+    def __init__(self, keepLabelledInstructions = False):
+        self.keepLabelledInstructions = keepLabelledInstructions
+        # The number of times each rewrite was made.
+        self.counts = dict.fromkeys(peepholeRewrites, 0)
+        # Aliases defined so far and the operands they stand for.
+        self.aliases = {}
+        self.scanningStruct = False
+
+    def optimize (self, parseTree):
+        lines = [self.rewriteLine(line) for line in parseTree]
+        while self.removeInstructions(lines, self.threadJumps(lines)):
+            pass
+        return [line for line in lines if line is not None]
+
+    def resolveAlias (self, token):
+        seen = set()
+        while token in self.aliases and token not in seen:
+            seen.add(token)
+            token = self.aliases[token]
+        return token
+
+    # What kind of operand a token is; "pool", "register", "SIMD", "literal" or None for memory and
+    # anything else.
+    def operandKind (self, token):
+        token = self.resolveAlias(token)
+        if memoryWindowAddrPattern.search(token) or parameterSpaceAddrPattern.search(token):
+            return "pool"
+        if token in registerOperands:
+            return "register"
+        if token in SIMDOperands:
+            return "SIMD"
+        if intLiteralPattern.search(token) or plainIntPattern.search(token):
+            return "literal"
+        return None
+
+    # A literal token written in the fewest bytes which hold its value, or None if it's as short
+    # as it can be.
+    def narrowLiteral (self, token):
+        token = self.resolveAlias(token)
+        if intLiteralPattern.search(token):
+            size = oper_ID.pneumonics[token[0:2]].payloadSize
+            try:
+                value = int(convertIntLiteral(token), 16)
+            except ValueError:
+                # Leave literals which don't fit for the assembler to report.
+                return None
+        elif plainIntPattern.search(token):
+            size = 2
+            value = int(token, 0) & 0xFFFF
+        else:
+            return None
+        if value >> (size * 8 - 1):
+            value -= 1 << (size * 8)
+        for narrowSize in (1, 2, 4):
+            if narrowSize < size and -(1 << (narrowSize * 8 - 1)) <= value < 1 << (narrowSize * 8 - 1):
+                return "{}x{:0{}X}".format(literalPrefixes[narrowSize], value & ((1 << (narrowSize * 8)) - 1),
+                                           narrowSize * 2)
+        return None
+
+    # Apply the rewrites of a single line. Returns the line, rewritten or not.
+    def rewriteLine (self, line):
+        if line[0] == "struct":
+            self.scanningStruct = True
+        if self.scanningStruct:
+            if line[-1][-1] == "}":
+                self.scanningStruct = False
+            return line
+        if line[0] == "alias" and len(line) >= 3 and line[1][-1] == ":":
+            self.aliases[line[1][:-1]] = line[2]
+            return line
+        if line[0] not in narrowableOpCodes:
+            return line
+
+        kinds = [self.operandKind(token) for token in line[1:]]
+        if "SIMD" in kinds:
+            return line
+        if line[0] == "sub" and len(line) == 3 and self.resolveAlias(line[1]) == "ap":
+            rewritten = SourceLine(line.lineNumber)
+            rewritten += ["alloc", line[2]]
+            self.counts["sub ap rewritten as alloc"] += 1
+            return self.rewriteLine(rewritten)
+
+        if line[0] == "cmp":
+            narrowable = len(kinds) == 2 and kinds[0] in ("pool", "register")
+        elif line[0] == "alloc":
+            narrowable = len(kinds) == 1
+        else:
+            narrowable = len(kinds) >= 2 and all(kind in ("pool", "register") for kind in kinds[:-1])
+        if not narrowable or kinds[-1] != "literal":
+            return line
+        narrowed = self.narrowLiteral(line[-1])
+        if narrowed is None:
+            return line
+        rewritten = SourceLine(line.lineNumber)
+        rewritten += line[:-1] + [narrowed]
+        self.counts["literals narrowed"] += 1
+        return rewritten
+
+    # Sort the lines into labels, instructions, data and lines which emit nothing, and find the
+    # labels and what they're used as. Returns the kinds of the lines, the index of the line of
+    # every label and the labels used as anything but branch targets.
+    def scan (self, lines):
+        kinds = [None] * len(lines)
+        labels = {}
+        dataLabels = set()
+        scanningStruct = False
+        for i, line in enumerate(lines):
+            if line is None:
+                continue
+            if line[0] == "struct":
+                scanningStruct = True
+            if scanningStruct:
+                if line[-1][-1] == "}":
+                    scanningStruct = False
+                continue
+            if line[0][0] == ":":
+                kinds[i] = "label"
+                labels[line[0][1:-1]] = i
+            elif line[0] in op_codes.pneumonics:
+                kinds[i] = "instruction"
+                if line[0] not in branchPneumonics:
+                    for token in line[1:]:
+                        dataLabels.update((token, token.lstrip("@"), token.partition("+")[2]))
+            elif line[0] == "dm":
+                kinds[i] = "data"
+                dataLabels.update(line[1:])
+        return kinds, labels, dataLabels
+
+    # The index of the first instruction or data at or after line 'i', or None at the end.
+    def nextCode (self, lines, kinds, i):
+        while i < len(lines):
+            if kinds[i] in ("instruction", "data"):
+                return i
+            i += 1
+        return None
+
+    # Point jfl, sfl and call at the end of any chain of 'jfl TF' they branch to. Returns the
+    # scan of the lines.
+    def threadJumps (self, lines):
+        kinds, labels, dataLabels = self.scan(lines)
+        for i, line in enumerate(lines):
+            if kinds[i] != "instruction" or line[0] not in ("jfl", "sfl", "call"):
+                continue
+            target = line[-1]
+            seen = {target}
+            while target in labels:
+                j = self.nextCode(lines, kinds, labels[target])
+                if j is None or kinds[j] != "instruction" or lines[j][0] != "jfl" or lines[j][1:2] != ["TF"]:
+                    break
+                if lines[j][2] in seen:
+                    break
+                target = lines[j][2]
+                seen.add(target)
+            if target != line[-1]:
+                rewritten = SourceLine(line.lineNumber)
+                rewritten += line[:-1] + [target]
+                lines[i] = rewritten
+                self.counts["jumps threaded"] += 1
+        return kinds, labels, dataLabels
+
+    # Remove NOPs and jumps which do nothing, replacing their lines with None. Returns whether any
+    # were removed.
+    def removeInstructions (self, lines, scan):
+        kinds, labels, dataLabels = scan
+        removed = False
+        attachedLabels = []
+        for i, line in enumerate(lines):
+            if kinds[i] == "label":
+                attachedLabels.append(line[0][1:-1])
+                continue
+            if kinds[i] is None:
+                continue
+            if kinds[i] == "instruction":
+                j = self.nextCode(lines, kinds, i + 1)
+                rewrite = None
+                if line[0] == "NOP":
+                    rewrite = "NOPs removed"
+                elif line[0] in ("jfl", "sfl") and len(line) == 3 and line[1] != "EF":
+                    if line[0] == "sfl" and line[1] == "TF":
+                        rewrite = "jumps removed"
+                    elif line[2] in labels and labels[line[2]] > i and self.nextCode(lines, kinds, labels[line[2]]) == j:
+                        rewrite = "jumps removed"
+                if (rewrite is not None and j is not None and kinds[j] == "instruction"
+                        and not (lines[j][0] in ("jfl", "sfl") and lines[j][1:2] == ["EF"])
+                        and not (attachedLabels and self.keepLabelledInstructions)
+                        and not dataLabels.intersection(attachedLabels)):
+                    lines[i] = None
+                    kinds[i] = None
+                    self.counts[rewrite] += 1
+                    removed = True
+                    continue
+            attachedLabels = []
+        return removed
+
 class Instruction:
     def __init__(self, opCode, basicSize, assembleFunc):
         self.opCode = opCode
@@ -387,9 +1089,10 @@ class Instruction:
         self.assembleFunc = assembleFunc
 
     # A wrapper for the assemble function which passes the instructions basic information along
-    # with a line of code from the parse tree and the optional address parameter.
-    def assembleInstruction (self, line):
-        return self.assembleFunc(line, self.opCode, self.basicSize)
+    # with the assembler, a line of code from the parse tree and the emitter the instruction is
+    # written to.
+    def assembleInstruction (self, assembler, line, emitter):
+        return self.assembleFunc(assembler, line, self.opCode, self.basicSize, emitter)
 
 def unParse (line):
     result = ""
@@ -398,141 +1101,122 @@ def unParse (line):
 
     return result.strip()
 
-def parseOperand (token):
-    isNonDataPool = False
-    payload = ""; hasPayload = False
-    payloadSize = 0
-    # Parse the first operand, determine whether it's data-pool or non-data-pool, set its
-    # operand type bit accordingly, and get the appropriate operand ID and payload.
-    operandField = ""
-    if memoryWindowAddrPattern.search(token):
-        operandField = ("00" + hex(int(token[1:], 16))[2:])[-2:]
-
-    elif parameterSpaceAddrPattern.search(token):
-        operandField = int(token[1:], 16) + 128
-        operandField = ("00" + hex(operandField)[2:])[-2:]
-
-    elif intLiteralPattern.search(token):
-        operObject = oper_ID.pneumonics[token[0:2]]
-        payloadSize = operObject.payloadSize
-        payload = convertIntLiteral(token)
-        hasPayload = True
-        isNonDataPool = True
-        operandField = ("00" + hex(operObject.operandID)[2:])[-2:]
-
-    elif charLiteralPattern.search(token):
-        operObject = oper_ID.pneumonics["0b"]
-        payload = ("00" + hex(ord(token[1])[2:]))[-2:]
-        payloadSize = 1
-        hasPayload = True
-        isNonDataPool = True
-        operandField = ("00" + hex(operObject.operandID)[2:])[-2:]
-
-    elif token in labelsAliasesAndStructMembers:
-        valType = labelsAliasesAndStructMembers[token][0]
-        isNonDataPool = True
-        if valType == "a":
-            hasPayload = True
-            isNonDataPool = True
-            payload = labelsAliasesAndStructMembers[token][1:]
-            payloadSize = oper_ID.pneumonics["@"].payloadSize
-            operandField = ("00" + hex(oper_ID.pneumonics["@"].operandID)[2:])[-2:]
-
-        elif valType == "l":
-            hasPayload = True
-            isNonDataPool = True
-            payload = labelsAliasesAndStructMembers[token][1:]
-            if len(payload) == 2:
-                operandField = ("00" + hex(oper_ID.pneumonics["0b"].operandID)[2:])[-2:]
-                payloadSize = oper_ID.pneumonics["0b"].payloadSize
-            elif len(payload) == 4:
-                operandField = ("00" + hex(oper_ID.pneumonics["0w"].operandID)[2:])[-2:]
-                payloadSize = oper_ID.pneumonics["0w"].payloadSize
-            elif len(payload) == 8:
-                operandField = ("00" + hex(oper_ID.pneumonics["0d"].operandID)[2:])[-2:]
-                payloadSize = oper_ID.pneumonics["0d"].payloadSize
-            elif len(payload) == 16:
-                operandField = ("00" + hex(oper_ID.pneumonics["0q"].operandID)[2:])[-2:]
-                payloadSize = oper_ID.pneumonics["0q"].payloadSize
-
-        elif valType == "d":
-            operandField = labelsAliasesAndStructMembers[token][1:]
-
-    elif regOffsetPattern.search(token):
-        isNonDataPool = True
-        hasPayload = True
-        opPneumonicEndPos = token.find("+") + 1
-        opPneumonic = token[0: opPneumonicEndPos]
-        operandField = ("00" + hex(oper_ID.pneumonics[opPneumonic].operandID)[2:])[-2:]
-        payloadSize = oper_ID.pneumonics[opPneumonic].payloadSize
-        offset = token[opPneumonicEndPos:]
-        if offset[0] == "x":
-            try:
-                payload = ("0000" + hex(int(offset[1:], 16))[2:])[-4:]
-            except ValueError:
-                print("Syntax error: Named values to be used as register offsets cannot begin")
-                print("with a lowercase 'x' as in the name '{}'.".format(offset))
-                exit()
-
-        elif offset[0] in "0123456789":
-            try:
-                payload = ("0000" + hex(int(offset, 16))[2:])[-4:]
-            except ValueError:
-                print("Syntax error: Invalid integer literal or invalid name {}.".format(offset))
-                exit()
-        else:
-            payload = ":" + offset + ":"
-
-    elif regValAddrPattern.search(token):
-        isNonDataPool = True
-        operandField = ("00" + hex(oper_ID.pneumonics[token].operandID)[2:])[-2:]
-
-    elif token in oper_ID.pneumonics:
-        isNonDataPool = True
-        operandField = ("00" + hex(oper_ID.pneumonics[token].operandID)[2:])[-2:]
-
+def checkOperandCount (line, count):
+    if len(line) - 1 != count:
+        raise AssemblyError("Syntax", line.lineNumber, "'{}' takes {} operand{} but {} were given.".format(
+            line[0], count, "" if count == 1 else "s", len(line) - 1))
+
+# Assemble instructions which consist of an op-code, operand type bits and operand fields followed
+# by their payloads in operand order. Operand type bits are assigned to the operands from the most
+# significant bit down, so the first operand's type bit is 0b100. Only in and out, whose two
+# operands are both sources that may be literals, can have more than one payload.
+def assembleStandardOperands (assembler, line, opCode, emitter, operandTokens, destinationCount):
+    lineNumber = line.lineNumber
+    operandTypeBits = 0
+    operandFields = []
+    payloads = []
+    for i, token in enumerate(operandTokens):
+        isNonDataPool, operandField, payload, payloadSize = assembler.parseOperand(token, lineNumber)
+        if isNonDataPool:
+            operandTypeBits |= 0b100 >> i
+            if i < destinationCount and operandField in literalOperandIDs:
+                raise AssemblyError("Syntax", lineNumber, "Literals cannot be destination operands.")
+        if payload is not None:
+            payloads.append((payload, payloadSize))
+        operandFields.append(operandField)
+
+    if len(payloads) > 1 and opCode not in (op_codes.iIn, op_codes.iOut):
+        raise AssemblyError("Syntax", lineNumber, "Only one operand of an instruction can have a payload;\n"
+                            "a literal, an address or a register offset.")
+
+    start = emitter.position
+    emitter.emitByte((opCode << 3) | operandTypeBits, lineNumber)
+    emitter.emitBytes(bytes(operandFields), lineNumber)
+    for payload, payloadSize in payloads:
+        emitter.emitPayload(payload, payloadSize, lineNumber)
+    return emitter.position - start
+
+# These functions are attached to instances of Instruction. They accept the assembler in their
+# first argument, the current line in the second, the op-code of the instruction they're
+# assembling in the third, their size sans payload in the fourth and the emitter to write the
+# machine code to in the fifth. They return the size of the assembled instruction in bytes.
+# Names which haven't been defined yet are recorded by the emitter. There are many instructions
+# in the instruction set which can be assembled in the same manner, though they perform
+# different operations so, only these 9 functions are necessary.
+
+# exit and ret: the op-code followed by an 8-bit code.
+def iOneByteFunc (assembler, line, opCode, basicSize, emitter):
+    if opCode == op_codes.iRet and len(line) == 1:
+        code = 0
     else:
-        isNonDataPool = True
-        hasPayload = True
-        payload = ":" + token + ":"
-        payloadSize = 2
-        operandField = ("00" + hex(oper_ID.pneumonics["@"].operandID)[2:])[-2:]
-
-    return isNonDataPool, hasPayload, operandField, payload, payloadSize
-
-# These functions are attached to instances of Instruction. They accept the current line in
-# their first argument, the op-code of the instruction they're assembling in the second, and
-# their size sans payload in the third. They return a tuple with the instruction assembled into
-# hex-code with named values marked by colons and the beginning and end at index 0 and the size
-# of the instruction in bytes at index 1. There are many instructions in the instruction set
-# which can be assembled in the same manner, though they perform different operations so, only
-# these 9 functions are necessary.
-def iOneByteFunc (line, opCode, basicSize):
-    pass
-
-def iTwoStandardOperandsFunc (line, opCode, basicSize):
-    pass
-
-def iIgnFunc (line, opCode, basicSize):
-    pass
-
-def iModeFunc (line, opCode, basicSize):
-    pass
-
-def iOneStandardOperandFunc (line, opCode, basicSize):
-    pass
-
-def iCmpFunc (line, opCode, basicSize):
-    pass
-
-def iBranchFunc (line, opCode, basicSize):
-    pass
-
-def iOneWordFunc (line, opCode, basicSize):
-    pass
-
-def iNOPFunc (line, opCode, basicSize):
-    pass
+        checkOperandCount(line, 1)
+        code = assembler.parseConstant(line[1], line.lineNumber)
+    emitter.emitByte(opCode << 3, line.lineNumber)
+    emitter.emitByte(code, line.lineNumber)
+    return basicSize
+
+# Instructions with one destination and one source field, or two destinations and a source in the
+# case of mul and div. in and out take two source fields.
+def iTwoStandardOperandsFunc (assembler, line, opCode, basicSize, emitter):
+    operandCount = basicSize - 1
+    checkOperandCount(line, operandCount)
+    destinationCount = 0 if opCode in (op_codes.iIn, op_codes.iOut) else operandCount - 1
+    return assembleStandardOperands(assembler, line, opCode, emitter, line[1:], destinationCount)
+
+# ign: the response flag is set to the value in the operand type bits. Without an operand, the
+# response flag is unset and errors are ignored.
+def iIgnFunc (assembler, line, opCode, basicSize, emitter):
+    value = 0
+    if len(line) > 1:
+        checkOperandCount(line, 1)
+        value = assembler.parseConstant(line[1], line.lineNumber)
+    emitter.emitByte((opCode << 3) | (value & 0b111), line.lineNumber)
+    return basicSize
+
+# mode: either a single constant with the mode byte or a number type followed by a word size,
+# e.g. 'mode sInt qword'.
+def iModeFunc (assembler, line, opCode, basicSize, emitter):
+    if len(line) == 3 and line[1].lower() in numberModes and line[2].lower() in wordLengthModes:
+        modeByte = numberModes[line[1].lower()] | wordLengthModes[line[2].lower()]
+    else:
+        checkOperandCount(line, 1)
+        modeByte = assembler.parseConstant(line[1], line.lineNumber)
+    emitter.emitByte(opCode << 3, line.lineNumber)
+    emitter.emitByte(modeByte, line.lineNumber)
+    return basicSize
+
+# Instructions with a single operand field. For not, the operand is a destination.
+def iOneStandardOperandFunc (assembler, line, opCode, basicSize, emitter):
+    checkOperandCount(line, 1)
+    destinationCount = 1 if opCode == op_codes.iNot else 0
+    return assembleStandardOperands(assembler, line, opCode, emitter, line[1:], destinationCount)
+
+# cmp has two source fields, so either of them can be a literal.
+def iCmpFunc (assembler, line, opCode, basicSize, emitter):
+    checkOperandCount(line, 2)
+    return assembleStandardOperands(assembler, line, opCode, emitter, line[1:], 0)
+
+# jfl and sfl: the conditional branch ID of the flag goes in the operand type bits and the
+# address follows.
+def iBranchFunc (assembler, line, opCode, basicSize, emitter):
+    checkOperandCount(line, 2)
+    if line[1] not in conditionalBranchIDs:
+        raise AssemblyError("Syntax", line.lineNumber, "'{}' is not a flag a conditional branch can test.".format(line[1]))
+    emitter.emitByte((opCode << 3) | conditionalBranchIDs[line[1]], line.lineNumber)
+    assembler.emitAddress(line[2], line.lineNumber, emitter)
+    return basicSize
+
+# call and inth: the op-code followed by a 16-bit address.
+def iOneWordFunc (assembler, line, opCode, basicSize, emitter):
+    checkOperandCount(line, 1)
+    emitter.emitByte(opCode << 3, line.lineNumber)
+    assembler.emitAddress(line[1], line.lineNumber, emitter)
+    return basicSize
+
+def iNOPFunc (assembler, line, opCode, basicSize, emitter):
+    checkOperandCount(line, 0)
+    emitter.emitByte(opCode << 3, line.lineNumber)
+    return basicSize
 
 # This class is a name-space for global constants. All the basic information about each
 # instruction in the instruction set is listed here.
@@ -550,7 +1234,7 @@ class op_codes:
 
     iNOP = 0x1A
 
-    pneumonics = {"exit":Instruction(iExit, 2, iOneByteFunc),
+    pneumonics = types.MappingProxyType({"exit":Instruction(iExit, 2, iOneByteFunc),
                   "add":Instruction(iAdd, 3, iTwoStandardOperandsFunc),
                   "sub":Instruction(iSub, 3, iTwoStandardOperandsFunc),
                   "mul":Instruction(iMul, 4, iTwoStandardOperandsFunc),
@@ -562,7 +1246,7 @@ class op_codes:
                   "nor":Instruction(iNor, 3, iTwoStandardOperandsFunc),
                   "xor":Instruction(iXor, 3, iTwoStandardOperandsFunc),
                   "not":Instruction(iNot, 2, iOneStandardOperandFunc),
-                  "cmp":Instruction(iCmp, 3, iTwoStandardOperandsFunc),
+                  "cmp":Instruction(iCmp, 3, iCmpFunc),
                   "jfl":Instruction(iJfl, 3, iBranchFunc),
                   "sfl":Instruction(iSfl, 3, iBranchFunc),
                   "call":Instruction(iCall, 3, iOneWordFunc),
@@ -570,13 +1254,13 @@ class op_codes:
                   "mov":Instruction(iMov, 3, iTwoStandardOperandsFunc),
                   "mw":Instruction(iMw, 2, iOneStandardOperandFunc),
                   "alloc":Instruction(iAlloc, 2, iOneStandardOperandFunc),
-                  "IOchan":Instruction(iIOchan, 3, iOneStandardOperandFunc),
+                  "IOchan":Instruction(iIOchan, 2, iOneStandardOperandFunc),
                   "in":Instruction(iIn, 3, iTwoStandardOperandsFunc),
                   "out":Instruction(iOut, 3, iTwoStandardOperandsFunc),
                   "outs":Instruction(iOuts, 2, iOneStandardOperandFunc),
                   "seek":Instruction(iSeek, 2, iOneStandardOperandFunc),
                   "inth":Instruction(iInth, 3, iOneWordFunc),
-                  "NOP":Instruction(iNOP, 1, iNOPFunc)}
+                  "NOP":Instruction(iNOP, 1, iNOPFunc)})
 
 class Operand:
 
@@ -600,7 +1284,7 @@ class oper_ID:
     ar0Offset = 0x1C; ar1Offset = 0x1D; ar2Offset = 0x1E; ar3Offset = 0x1F
     atAr0 = 0x20; atAr1 = 0x21; atAr2 = 0x22; atAr3 = 0x23
 
-    ip = 0x25
+    ip = 0x24
     sp = 0x25; spOffset = 0x26; atSp = 0x27
     ap = 0x28; apOffset = 0x29; atAp = 0x2A
     wl = 0x2B; wlOffset = 0x2C; atWl = 0x2D
@@ -609,13 +1293,13 @@ class oper_ID:
 
     lit8 = 0x30; lit16 = 0x31; litAddr = 0x32; lit32 = 0x33; lit64 = 0x34
 
-    ZF = 0x35; SF = 0x36; OF = 0x37; NOF = 0x38; TF = 0x39; EF = 0x3A; DZF = 0x3B; RF = 0x3E
+    ZF = 0x35; SF = 0x36; OF = 0x37; NOF = 0x38; TF = 0x39; EF = 0x3A; DZF = 0x3B; RF = 0x3C
     SEF = 0x3D; FMF = 0x3E; WLB = 0x3F
 
     wsg0 = 0x40; wsg1 = 0x41
     psg0 = 0x42; psg1 = 0x43
 
-    pneumonics = {
+    pneumonics = types.MappingProxyType({
         "0b": Operand(lit8, 1),
         "0w": Operand(lit16, 2),
         "@": Operand(litAddr, 2),
@@ -633,6 +1317,7 @@ class oper_ID:
         "ar1": Operand(ar1, 0),
         "ar2": Operand(ar2, 0),
         "ar3": Operand(ar3, 0),
+        "ip": Operand(ip, 0),
         "sp": Operand(sp, 0),
         "ap": Operand(ap, 0),
         "wl": Operand(wl, 0),
@@ -683,7 +1368,27 @@ class oper_ID:
         "wsg1": Operand(wsg1, 0),
         "psg0": Operand(psg0, 0),
         "psg1": Operand(psg1, 0)
-    }
+    })
+
+# The literal prefixes of the operands of each literal size.
+literalPrefixes = {1: "0b", 2: "0w", 4: "0d", 8: "0q"}
+
+# The size in bytes and the name of the word length of each integer literal, by the letter after the 0.
+literalWordLengths = {"b": (1, "byte"), "w": (2, "word"), "d": (4, "dword"), "q": (8, "qword")}
+
+# The most operand tokens an Assembler keeps in its operand cache.
+operandCacheSize = 4096
+
+# Operand IDs of literals, which can't be destination operands.
+literalOperandIDs = (oper_ID.lit8, oper_ID.lit16, oper_ID.lit32, oper_ID.lit64)
+
+# The flags a conditional branch can test, and the IDs stored in the branch's operand type bits.
+conditionalBranchIDs = {"ZF": 0, "SF": 1, "OF": 2, "NOF": 3, "TF": 4, "EF": 5, "DZF": 6, "RF": 7}
+
+# Names accepted by the mode instruction. The number type goes in the upper 4 bits of the mode
+# byte and the word length in the lower 4.
+numberModes = {"sint": 0x00, "signedint": 0x00, "int": 0x00, "float": 0x10, "fp": 0x10, "floatingpoint": 0x10}
+wordLengthModes = {"byte": 0, "word": 1, "dword": 2, "qword": 3}
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,100 @@
+# Compares the NumPy implementation of SIMD operations with the one that works on one word at a
+# time, on a few SIMD heavy kernels. Both must leave the machine in the same state.
+#
+# usage: python SIMDBenchmark.py [loop iterations per kernel]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+# Every kernel runs its loop body 'iterations' times, counting in ar0. The {mode} in a kernel is
+# replaced with the number mode and word length it is run in.
+kernelLoop = """
+:main:
+    mode    {mode}
+    mov     ar0     0wd0
+    mov     wsg0    0bd3
+    mov     wsg1    table
+:loop:
+{body}
+    add     ar0     0wd1
+    cmp     ar0     0wd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+:table:
+    dm {table}
+"""
+
+kernels = {
+    "arithmetic": """
+    add     wsg0    wsg1
+    sub     psg0    wsg0
+    add     psg1    0bd7
+    sub     wsg1    psg1
+""",
+    "logic": """
+    xor     wsg0    wsg1
+    and     psg0    wsg0
+    or      psg1    psg0
+    nor     wsg1    psg1
+    not     wsg0
+""",
+    "multiply": """
+    mul     psg0    psg0    wsg1
+    mul     psg1    wsg0    wsg1
+    add     wsg0    0bd1
+""",
+    "memory": """
+    add     wsg0    table
+    mov     psg0    table
+    sub     psg0    wsg0
+    mov     psg1    psg0
+""",
+}
+
+modes = ["sInt byte", "sInt word", "sInt dword", "sInt qword", "float dword", "float qword"]
+
+# The bytes of the table the kernels operate on, as the operands of a dm directive.
+def tableSource ():
+    return " ".join("0bd{}".format((i * 5 + 1) % 256) for i in range(uaEmulator.SIMDGroupSize))
+
+def buildKernel (body, mode, iterations):
+    sourceCode = kernelLoop.format(mode=mode, body=body, iterations=iterations, table=tableSource())
+    program = uaAssembler.assemble(sourceCode)
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], 0)
+
+def timeKernel (image, implementation):
+    uaEmulator.executeSIMD = implementation
+    machine = uaEmulator.Machine()
+    machine.loadProgram(image)
+    start = time.perf_counter()
+    machine.run()
+    return time.perf_counter() - start, machine
+
+def main ():
+    if uaEmulator.numpy is None:
+        print("NumPy isn't installed, so there is nothing to compare.")
+        exit()
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    print("instructions per second")
+    print("{:<12}{:<14}{:>14}{:>14}{:>10}".format("kernel", "mode", "per word", "NumPy", "speedup"))
+    for name, body in kernels.items():
+        for mode in modes:
+            image = buildKernel(body, mode, iterations)
+            laneTime, laneMachine = timeKernel(image, uaEmulator.executeSIMDLanes)
+            vectorTime, vectorMachine = timeKernel(image, uaEmulator.executeSIMDVectorized)
+            if (laneMachine.dataPool != vectorMachine.dataPool or laneMachine.exitCode != vectorMachine.exitCode
+                    or laneMachine.flg != vectorMachine.flg):
+                print("The two SIMD implementations disagree on the {} kernel in {} mode.".format(name, mode))
+                exit()
+            count = laneMachine.instructionCount
+            print("{:<12}{:<14}{:>12,.0f}/s{:>12,.0f}/s{:>9.1f}x".format(
+                name, mode, count / laneTime, count / vectorTime, laneTime / vectorTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Measures the throughput of the assembler on generated sources. Each phase of assembly is timed
+# on its own, in lines and bytes of source per second, and its peak memory use is measured in a
+# separate run under tracemalloc so that tracing doesn't slow down the timed runs. The phases are
+#
+#     parse       parse(); splitting the source code into the parse tree
+#     pass one    Assembler.assembleParseTree(); assembling every line and defining names
+#     resolution  Assembler.resolveReferences(); patching in the values of names
+#     emission    Emitter.getProgram() and uaImage.packImage(); producing the binary image
+#
+# The results can be written as JSON and compared with the results of an earlier run, which
+# prints the change of every phase so that regressions show up.
+#
+# usage: python assemblerBenchmark.py [-u units] [-r repeats] [-j results.json] [-c baseline.json]
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaImage
+
+resultsFormatVersion = 1
+
+# One unit of generated source; a struct, aliases of every kind, a routine using every form of
+# operand parseOperand handles with forward references to its own labels and the next routine,
+# and defined memory with a string and a table of integers of every width.
+unitTemplate = """
+// Routine {i}
+struct s{i} {{
+    x: 0
+    y: 2
+    flags: 4
+    size: 6}}
+alias a{i}_count: p{countAddress:02X}
+alias a{i}_window: w{windowAddress:02X}
+alias a{i}_reg: ar{register}
+alias a{i}_limit: 0wd{limit}
+alias a{i}_char: '{char}'
+
+:r{i}:
+    alloc   0bx10
+    mw      @ap
+    mode    sInt    word
+    mov     a{i}_count      a{i}_limit
+    mov     a{i}_window     0bd{byte}
+    add     p{pool0:02X}     0wx{word:04X}
+    sub     p{pool1:02X}     0dd{dword}
+    xor     p{pool2:02X}     0qx{qword:016X}
+    or      p{pool0:02X}     a{i}_char
+    mov     a{i}_reg        ap
+    mov     @ap+{offset}       p{pool1:02X}
+    mov     p{pool2:02X}     @ar{register}+0x{hexOffset:X}
+    mov     @wl+s{i}.y      p{pool0:02X}
+    mov     p{pool1:02X}     @ar{register}
+    cmp     a{i}_count      0wd0
+    sfl     ZF      r{i}_skip
+    call    {callee}
+    jfl     EF      r{i}_error
+:r{i}_skip:
+    and     wsg0    wsg1
+    add     psg0    0bd1
+    mul     p20     p22     p24
+    div     p20     p22     0wd3
+    not     p26
+    outs    r{i}_message
+    out     r{i}_table      r{i}_end
+    ign     1
+    NOP
+    ret     0bx00
+:r{i}_error:
+    ret     0bx{code:02X}
+:r{i}_message:
+    dm "Routine {i} reporting, with a message long enough to be realistic.\\n" 0bx00
+:r{i}_table:
+    dm 0bx{byte:02X} 0wx{word:04X} 0dd{dword} 0qx{qword:016X} '{char}' a{i}_limit r{i}
+    dm "\\t{i}" 0bx00 0bx01 0bx02 0bx03 0wd{limit} 0wd{word} 0dd{limit} 0dd{dword}
+:r{i}_end:
+"""
+
+# Generate a program of 'units' units. The same units and seed always give the same source.
+def generateSource (units, seed = 0):
+    rng = random.Random(seed)
+    parts = [":main:\n    call    r0\n    exit    0bx01\n"]
+    for i in range(units):
+        parts.append(unitTemplate.format(
+            i=i, callee="r{}".format(i + 1) if i + 1 < units else "main",
+            countAddress=rng.randrange(0x28, 0x80), windowAddress=rng.randrange(0x00, 0x80),
+            register=rng.randrange(4), limit=rng.randrange(1, 1000), char=rng.choice("abcxyz"),
+            byte=rng.randrange(128), word=rng.randrange(0x10000), dword=rng.randrange(1 << 31),
+            qword=rng.getrandbits(64), pool0=rng.randrange(0x28, 0x80), pool1=rng.randrange(0x28, 0x80),
+            pool2=rng.randrange(0x28, 0x80), offset=rng.randrange(0, 120), hexOffset=rng.randrange(0, 0x100),
+            code=rng.randrange(2, 0x100)))
+    return "".join(parts)
+
+# Run every phase once. Returns the time each phase took, in the order of 'phases'.
+def runPhases (sourceCode):
+    times = []
+    start = time.perf_counter()
+    parseTree = uaAssembler.parse(sourceCode)
+    times.append(time.perf_counter() - start)
+
+    assembler = uaAssembler.Assembler()
+    start = time.perf_counter()
+    emitter = assembler.assembleParseTree(parseTree)
+    times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    assembler.resolveReferences(emitter)
+    times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    program = emitter.getProgram()
+    uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    times.append(time.perf_counter() - start)
+    return times
+
+# Run every phase once under tracemalloc. Returns the peak memory allocated during each phase,
+# over what was allocated before it started.
+def measurePeakMemory (sourceCode):
+    peaks = []
+    tracemalloc.start()
+    try:
+        def phase (function):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            result = function()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+            return result
+
+        assembler = uaAssembler.Assembler()
+        parseTree = phase(lambda: uaAssembler.parse(sourceCode))
+        emitter = phase(lambda: assembler.assembleParseTree(parseTree))
+        phase(lambda: assembler.resolveReferences(emitter))
+        phase(lambda: uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, emitter.getProgram())],
+                                        assembler.entryPoint()))
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+phases = ("parse", "pass one", "resolution", "emission")
+
+def benchmark (units, repeats, seed):
+    sourceCode = generateSource(units, seed)
+    lineCount = sourceCode.count("\n")
+    sourceBytes = len(sourceCode.encode())
+
+    best = None
+    for _ in range(repeats):
+        times = runPhases(sourceCode)
+        best = times if best is None else [min(a, b) for a, b in zip(best, times)]
+    peaks = measurePeakMemory(sourceCode)
+
+    results = {
+        "formatVersion": resultsFormatVersion,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"units": units, "repeats": repeats, "seed": seed},
+        "source": {"lines": lineCount, "bytes": sourceBytes,
+                   "programBytes": len(uaAssembler.Assembler().assemble(sourceCode))},
+        "phases": {},
+    }
+    for name, seconds, peak in zip(phases, best, peaks):
+        results["phases"][name] = {"seconds": seconds, "linesPerSecond": lineCount / seconds,
+                                   "bytesPerSecond": sourceBytes / seconds, "peakMemoryBytes": peak}
+    total = sum(best)
+    results["phases"]["total"] = {"seconds": total, "linesPerSecond": lineCount / total,
+                                  "bytesPerSecond": sourceBytes / total, "peakMemoryBytes": max(peaks)}
+    return results
+
+def printResults (results, baseline = None):
+    source = results["source"]
+    print("{} lines, {} bytes of source, {} bytes of machine code".format(
+        source["lines"], source["bytes"], source["programBytes"]))
+    print("{:<12}{:>12}{:>16}{:>16}{:>14}{:>10}".format(
+        "phase", "seconds", "lines/s", "bytes/s", "peak memory", "change"))
+    for name, phase in results["phases"].items():
+        change = ""
+        if baseline is not None and name in baseline["phases"]:
+            change = "{:+.1f}%".format((phase["seconds"] / baseline["phases"][name]["seconds"] - 1) * 100)
+        print("{:<12}{:>12.4f}{:>16,.0f}{:>16,.0f}{:>12,.0f} B{:>10}".format(
+            name, phase["seconds"], phase["linesPerSecond"], phase["bytesPerSecond"], phase["peakMemoryBytes"], change))
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Benchmark the assembler on generated sources.")
+    argParser.add_argument("-u", "--units", type=int, default=250,
+                           help="number of routines to generate; about 50 lines each (default: 250)")
+    argParser.add_argument("-r", "--repeats", type=int, default=5, help="take the best of this many runs (default: 5)")
+    argParser.add_argument("-s", "--seed", type=int, default=0, help="seed of the source generator")
+    argParser.add_argument("-j", "--json", help="write the results to this file")
+    argParser.add_argument("-c", "--compare", help="compare with the results in this file")
+    argParser.add_argument("--write-source", help="write the generated source to this file")
+    args = argParser.parse_args()
+
+    if args.write_source:
+        with open(args.write_source, "w") as f:
+            f.write(generateSource(args.units, args.seed))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("formatVersion") != resultsFormatVersion:
+            print("{} was written by an incompatible version of this benchmark.".format(args.compare))
+            exit()
+        if baseline["config"] != {"units": args.units, "repeats": args.repeats, "seed": args.seed}:
+            print("Warning: {} was measured with different settings: {}".format(args.compare, baseline["config"]))
+
+    results = benchmark(args.units, args.repeats, args.seed)
+    printResults(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# Runs a suite of UA programs covering the instruction set on every execution engine, checks that
+# each leaves the machine in the state the specification says it should, and measures how fast
+# each engine runs them. The programs are integer loops in each word length, recursion heavy on
+# call and ret, streaming memory through the window with mw, SIMD group arithmetic, string
+# output with outs and one program for every exit code of the specification's exit table.
+#
+# Every program has its expected exit code, console output and number of instructions executed,
+# and the expected values of some registers, data-pool and memory locations, written the way
+# the debugger's watchpoints are (see uaDebugger.parseWatchpoint); a register name, w00-w7F or
+# p00-p7F, or a memory address or label, followed by ':' and a number of bytes. On top of that
+# all engines must leave the machine in exactly the same state. Any difference fails the run.
+#
+# The results, instructions, seconds and MIPS of every program on every engine, can be written as
+# JSON and compared with an earlier run, which prints the change of every program and engine so
+# that regressions show up.
+#
+# usage: python conformanceBenchmark.py [-r repeats] [-j results.json] [-c baseline.json]
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaDebugger
+import uaEmulator
+import uaImage
+
+resultsFormatVersion = 1
+
+# Add a step to p00 every iteration, keep the xor of its values in p08, subtract them from p10 and
+# add up p08 in p18. ign lets the signed overflows go.
+integerLoop = """
+:main:
+    ign
+    mode    sInt    {length}
+    mov     ar1     0wd0
+:loop:
+    add     p00     {step}
+    xor     p08     p00
+    sub     p10     p00
+    add     p18     p08
+    add     ar1     0wd1
+    cmp     ar1     0wd10000
+    sfl     ZF      loop
+    not     p18
+    exit    0bx01
+"""
+
+# fib(20) by recursion; every call saves its argument on its stack frame and the leaves add their
+# argument, 0 or 1, to p04.
+recursion = """
+:main:
+    mode    sInt    dword
+    mov     p00     0dd20
+    call    fib
+    exit    0bx01
+:fib:
+    cmp     p00     0dd2
+    jfl     SF      leaf
+    alloc   0wd4
+    mov     @ap     p00
+    sub     p00     0dd1
+    call    fib
+    mov     p00     @ap
+    sub     p00     0dd2
+    call    fib
+    ret     0bx00
+:leaf:
+    add     p04     p00
+    ret     0bx00
+"""
+
+# Fill 0x1000-0x4FFF window by window with a count going up by 3 a window, then add it all back up
+# into the parameter space, 64 bytes at a time; seven times over.
+streaming = """
+:main:
+    mode    sInt    byte
+    mov     ar2     0wd0
+:pass:
+    mw      0wx1000
+    mov     ar0     0wd0
+:fill:
+    add     psg0    0bd3
+    mov     wsg0    psg0
+    mov     wsg1    psg0
+    mw      wl+128
+    add     ar0     0wd1
+    cmp     ar0     0wd128
+    sfl     ZF      fill
+    mw      0wx1000
+    mov     ar0     0wd0
+:sum:
+    add     psg1    wsg0
+    add     psg1    wsg1
+    xor     psg1    0bx5A
+    mw      wl+128
+    add     ar0     0wd1
+    cmp     ar0     0wd128
+    sfl     ZF      sum
+    add     ar2     0wd1
+    cmp     ar2     0wd7
+    sfl     ZF      pass
+    exit    0bx01
+"""
+
+# The 32 words 1 to 32 are added to wsg0 every iteration, the running sums subtracted from psg0
+# and 3 added to every word of psg1. The window is moved off the program first.
+SIMDArithmetic = """
+:main:
+    mode    sInt    word
+    mw      0wx2000
+    mov     wsg1    table
+    mov     ar0     0wd0
+:loop:
+    add     wsg0    wsg1
+    sub     psg0    wsg0
+    add     psg1    0wd3
+    add     ar0     0wd1
+    cmp     ar0     0wd6000
+    sfl     ZF      loop
+    exit    0bx01
+:table:
+    dm {table}
+"""
+
+# Print the numbers 1 to 2000 in decimal, one a line. The digits are written backwards from
+# 0x3008, where a line feed and the terminating null are.
+stringOutput = """
+:main:
+    mode    sInt    word
+    mov     ar1     0x3008
+    mov     @ar1    0bx0A
+    mov     p00     0wd0
+:loop:
+    add     p00     0wd1
+    mov     p02     p00
+    mov     ar0     0x3008
+:digit:
+    div     p04     p02     0wd10
+    add     p04     0wd48
+    sub     ar0     0wd1
+    mode    sInt    byte
+    mov     @ar0    p05
+    mode    sInt    word
+    cmp     p02     0wd0
+    sfl     ZF      digit
+    outs    ar0
+    cmp     p00     0wd2000
+    sfl     ZF      loop
+    exit    0bx01
+"""
+
+# An instruction whose destination is a literal, which the assembler won't write: 'mov 0bx01 0bx02'.
+invalidInstruction = "dm 0bx{:02X} 0bx{:02X} 0bx{:02X} 0bx01 0bx02".format(
+    (uaAssembler.op_codes.iMov << 3) | 0b110, uaAssembler.oper_ID.lit8, uaAssembler.oper_ID.lit8)
+
+programs = {
+    "integer byte": {
+        "source": integerLoop.format(length="byte", step="0bx25"), "exitCode": 0x01, "instructions": 70005,
+        "state": {"p00:1": "50", "p08:1": "50", "p10:1": "D8", "p18:1": "8F", "ar1": 10000}},
+    "integer word": {
+        "source": integerLoop.format(length="word", step="0wx1234"), "exitCode": 0x01, "instructions": 70005,
+        "state": {"p00:2": "0F40", "p08:2": "0340", "p10:2": "9E60", "p18:2": "EE3F", "ar1": 10000}},
+    "integer dword": {
+        "source": integerLoop.format(length="dword", step="0dx12345679"), "exitCode": 0x01,
+        "instructions": 70005,
+        "state": {"p00:4": "1C71D690", "p08:4": "937C3750", "p10:4": "E2606838", "p18:4": "C01B38CF"}},
+    "integer qword": {
+        "source": integerLoop.format(length="qword", step="0qx0123456789ABCDEF"), "exitCode": 0x01,
+        "instructions": 70005,
+        "state": {"p00:8": "71C71C71C71C47F0", "p08:8": "093783BED8038F00", "p10:8": "8E38E38E3C14D488",
+                  "p18:8": "C403A419C6FCC5BF"}},
+    "recursion": {
+        "source": recursion, "exitCode": 0x01, "instructions": 153238,
+        "state": {"p04:4": "00001A6D", "p00:4": "00000000", "ap": 0, "sp": 0, "rs": 0}},
+    "mw streaming": {
+        "source": streaming, "exitCode": 0x01, "instructions": 12596,
+        "state": {"wl": 0x5000, "0x1000:2": "0303", "0x1080:1": "06", "0x4F80:2": "8080", "p00:1": "80",
+                  "p40:1": "80", "p7F:1": "80", "ar2": 7}},
+    "SIMD arithmetic": {
+        "source": SIMDArithmetic.format(table=" ".join("0wd{}".format(i) for i in range(1, 33))),
+        "exitCode": 0x01, "instructions": 36005,
+        "state": {"w00:6": "17702EE04650", "w40:4": "00010002", "p00:4": "4BC89790", "p7E:2": "4650"}},
+    "string output": {
+        "source": stringOutput, "exitCode": 0x01, "instructions": 67149,
+        "output": "".join("{}\n".format(i) for i in range(1, 2001)),
+        "state": {"p00:2": "07D0", "0x3004:6": "323030300A00", "ar0": 0x3004}},
+    # The exit table.
+    "exit outOfBoundsError": {
+        "source": ":main:\n    mov     ar0     0wd1\n", "exitCode": 0x00, "instructions": 2,
+        "state": {"ar0": 1}},
+    "exit successfulCompletion": {
+        "source": ":main:\n    exit    0bx01\n", "exitCode": 0x01, "instructions": 1, "state": {}},
+    "exit SIMDError": {
+        "source": ":main:\n    add     p00     wsg0\n    exit    0bx01\n", "exitCode": 0x02, "instructions": 1,
+        "state": {"SEF": 1, "EF": 1}},
+    "exit divideByZero": {
+        "source": ":main:\n    mode    sInt    word\n    mov     p02     0wd7\n    div     p00     p02     0wd0\n"
+                  "    exit    0bx01\n",
+        "exitCode": 0x03, "instructions": 3, "state": {"DZF": 1, "EF": 1}},
+    "exit unresolvedError": {
+        "source": ":main:\n    IOchan  path\n    exit    0bx01\n:padding:\n    dm" + " 0qx0" * 32 +
+                  "\n:path:\n    dm \"/nonexistent directory/file\" 0bx00\n",
+        "exitCode": 0x04, "instructions": 1, "state": {"EF": 1}},
+    "exit signBitOverflow": {
+        "source": ":main:\n    mov     p00     0bd127\n    add     p00     0bd1\n    exit    0bx01\n",
+        "exitCode": 0x05, "instructions": 2, "state": {"p00:1": "80", "NOF": 1, "EF": 1}},
+    "exit invalidInstruction": {
+        "source": ":main:\n    " + invalidInstruction + "\n    exit    0bx01\n", "exitCode": 0x06,
+        "instructions": 1, "state": {}},
+    # Errors which are handled or ignored, and a custom error code from ret.
+    "handled errors": {
+        "source": """
+:main:
+    mov     p00     0bd127
+    add     p00     0bd1
+    jfl     EF      overflowed
+    exit    0bx10
+:overflowed:
+    call    failing
+    jfl     EF      failed
+    exit    0bx11
+:failed:
+    mov     p01     rs
+    ign
+    add     p00     0bxFF
+    mov     p02     0bd1
+    exit    0bx01
+:failing:
+    ret     0bx2A
+""", "exitCode": 0x01, "instructions": 11, "state": {"p00:3": "7F2A01", "rs": 0x2A, "EF": 0, "RF": 0}},
+    "exit ret status": {
+        "source": ":main:\n    call    failing\n    exit    0bx01\n:failing:\n    ret     0bx2A\n",
+        "exitCode": 0x2A, "instructions": 2, "state": {"rs": 0x2A}},
+}
+
+def buildImage (source):
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(source)
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint()), \
+        assembler.labels()
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+# Run an image on an engine and return the best time of 'repeats', the machine of the last run
+# and its console output.
+def runProgram (image, engine, repeats):
+    best = None
+    for _ in range(repeats):
+        stdout = io.BytesIO()
+        machine = uaEmulator.Machine(io.BytesIO(), stdout)
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        uaEmulator.engines[engine](machine)
+        seconds = time.perf_counter() - start
+        machine.io.close()
+        best = seconds if best is None else min(best, seconds)
+    return best, machine, stdout.getvalue()
+
+def flagValue (m, name):
+    return 1 if m.flg & getattr(uaEmulator.flag_bits, name) else 0
+
+# Compare a machine with what a program expects. Returns a list of the differences.
+def checkProgram (program, machine, output, symbols):
+    differences = []
+    if machine.exitCode != program["exitCode"]:
+        differences.append("exit code 0x{:02X}, not 0x{:02X}".format(machine.exitCode, program["exitCode"]))
+    if output != program.get("output", "").encode():
+        differences.append("output {!r}".format(output[:80]))
+    if machine.instructionCount != program["instructions"]:
+        differences.append("{} instructions, not {}".format(machine.instructionCount, program["instructions"]))
+    for location, expected in program["state"].items():
+        if location in ("ZF", "SF", "OF", "NOF", "EF", "DZF", "RF", "SEF"):
+            value = flagValue(machine, location)
+        else:
+            value = uaDebugger.parseWatchpoint(location, symbols).read(machine)
+            if isinstance(value, bytes):
+                value = value.hex().upper()
+        if value != expected:
+            differences.append("{} is {!r}, not {!r}".format(location, value, expected))
+    return differences
+
+def benchmark (repeats):
+    results = {
+        "formatVersion": resultsFormatVersion,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": uaEmulator.numpy.__version__ if uaEmulator.numpy is not None else None,
+        "config": {"repeats": repeats},
+        "programs": {},
+    }
+    failures = 0
+    for name, program in programs.items():
+        image, symbols = buildImage(program["source"])
+        reference = None
+        results["programs"][name] = engineResults = {}
+        for engine in uaEmulator.engines:
+            seconds, machine, output = runProgram(image, engine, repeats)
+            differences = checkProgram(program, machine, output, symbols)
+            if reference is None:
+                reference = engine, machineState(machine), output
+            elif (machineState(machine), output) != reference[1:]:
+                differences.append("the machine's state or output differs from the {} engine's".format(reference[0]))
+            for difference in differences:
+                print("{} ({}): {}".format(name, engine, difference))
+            failures += len(differences)
+            engineResults[engine] = {"instructions": machine.instructionCount, "seconds": seconds,
+                                     "MIPS": machine.instructionCount / seconds / 1e6 if seconds else 0,
+                                     "passed": not differences}
+    return results, failures
+
+def printResults (results, baseline = None):
+    print("{:<28}{:<14}{:>12}{:>12}{:>10}{:>10}".format("program", "engine", "instructions", "ms", "MIPS", "change"))
+    for name, engineResults in results["programs"].items():
+        for engine, result in engineResults.items():
+            change = ""
+            if baseline is not None and engine in baseline["programs"].get(name, {}):
+                baselineSeconds = baseline["programs"][name][engine]["seconds"]
+                change = "{:+.1f}%".format((result["seconds"] / baselineSeconds - 1) * 100)
+            print("{:<28}{:<14}{:>12,}{:>12.2f}{:>10.2f}{:>10}".format(
+                name, engine, result["instructions"], result["seconds"] * 1000, result["MIPS"], change))
+
+def main ():
+    argParser = argparse.ArgumentParser(
+        description="Check and benchmark the emulator's engines on a suite of programs.")
+    argParser.add_argument("-r", "--repeats", type=int, default=3, help="take the best of this many runs (default: 3)")
+    argParser.add_argument("-j", "--json", help="write the results to this file")
+    argParser.add_argument("-c", "--compare", help="compare with the results in this file")
+    args = argParser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("formatVersion") != resultsFormatVersion:
+            print("{} was written by an incompatible version of this benchmark.".format(args.compare))
+            exit()
+        if baseline["config"] != {"repeats": args.repeats}:
+            print("Warning: {} was measured with different settings: {}".format(args.compare, baseline["config"]))
+
+    results, failures = benchmark(args.repeats)
+    printResults(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    if failures:
+        print("{} difference{} from the expected state.".format(failures, "" if failures == 1 else "s"))
+        exit(1)
+    print("Every program left every engine in the expected state.")
+
+if __name__ == "__main__":
+    main()
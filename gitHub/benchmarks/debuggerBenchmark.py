@@ -0,0 +1,96 @@
+# Measures what breakpoints and watchpoints cost. With nothing armed the debugger must run as fast
+# as the engine it hands the machine to; armed, its block loop is compared with '-e blocks'. The
+# breakpoint and watchpoints are on an address and values the program never reaches or changes,
+# so every run must leave the machine in the same state as the interpreter.
+#
+# usage: python debuggerBenchmark.py [loop iterations]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaDebugger
+import uaEmulator
+import uaImage
+
+programSource = """
+:main:
+    mode    sInt    dword
+    mov     ar0     0x1000
+:loop:
+    add     p00     0bd1
+    mov     @ar0    p00
+    call    routine
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+:routine:
+    xor     p04     p00
+    or      p08     p04
+    ret
+:unused:
+    xor     p0C     p00
+    ret
+"""
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+# Run the image with 'run' and return the best time of 3 and the machine of the last run.
+def timeRun (image, run):
+    best = None
+    for _ in range(3):
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        run(machine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, machine
+
+def debugger (engine, breakpoints = (), watchpoints = ()):
+    def run (machine):
+        debugger = uaDebugger.Debugger(engine)
+        for address in breakpoints:
+            debugger.addBreakpoint(address)
+        for text in watchpoints:
+            debugger.addWatchpoint(uaDebugger.parseWatchpoint(text, {}))
+        debugger.run(machine)
+    return run
+
+def main ():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(programSource.format(iterations=iterations))
+    image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    unused = assembler.labels()["unused"]
+
+    runs = [
+        ("interpreter", "emulator", uaEmulator.Machine.run),
+        ("interpreter", "debugger, nothing armed", debugger("interpreter")),
+        ("blocks", "emulator", uaEmulator.Machine.runBlocks),
+        ("blocks", "debugger, nothing armed", debugger("blocks")),
+        ("blocks", "debugger, a breakpoint", debugger("blocks", [unused])),
+        ("blocks", "debugger, memory watchpoint", debugger("blocks", watchpoints=["0x8000:4"])),
+        ("blocks", "debugger, register watchpoint", debugger("blocks", watchpoints=["ar3"])),
+        ("blocks", "debugger, data-pool watchpoint", debugger("blocks", watchpoints=["p40:4"])),
+    ]
+    reference = None
+    baselines = {}
+    print("{:<14}{:<34}{:>12}{:>10}".format("engine", "", "MIPS", "relative"))
+    for engine, name, run in runs:
+        seconds, machine = timeRun(image, run)
+        state = machineState(machine)
+        if reference is None:
+            reference = state
+        elif state != reference:
+            print("{} ({}): the machine's state differs from the interpreter's.".format(name, engine))
+            exit()
+        baselines.setdefault(engine, seconds)
+        print("{:<14}{:<34}{:>12.2f}{:>9.2f}x".format(
+            engine, name, machine.instructionCount / seconds / 1e6, baselines[engine] / seconds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Checks that the disassembler's listings assemble back into the same images and measures how
+# fast it disassembles. The programs of the other benchmarks are assembled with and without the
+# peephole optimizer, disassembled with and without their symbol maps and assembled again, and
+# images of random bytes are too; every image must come back byte for byte with the same entry
+# point. Then a dump of many images one after another is disassembled with and without NumPy.
+#
+# usage: python disassemblerBenchmark.py [random images] [megabytes of dump]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaDisassembler
+import uaImage
+
+import peepholeBenchmark
+
+def buildImage (source, optimize = False):
+    assembler = uaAssembler.Assembler(optimize)
+    program = assembler.assemble(source)
+    image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    return image, assembler.labels()
+
+# Disassemble an image and assemble the listing. Returns the listing if it assembles into the
+# same image, or None.
+def roundTrip (image, symbols = None):
+    listing = uaDisassembler.disassemble(image, symbols)
+    try:
+        reassembled, unused = buildImage(listing)
+    except uaAssembler.AssemblyError:
+        return None
+    return listing if reassembled == image else None
+
+def dataBytes (listing):
+    return sum(line.count("0bx") for line in listing.splitlines() if line.lstrip().startswith("dm"))
+
+def disassembleDump (dump):
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        lines = uaDisassembler.Disassembler().disassembleDump(dump)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, lines
+
+def main ():
+    images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    megabytes = float(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    corpus = []
+    print("{:<24}{:>8}{:>10}{:>12}{:>10}".format("program", "bytes", "dm bytes", "with map", "-O"))
+    for name, source in peepholeBenchmark.corpus(200):
+        results = []
+        for optimize in (False, True):
+            image, symbols = buildImage(source, optimize)
+            corpus.append(image)
+            for map in (None, symbols):
+                listing = roundTrip(image, map)
+                if listing is None:
+                    print("{}{}{} doesn't assemble back into the same image.".format(
+                        name, " -O" if optimize else "", " with its symbol map" if map else ""))
+                    exit(1)
+                results.append(dataBytes(listing))
+        size = len(uaImage.readImage(corpus[-2])[1][0].data)
+        print("{:<24}{:>8,}{:>10,}{:>12,}{:>10,}".format(name, size, results[0], results[1], results[2]))
+
+    # Random bytes, with random entry points and symbol maps.
+    rng = random.Random(23)
+    for i in range(images):
+        code = bytes(rng.getrandbits(8) for _ in range(rng.randrange(0, 400)))
+        image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, code)], rng.randrange(0, len(code) + 1))
+        symbols = {"label{}".format(j): rng.randrange(0, len(code) + 1) for j in range(rng.randrange(0, 8))}
+        if rng.random() < 0.3:
+            symbols["main"] = rng.randrange(0, len(code) + 1)
+        if roundTrip(image, symbols) is None:
+            print("Random image {} doesn't assemble back into the same image.".format(i))
+            exit(1)
+    print("{} programs and {} random images assemble back into the same images.".format(len(corpus), images))
+
+    corpusDump = bytearray()
+    while len(corpusDump) < megabytes * 1e6:
+        corpusDump += corpus[len(corpusDump) % len(corpus)]
+    randomDump = bytearray()
+    while len(randomDump) < megabytes * 1e6:
+        code = rng.randbytes(rng.randrange(1000, 60000))
+        randomDump += uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, code)], 0)
+
+    print("{:<16}{:>14}{:>14}{:>10}".format("dump", "MB/s", "NumPy MB/s", "speedup"))
+    for name, dump in (("programs", bytes(corpusDump)), ("random bytes", bytes(randomDump))):
+        numpy = uaDisassembler.numpy
+        try:
+            uaDisassembler.numpy = None
+            plainSeconds, plainLines = disassembleDump(dump)
+        finally:
+            uaDisassembler.numpy = numpy
+        if numpy is None:
+            print("{:<16}{:>14.2f}{:>14}".format(name, len(dump) / plainSeconds / 1e6, "-"))
+            continue
+        seconds, lines = disassembleDump(dump)
+        if lines != plainLines:
+            print("The {} dump is disassembled differently with NumPy.".format(name))
+            exit(1)
+        print("{:<16}{:>14.2f}{:>14.2f}{:>9.2f}x".format(
+            name, len(dump) / plainSeconds / 1e6, len(dump) / seconds / 1e6, plainSeconds / seconds))
+
+if __name__ == "__main__":
+    main()
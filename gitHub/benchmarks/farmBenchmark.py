@@ -0,0 +1,68 @@
+# Measures the jobs per second of the emulator farm with 1 worker process up to the number of CPUs
+# (and at least 4.) The jobs run one program on different inputs: it computes for a while, then
+# echoes a line of input, so every job must pass, and every worker count must give the same results.
+#
+# usage: python farmBenchmark.py [jobs] [max workers]
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaFarm
+import uaImage
+
+programSource = """
+:main:
+    mode    sInt    dword
+:loop:
+    add     p00     0bd1
+    xor     p04     p00
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop
+    in      0x1000  0x10FF
+    outs    0x1000
+    exit    0bx01
+"""
+
+def main ():
+    jobCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    maxWorkers = int(sys.argv[2]) if len(sys.argv) > 2 else max(os.cpu_count() or 1, 4)
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(programSource.format(iterations=2000))
+    image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "echo.uai"), "wb") as f:
+            f.write(image)
+        manifestPath = os.path.join(directory, "jobs.jsonl")
+        with open(manifestPath, "w") as f:
+            for i in range(jobCount):
+                text = "job {}".format(i)
+                f.write(json.dumps({"image": "echo.uai", "input": text + "\n", "output": text, "exitCode": 1, "id": i})
+                        + "\n")
+        jobs = uaFarm.readManifest(manifestPath, 10000000, 60.0)
+
+        print("{} jobs, {} CPUs".format(jobCount, os.cpu_count()))
+        print("{:>8}{:>12}{:>10}".format("workers", "jobs/s", "scaling"))
+        reference = None
+        for workers in range(1, maxWorkers + 1):
+            start = time.perf_counter()
+            results = sorted(uaFarm.runJobs(jobs, workers), key=lambda result: result["index"])
+            elapsed = time.perf_counter() - start
+            outcome = [(result["status"], result["exitCode"], result["instructions"]) for result in results]
+            if any(status != "passed" for status, _, _ in outcome):
+                print("{} workers: not every job passed.".format(workers))
+                exit()
+            if reference is None:
+                reference = outcome
+                baseline = elapsed
+            elif outcome != reference:
+                print("{} workers: the results differ from 1 worker's.".format(workers))
+                exit()
+            print("{:>8}{:>12,.1f}{:>9.2f}x".format(workers, jobCount / elapsed, baseline / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Compares the emulator's lazily set ZF and SF with setting them after every arithmetic and logic
+# instruction, as it used to. Random programs mixing every such instruction with branches on the
+# flags, flag operands and copies of the flags register to memory are run by every engine both
+# ways and must leave the machine in the same state; then the speed of an arithmetic loop is
+# measured both ways.
+#
+# usage: python flagsBenchmark.py [random programs] [loop iterations]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+flag_bits = uaEmulator.flag_bits
+
+# setResultFlags() and BlockTranslator.setResultFlags() as they were before ZF and SF were left
+# to be set when the flags are read; kept as the baseline.
+def eagerSetResultFlags (m, result, signBit, clearBits, setBits):
+    flags = m.flg & ~(flag_bits.ZF | flag_bits.SF | clearBits)
+    if result == 0:
+        flags |= flag_bits.ZF
+    elif result & signBit:
+        flags |= flag_bits.SF
+    m.flg = flags | setBits
+
+class EagerBlockTranslator (uaEmulator.BlockTranslator):
+    def setResultFlags (self, signBit, clearBits):
+        self.emit("flg &= {}".format(~(flag_bits.ZF | flag_bits.SF | clearBits) & 0xFFFF))
+        self.emit("if r == 0:")
+        self.emit("    flg |= {}".format(flag_bits.ZF))
+        self.emit("elif r & {}:".format(signBit))
+        self.emit("    flg |= {}".format(flag_bits.SF))
+
+lazyFlags = (uaEmulator.setResultFlags, uaEmulator.BlockTranslator)
+eagerFlags = (eagerSetResultFlags, EagerBlockTranslator)
+
+def useFlags (implementation):
+    uaEmulator.setResultFlags, uaEmulator.BlockTranslator = implementation
+
+# Random programs. The loop body is made of arithmetic and logic instructions on the parameter
+# space, two registers and literals of every width, with flags register copies stored at ar0 and
+# jumps over single instructions. With the response flag set, every instruction which can raise
+# an error is followed by a test of EF.
+poolOperands = ["p{:02X}".format(offset) for offset in range(0, 0x40, 8)]
+registerOperands = ["ar1", "ar2"]
+wordLengths = ("byte", "word", "dword", "qword")
+
+def randomLiteral (rng):
+    width = rng.choice("bwdq")
+    bits = {"b": 8, "w": 16, "d": 32, "q": 64}[width]
+    value = rng.choice((0, 1, (1 << bits) - 1, 1 << (bits - 1), rng.getrandbits(bits)))
+    return "0{}x{:0{}X}".format(width, value, bits // 4)
+
+def randomDestination (rng):
+    return rng.choice(poolOperands + registerOperands)
+
+def randomSource (rng):
+    return rng.choice((rng.choice(poolOperands), rng.choice(registerOperands), randomLiteral(rng)))
+
+def randomInstruction (rng):
+    kind = rng.randrange(10)
+    if kind < 5:
+        operation = rng.choice(("add", "sub", "and", "or", "nor", "xor"))
+        return "{} {} {}".format(operation, randomDestination(rng), randomSource(rng))
+    if kind == 5:
+        return "not {}".format(randomDestination(rng))
+    if kind == 6:
+        return "cmp {} {}".format(randomDestination(rng), randomSource(rng))
+    if kind == 7:
+        high = randomDestination(rng)
+        low = high if rng.random() < 0.5 else rng.choice(poolOperands)
+        return "{} {} {} {}".format(rng.choice(("mul", "div")), high, low, randomSource(rng))
+    if kind == 8:
+        return "alloc {}".format(randomLiteral(rng))
+    return "mode sInt {}".format(rng.choice(wordLengths))
+
+def randomProgram (rng, iterations):
+    respond = rng.random() < 0.5
+    lines = [":main:", "" if respond else "ign", "mode sInt {}".format(rng.choice(wordLengths)),
+             "mov ar0 0x2000", "mov ar3 0wd0", ":loop:"]
+    labels = 0
+    def instruction (text):
+        nonlocal labels
+        lines.append(text)
+        if respond and not text.startswith("mode"):
+            labels += 1
+            lines.extend(("jfl EF handled{}".format(labels), ":handled{}:".format(labels)))
+    for _ in range(rng.randrange(4, 24)):
+        kind = rng.randrange(8)
+        if kind < 5:
+            instruction(randomInstruction(rng))
+        elif kind == 5:
+            lines.extend(("mov @ar0 flg", "add ar0 0wd2"))
+        elif kind == 6:
+            lines.append("mov {} {}".format(rng.choice(registerOperands), rng.choice(("ZF", "SF", "OF", "NOF"))))
+        else:
+            labels += 1
+            skip = "skip{}".format(labels)
+            lines.append("{} {} {}".format(rng.choice(("jfl", "sfl")), rng.choice(("ZF", "SF", "OF", "NOF")), skip))
+            instruction(randomInstruction(rng))
+            lines.append(":{}:".format(skip))
+    lines.extend(("add ar3 0wd1", "cmp ar3 0wd{}".format(iterations), "sfl ZF loop", "exit 0bx01"))
+    return "\n".join(lines)
+
+def buildImage (source):
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(source)
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+def runImage (image, engine, implementation):
+    useFlags(implementation)
+    try:
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        uaEmulator.engines[engine](machine, 10 ** 6)
+        return time.perf_counter() - start, machine
+    finally:
+        useFlags(lazyFlags)
+
+aluKernel = """
+:main:
+    mode    sInt    dword
+:loop:
+    add     p00     0bd1
+    xor     p04     p00
+    or      p08     p04
+    sub     p0C     0bd3
+    add     ar1     0wd3
+    and     ar2     ar1
+    not     p10
+    mul     p14     p14     0bd3
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+"""
+
+def main ():
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+    rng = random.Random(21)
+    for i in range(programs):
+        source = randomProgram(rng, rng.randrange(1, 40))
+        image = buildImage(source)
+        unused, reference = runImage(image, "interpreter", eagerFlags)
+        for engine in uaEmulator.engines:
+            for name, implementation in (("eager", eagerFlags), ("lazy", lazyFlags)):
+                unused, machine = runImage(image, engine, implementation)
+                if machineState(machine) != machineState(reference):
+                    print("Random program {} ({} flags, {}) differs from the eager interpreter:".format(i, name, engine))
+                    print(source)
+                    exit(1)
+    print("{} random programs leave every engine in the same state with eager and lazy flags.".format(programs))
+
+    image = buildImage(aluKernel.format(iterations=iterations))
+    print("{:<14}{:>12}{:>12}{:>10}".format("engine", "eager MIPS", "lazy MIPS", "speedup"))
+    for engine in uaEmulator.engines:
+        results = []
+        for implementation in (eagerFlags, lazyFlags):
+            best = None
+            for _ in range(3):
+                seconds, machine = runImage(image, engine, implementation)
+                best = seconds if best is None else min(best, seconds)
+            results.append(machine.instructionCount / best / 1e6)
+        print("{:<14}{:>12.2f}{:>12.2f}{:>9.2f}x".format(engine, results[0], results[1], results[1] / results[0]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Counts the system calls and measures the time of an I/O heavy program with the emulator's I/O
+# buffered and its files pooled, and with every write made at once and every file opened again
+# when it's selected, like the emulator did I/O before. The program writes lines to the
+# console, appends records to a file, switches back and forth between two files and reads a file
+# back in large pieces. Both ways must write the same console output and files and read the same
+# data.
+#
+# usage: python ioBenchmark.py [lines]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+programSource = """
+:main:
+    mode    sInt    word
+    mov     ar1     0wd0
+:console:
+    outs    line
+    add     ar1     0wd1
+    cmp     ar1     0wd{lines}
+    sfl     ZF      console
+
+    IOchan  fileA
+    mov     ar1     0wd0
+:append:
+    out     record  recordEnd
+    add     ar1     0wd1
+    cmp     ar1     0wd{lines}
+    sfl     ZF      append
+
+    mov     ar1     0wd0
+:switch:
+    IOchan  fileB
+    out     record  recordEnd
+    IOchan  fileA
+    in      0x8000  0x801F
+    add     ar1     0wd1
+    cmp     ar1     0wd{switches}
+    sfl     ZF      switch
+
+    mov     ar1     0wd0
+:readBack:
+    seek    0wd0
+    in      0x4000  0x7FFF
+    add     ar1     0wd1
+    cmp     ar1     0wd{reads}
+    sfl     ZF      readBack
+    IOchan  0
+    exit    0bx01
+
+:line:
+    dm "A line of console output from the I/O benchmark." 0bx0A 0bx00
+:record:
+    dm "0123456789abcdefghijklmnopqrstu" 0bx0A
+:recordEnd:
+    dm 0bx00
+// File names have to be above address 255, which is reserved for other channels.
+:padding:
+{padding}
+:fileA:
+    dm "a.dat" 0bx00
+:fileB:
+    dm "b.dat" 0bx00
+"""
+
+configurations = {
+    "buffered and pooled": {},
+    "unbuffered, unpooled": {"bufferSize": 0, "maxOpenFiles": 1, "directReadSize": uaEmulator.memorySize + 1},
+}
+
+def run (image, directory, configuration):
+    for name in ("a.dat", "b.dat"):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.unlink(path)
+    consolePath = os.path.join(directory, "console.out")
+    with open(consolePath, "wb", buffering=0) as console:
+        machine = uaEmulator.Machine(stdout=console)
+        machine.io = uaEmulator.IOState(machine.io.stdin, console, **configuration)
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        machine.run()
+        machine.io.close()
+        elapsed = time.perf_counter() - start
+    outputs = []
+    for name in ("console.out", "a.dat", "b.dat"):
+        with open(os.path.join(directory, name), "rb") as f:
+            outputs.append(f.read())
+    return elapsed, machine, outputs
+
+def main ():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    assembler = uaAssembler.Assembler()
+    padding = "    dm" + " 0qx0" * 32
+    program = assembler.assemble(programSource.format(lines=lines, switches=lines // 4, reads=lines // 20,
+                                                      padding=padding))
+    image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+    previousDirectory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            results = {name: run(image, directory, configuration) for name, configuration in configurations.items()}
+        finally:
+            os.chdir(previousDirectory)
+
+    reference = None
+    print("{:<22}{:>10}{:>10}{:>10}{:>10}{:>10}".format("", "open", "close", "read", "write", "time"))
+    for name, (elapsed, machine, outputs) in results.items():
+        state = (outputs, bytes(machine.memory), machine.exitCode, machine.instructionCount)
+        if reference is None:
+            reference = state
+        elif state != reference:
+            print("{}: the program's output differs.".format(name))
+            exit()
+        calls = machine.io.calls
+        print("{:<22}{:>10,}{:>10,}{:>10,}{:>10,}{:>8.3f} s".format(
+            name, calls["open"], calls["close"], calls["read"], calls["write"], elapsed))
+
+if __name__ == "__main__":
+    main()
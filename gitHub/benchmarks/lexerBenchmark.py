@@ -0,0 +1,130 @@
+# Compares the throughput of the regex based lexer behind parse() with the character by
+# character tokenizer it replaced. The old tokenizer is kept here, frozen, as the baseline.
+#
+# usage: python lexerBenchmark.py [number of copies of the test program] [dm table lines]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+
+testProgramPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "testProgram.uas.txt")
+
+# The tokenizer parse() used before it was rebuilt on top of lex(). It is a verbatim copy apart
+# from its name, so don't fix it.
+def legacyParse (sourceCode):
+    parsedCode = [[""]]         # The parse tree goes here
+    scanningStrLiteral = False  # String and character literals may contain spaces, so they
+    scanningChrLiteral = False  # require special treatment.
+    ignoringComment = False     #
+    for charIndex, charValue in enumerate(sourceCode):
+
+        if charValue == "/" and sourceCode[charIndex + 1] == "/":
+            ignoringComment = True
+
+        if charValue == "\n":
+            ignoringComment = False
+
+        if not ignoringComment:
+            if charValue == "\"" and not scanningChrLiteral and sourceCode[charIndex - 1] != "\\":
+                scanningStrLiteral = not scanningStrLiteral
+                if not scanningStrLiteral: # This runs when the end of a string literal is reached.
+                    parsedCode[-1][-1] += "\""
+                    parsedCode[-1][-1] = eval(parsedCode[-1][-1])
+                    parsedCode[-1][-1] = "\"" + parsedCode[-1][-1]
+                    parsedCode[-1].append("")
+
+            if charValue == "'" and not scanningStrLiteral and sourceCode[charIndex - 1] != "\\":
+                scanningChrLiteral = not scanningChrLiteral
+                if not scanningChrLiteral: # This runs when the end of a char literal is reached.
+                    parsedCode[-1][-1] += "'"
+                    parsedCode[-1][-1] = eval(parsedCode[-1][-1])
+                    if len(parsedCode[-1][-1]) > 1:
+                        print("Syntax error on line {}. The expression in a character literal".format(len(parsedCode)))
+                        print("must resolve to a single character!")
+                        exit()
+                    parsedCode[-1][-1] = "'" + parsedCode[-1][-1]
+                    parsedCode[-1].append("")
+
+            if charValue != "\n":
+                if scanningChrLiteral or scanningStrLiteral:
+                    parsedCode[-1][-1] += charValue
+                else:
+                    if charValue != " " and charValue != "\t":
+                        parsedCode[-1][-1] += charValue
+                    else:
+                        parsedCode[-1].append("")
+            else:
+                if scanningStrLiteral:
+                    print("Syntax error on line {}. Expected end of string literal but found".format(len(parsedCode)))
+                    print("end of line.")
+                    exit()
+                if scanningChrLiteral:
+                    print("Syntax error on line {}. Expected end of character literal but found".format(len(parsedCode)))
+                    print("end of line.")
+                    exit()
+                parsedCode.append([""])
+
+    parseTreeWithEmptyStrings = parsedCode
+    parsedCode = []
+    for line in parseTreeWithEmptyStrings:
+        if line != [""] and line != []:
+            parsedCode.append([])
+            for token in line:
+                if token != "":
+                    parsedCode[-1].append(token)
+
+    parseTreeWithBlankLines = parsedCode
+    parsedCode = []
+    for line in parseTreeWithBlankLines:
+        if line != []:
+            parsedCode.append(line)
+
+    return parsedCode
+
+# Build a source file out of copies of the test program followed by a large defined memory
+# table, which is the shape of our generated sources.
+def buildSource (copies, tableLines):
+    with open(testProgramPath) as f:
+        testProgram = f.read()
+
+    lines = [testProgram] * copies
+    for i in range(tableLines):
+        lines.append("  dm \"row {} of the table\\n\" 0bx{:02X} 0wd{} '\\t' // entry {}\n".format(i, i % 256, i, i))
+    return "".join(lines)
+
+def timeParser (parser, sourceCode, repeats = 3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        parser(sourceCode)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main ():
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tableLines = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    sourceCode = buildSource(copies, tableLines)
+    lineCount = sourceCode.count("\n")
+
+    # The old tokenizer doesn't treat commas as separators and leaves the closing quote of every
+    # literal behind as a token of its own. Apart from those stray tokens both parsers must agree.
+    legacyTree = [[t for t in line if t.strip("\"',")] for line in legacyParse(sourceCode)]
+    legacyTree = [line for line in legacyTree if line]
+    if [list(line) for line in uaAssembler.parse(sourceCode)] != legacyTree:
+        print("The parse trees produced by the two tokenizers differ.")
+        exit()
+
+    legacyTime = timeParser(legacyParse, sourceCode)
+    newTime = timeParser(uaAssembler.parse, sourceCode)
+    print("{} lines, {} bytes of source".format(lineCount, len(sourceCode)))
+    print("{:<18}{:>12.4f} s{:>16,.0f} lines/s{:>16,.0f} bytes/s".format(
+        "legacy parse()", legacyTime, lineCount / legacyTime, len(sourceCode) / legacyTime))
+    print("{:<18}{:>12.4f} s{:>16,.0f} lines/s{:>16,.0f} bytes/s".format(
+        "lex() + parse()", newTime, lineCount / newTime, len(sourceCode) / newTime))
+    print("speedup: {:.1f}x".format(legacyTime / newTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Measures how long rebuilding a multi-file program takes with the linker's build cache: from
+# scratch, with nothing changed, and after one file is edited. The time of assembling the whole
+# program as a single source file is given for comparison.
+#
+# usage: python linkBenchmark.py [number of files] [routines per file]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaLinker
+
+routineTemplate = """
+:{name}:
+    mode    sInt    word
+    mov     p00     0wd0
+:{name}_loop:
+    add     p00     0wd1
+    add     p02     p00
+    xor     p04     p02
+    cmp     p00     0wd{count}
+    sfl     ZF      {name}_loop
+    mov     pi1     p02
+    call    {callee}
+    ret     0bx00
+:{name}_table:
+    dm "{name}" 0bx00 0wx1234 {name}_loop
+"""
+
+# Build the source files of a program. Every routine calls a routine of the next file, so every
+# file imports names from another one, and the routines of the last file call done.
+def buildSources (fileCount, routineCount):
+    sources = []
+    for i in range(fileCount):
+        routines = []
+        for j in range(routineCount):
+            callee = "r{}_{}".format(i + 1, j) if i + 1 < fileCount else "done"
+            routines.append(routineTemplate.format(name="r{}_{}".format(i, j), count=j + 2, callee=callee))
+        sources.append("".join(routines))
+    calls = "".join("    call    r{}_0\n".format(i) for i in range(fileCount))
+    sources.insert(0, ":main:\n" + calls + "    exit    0bx01\n:done:\n    ret     0bx00\n")
+    return sources
+
+def build (paths, cache):
+    return uaLinker.link(uaLinker.loadObjects(paths, cache))
+
+def timeBuild (paths, cache):
+    start = time.perf_counter()
+    build(paths, cache)
+    return time.perf_counter() - start
+
+def main ():
+    fileCount = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    routineCount = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    sources = buildSources(fileCount, routineCount)
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, sourceCode in enumerate(sources):
+            paths.append(os.path.join(directory, "file{}.uas".format(i)))
+            with open(paths[-1], "w") as f:
+                f.write(sourceCode)
+        cache = uaLinker.BuildCache(os.path.join(directory, "cache"))
+
+        coldTime = timeBuild(paths, cache)
+        warmTime = timeBuild(paths, cache)
+        with open(paths[len(paths) // 2], "a") as f:
+            f.write("    NOP // edited\n")
+        editTime = timeBuild(paths, cache)
+
+    start = time.perf_counter()
+    uaAssembler.assemble("".join(sources))
+    wholeTime = time.perf_counter() - start
+
+    print("{} files, {} lines of source".format(len(sources), sum(s.count("\n") for s in sources)))
+    print("{:<36}{:>10.4f} s".format("single file assemble()", wholeTime))
+    print("{:<36}{:>10.4f} s".format("build with an empty cache", coldTime))
+    print("{:<36}{:>10.4f} s".format("rebuild, nothing changed", warmTime))
+    print("{:<36}{:>10.4f} s".format("rebuild after editing one file", editTime))
+    print("build cache: {} hits, {} misses".format(cache.hits, cache.misses))
+
+if __name__ == "__main__":
+    main()
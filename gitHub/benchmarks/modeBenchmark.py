@@ -0,0 +1,275 @@
+# Compares the emulator's mode kernels (see uaEmulator.ModeKernels) with the handlers they
+# replaced, which looked at the word length and floating-point mode on every instruction. Random
+# programs switching between all eight modes, with integer and floating-point arithmetic, logic,
+# cmp and mov on the data-pool, registers, literals and memory, are run by every engine both ways
+# and must leave the machine in the same state; then the speed of mixed-mode loops is measured.
+#
+# usage: python modeBenchmark.py [random programs] [loop iterations per kernel]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+from uaEmulator import (KIND_LITERAL, KIND_MEMORY, KIND_POOL, KIND_REGISTER, KIND_SIMD, InvalidInstruction,
+                        arithmeticFlags, checkMemoryOperands, executeSIMD, flag_bits, floatOperations,
+                        integerOperations, isFloatOperation, operationClearBits, operationWidth, readFloatSource,
+                        readPoolFloat, setFloatFlags, setResultFlags, sourceWidth, subtractIntegers,
+                        writePoolFloat)
+
+# The handlers as they were before the mode kernels, but with the flags of floating-point results
+# taken from the value stored like the kernels do; kept as the baseline.
+def legacyExecuteBinary (m, instruction):
+    (destinationType, destination), (sourceType, source) = instruction.operands
+    if destinationType.kind == KIND_SIMD or sourceType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_MEMORY or destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Memory and literals can only be destinations of mov.")
+    opCode = instruction.opCode
+
+    if opCode in floatOperations and isFloatOperation(m, destinationType):
+        a = readPoolFloat(m, destination)
+        b = readFloatSource(m, sourceType, source)
+        result = writePoolFloat(m, destination, floatOperations[opCode](a, b))
+        setFloatFlags(m, result, arithmeticFlags, flag_bits.OF if result in (float("inf"), float("-inf")) else 0)
+        return
+
+    width = operationWidth(m, destinationType)
+    bits = width * 8; mask = (1 << bits) - 1
+    a = destinationType.read(m, destination, width) & mask
+    b = sourceType.read(m, source, width) & mask
+    isSigned = destinationType.kind == KIND_POOL
+    result, flags, error = integerOperations[opCode](a, b, bits, isSigned)
+    destinationType.write(m, destination, width, result)
+    setResultFlags(m, result, 1 << (bits - 1), operationClearBits[opCode], flags)
+    if error is not None:
+        m.raiseError(error)
+
+def legacyExecuteNot (m, instruction):
+    ((destinationType, destination),) = instruction.operands
+    if destinationType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_MEMORY or destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Memory and literals can only be destinations of mov.")
+    width = operationWidth(m, destinationType)
+    bits = width * 8; mask = (1 << bits) - 1
+    result = ~destinationType.read(m, destination, width) & mask
+    destinationType.write(m, destination, width, result)
+    setResultFlags(m, result, 1 << (bits - 1), 0, 0)
+
+def legacyExecuteCmp (m, instruction):
+    (firstType, first), (secondType, second) = instruction.operands
+    if firstType.kind == KIND_SIMD or secondType.kind == KIND_SIMD:
+        m.flg |= flag_bits.SEF
+        m.raiseError(uaEmulator.exit_codes.SIMDError)
+        return
+    checkMemoryOperands(instruction.operands)
+
+    if isFloatOperation(m, firstType) or isFloatOperation(m, secondType):
+        result = readFloatSource(m, firstType, first) - readFloatSource(m, secondType, second)
+        setFloatFlags(m, result, arithmeticFlags, 0)
+        return
+
+    width = sourceWidth(m, firstType) or sourceWidth(m, secondType) or 2
+    bits = width * 8; mask = (1 << bits) - 1
+    a = firstType.read(m, first, width) & mask
+    b = secondType.read(m, second, width) & mask
+    isSigned = firstType.kind != KIND_REGISTER
+    result, flags, error = subtractIntegers(a, b, bits, isSigned)
+    setResultFlags(m, result, 1 << (bits - 1), arithmeticFlags, flags)
+    if error is not None:
+        m.raiseError(error)
+
+def legacyExecuteMov (m, instruction):
+    (destinationType, destination), (sourceType, source) = instruction.operands
+    if destinationType.kind == KIND_SIMD or sourceType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Literals cannot be destination operands.")
+    checkMemoryOperands(instruction.operands)
+    if destinationType.kind == KIND_MEMORY:
+        width = sourceWidth(m, sourceType)
+    else:
+        width = operationWidth(m, destinationType)
+    destinationType.write(m, destination, width, sourceType.read(m, source, width))
+
+legacyHandlers = {uaEmulator.executeBinary: legacyExecuteBinary, uaEmulator.executeNot: legacyExecuteNot,
+                  uaEmulator.executeCmp: legacyExecuteCmp, uaEmulator.executeMov: legacyExecuteMov}
+kernelTable = list(uaEmulator.instructionTable)
+legacyTable = [(decoder, legacyHandlers.get(handler, handler), opCode, typeBits)
+               for decoder, handler, opCode, typeBits in kernelTable]
+
+# Random programs. Pool operands are spread over the whole data-pool, so that some run past its
+# end in the wider modes, and the memory sources at ar0 hold random bytes. Copies of the flags
+# register are stored at ar1 and ar3 counts the iterations.
+modes = ["{} {}".format(number, wordLength) for number in ("sInt", "float")
+         for wordLength in ("byte", "word", "dword", "qword")]
+
+def randomPool (rng):
+    return "p{:02X}".format(rng.choice((rng.randrange(0, 0x40, 4), rng.randrange(0x40, 0x80))))
+
+def randomLiteral (rng):
+    width = rng.choice("bwdq")
+    bits = {"b": 8, "w": 16, "d": 32, "q": 64}[width]
+    return "0{}x{:0{}X}".format(width, rng.getrandbits(bits), bits // 4)
+
+def randomSource (rng):
+    kind = rng.randrange(5)
+    if kind < 2:
+        return randomPool(rng)
+    if kind == 2:
+        return rng.choice(("ar2", "pi0"))
+    if kind == 3:
+        return randomLiteral(rng)
+    return "@ar0+0x{:02X}".format(rng.randrange(0, 0x80))
+
+def randomInstruction (rng):
+    kind = rng.randrange(12)
+    destination = randomPool(rng) if rng.random() < 0.8 else rng.choice(("ar2", "pi0"))
+    if kind < 5:
+        operation = rng.choice(("add", "sub", "add", "sub", "and", "or", "nor", "xor"))
+        return "{} {} {}".format(operation, destination, randomSource(rng))
+    if kind == 5:
+        return "not {}".format(destination)
+    if kind < 8:
+        return "cmp {} {}".format(destination, randomSource(rng))
+    if kind < 10:
+        return "mov {} {}".format(destination, randomSource(rng))
+    if kind == 10:
+        return "mov @ar1 flg\nadd ar1 0wd2"
+    return "mode {}".format(rng.choice(modes))
+
+def randomProgram (rng, iterations):
+    lines = [":main:", "ign", "mode {}".format(rng.choice(modes)), "mov ar0 0x2000", "mov ar1 0x3000",
+             "mov ar3 0wd0", ":loop:"]
+    lines.extend(randomInstruction(rng) for _ in range(rng.randrange(4, 24)))
+    lines.extend(("add ar3 0wd1", "cmp ar3 0wd{}".format(iterations), "sfl ZF loop", "exit 0bx01"))
+    return "\n".join(lines)
+
+def buildImage (source):
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(source)
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+def runImage (image, engine, table, memory = b""):
+    uaEmulator.instructionTable[:] = table
+    try:
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        machine.memory[0x2000:0x2000 + len(memory)] = memory
+        start = time.perf_counter()
+        uaEmulator.engines[engine](machine, 10 ** 6)
+        return time.perf_counter() - start, machine
+    finally:
+        uaEmulator.instructionTable[:] = kernelTable
+
+kernels = {
+    # The 'mode sInt qword' section of testProgram.uas.txt, in a loop which also takes the value
+    # apart into decimal digits.
+    "sInt qword": """
+:main:
+    mode    sInt    qword
+    mov     p00     0qd1234567890123
+:loop:
+    mov     p02     p00
+    mov     pi0     ap
+    add     pi0     0bd32
+    mov     p10     p02
+    div     p18     p10     0bd10
+    add     p18     0bd48
+    xor     p20     p18
+    add     p00     0bd7
+    add     p08     0bd1
+    cmp     p08     0dd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+""",
+    "float dword": """
+:main:
+    mode    float   dword
+    mov     p00     0dx3F800000
+    mov     p04     0dx3DCCCCCD
+:loop:
+    add     p08     p04
+    sub     p0C     p00
+    add     p10     p08
+    mov     p14     p10
+    cmp     p14     p0C
+    mode    sInt    dword
+    add     p18     0bd1
+    cmp     p18     0dd{iterations}
+    mode    float   dword
+    sfl     ZF      loop
+    exit    0bx01
+""",
+    # Every iteration works in four modes.
+    "switching": """
+:main:
+    mov     ar2     0wd0
+:loop:
+    mode    sInt    byte
+    add     p00     0bd1
+    xor     p01     p00
+    mode    sInt    word
+    add     p02     0wd3
+    not     p04
+    mode    float   qword
+    add     p08     0wd1
+    mov     p10     p08
+    mode    sInt    dword
+    sub     p18     0bd1
+    cmp     p18     p1C
+    add     ar2     0wd1
+    cmp     ar2     0wd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+""",
+}
+
+def main ():
+    programs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = random.Random(22)
+    for i in range(programs):
+        source = randomProgram(rng, rng.randrange(1, 40))
+        image = buildImage(source)
+        memory = bytes(rng.getrandbits(8) for _ in range(0x100))
+        unused, reference = runImage(image, "interpreter", legacyTable, memory)
+        for engine in uaEmulator.engines:
+            for name, table in (("legacy", legacyTable), ("kernel", kernelTable)):
+                unused, machine = runImage(image, engine, table, memory)
+                if machineState(machine) != machineState(reference):
+                    print("Random program {} ({} handlers, {}) differs from the legacy interpreter:".format(
+                        i, name, engine))
+                    print(source)
+                    exit(1)
+    print("{} random programs leave every engine in the same state with the legacy handlers and the kernels."
+          .format(programs))
+
+    print("{:<14}{:<14}{:>12}{:>12}{:>10}".format("kernel", "engine", "legacy MIPS", "kernel MIPS", "speedup"))
+    for name, source in kernels.items():
+        image = buildImage(source.format(iterations=iterations))
+        for engine in uaEmulator.engines:
+            results = []
+            for table in (legacyTable, kernelTable):
+                best = None
+                for _ in range(3):
+                    seconds, machine = runImage(image, engine, table)
+                    best = seconds if best is None else min(best, seconds)
+                results.append(machine.instructionCount / best / 1e6)
+            print("{:<14}{:<14}{:>12.2f}{:>12.2f}{:>9.2f}x".format(
+                name, engine, results[0], results[1], results[1] / results[0]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Measures how fast the assembler encodes operands with and without its operand cache. Operand
+# tokens are taken from the instructions of a source generated by assemblerBenchmark.py and parsed
+# with Assembler.parseOperand, which looks in the cache first, and with classifyOperand, the
+# pattern matching it falls back to. The first pass of assembling the whole source is timed both
+# ways too. Both ways must give the same results.
+#
+# usage: python operandBenchmark.py [units of generated source]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+from assemblerBenchmark import generateSource
+
+def uncachedParseOperand (assembler, token, lineNumber):
+    return assembler.classifyOperand(token, lineNumber)[0]
+
+# The operand tokens of every instruction of a parse tree, in order.
+def operandTokens (parseTree):
+    tokens = []
+    for line in parseTree:
+        if line[0] in uaAssembler.op_codes.pneumonics and line[0] not in ("mode", "ign", "exit", "ret", "jfl", "sfl", "call", "inth"):
+            tokens.extend(line[1:])
+    return tokens
+
+def best (function, repeats = 5):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main ():
+    units = int(sys.argv[1]) if len(sys.argv) > 1 else 250
+    sourceCode = generateSource(units)
+    parseTree = uaAssembler.parse(sourceCode)
+
+    # The names have to be defined for tokens which refer to them to parse as they do in pass one.
+    assembler = uaAssembler.Assembler()
+    assembler.assembleParseTree(parseTree)
+    tokens = operandTokens(parseTree)
+    if [assembler.parseOperand(token, 0) for token in tokens] != [uncachedParseOperand(assembler, token, 0) for token in tokens]:
+        print("The cached and uncached operands differ.")
+        exit()
+
+    def parseCached ():
+        parseOperand = uaAssembler.Assembler.parseOperand
+        for token in tokens:
+            parseOperand(assembler, token, 0)
+
+    def parseUncached ():
+        for token in tokens:
+            uncachedParseOperand(assembler, token, 0)
+
+    def passOne ():
+        uaAssembler.Assembler().assembleParseTree(parseTree)
+
+    cachedTime = best(parseCached)
+    uncachedTime = best(parseUncached)
+    cachedPassOne = best(passOne)
+    cachedProgram = uaAssembler.assemble(sourceCode)
+    parseOperand = uaAssembler.Assembler.parseOperand
+    uaAssembler.Assembler.parseOperand = uncachedParseOperand
+    try:
+        uncachedPassOne = best(passOne)
+        uncachedProgram = uaAssembler.assemble(sourceCode)
+    finally:
+        uaAssembler.Assembler.parseOperand = parseOperand
+    if cachedProgram != uncachedProgram:
+        print("The programs assembled with and without the cache differ.")
+        exit()
+
+    print("{} operand tokens, {} different".format(len(tokens), len(set(tokens))))
+    print("{:<22}{:>12}{:>16}{:>12}{:>16}{:>10}".format("", "uncached", "operands/s", "cached", "operands/s", "speedup"))
+    print("{:<22}{:>10.4f} s{:>16,.0f}{:>10.4f} s{:>16,.0f}{:>9.2f}x".format(
+        "parseOperand", uncachedTime, len(tokens) / uncachedTime, cachedTime, len(tokens) / cachedTime, uncachedTime / cachedTime))
+    print("{:<22}{:>10.4f} s{:>16,.0f}{:>10.4f} s{:>16,.0f}{:>9.2f}x".format(
+        "pass one", uncachedPassOne, len(tokens) / uncachedPassOne, cachedPassOne, len(tokens) / cachedPassOne,
+        uncachedPassOne / cachedPassOne))
+
+if __name__ == "__main__":
+    main()
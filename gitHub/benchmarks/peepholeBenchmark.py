@@ -0,0 +1,118 @@
+# Reports what the assembler's peephole optimizer ('-O') does to the programs of the other
+# benchmarks and to a program written like a simple compiler's output: the size of the machine
+# code and the number of instructions the emulator executes, without and with it. An optimized
+# program must exit with the same code, write the same output and leave the same values in the
+# parameter space.
+#
+# usage: python peepholeBenchmark.py [loop iterations per kernel]
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+import debuggerBenchmark
+import profilerBenchmark
+import SIMDBenchmark
+import snapshotBenchmark
+import translationBenchmark
+import windowBenchmark
+
+# Loops and if-else chains the way a compiler which translates one statement at a time writes
+# them; every statement ends with a jump to the next, loops jump to their tests and literals are
+# as wide as the variables.
+generatedSource = """
+:main:
+    sub     ap      0wd128
+    mw      @ap
+    mode    sInt    dword
+    mov     p00     0dd0
+    mov     p04     0dd0
+    jfl     TF      loop_test
+:loop_body:
+    mov     p08     p00
+    and     p08     0dd3
+    cmp     p08     0dd0
+    sfl     ZF      else_1
+    add     p04     0dd2
+    jfl     TF      end_if_1
+:else_1:
+    cmp     p08     0dd1
+    sfl     ZF      else_2
+    sub     p04     0dd1
+    jfl     TF      end_if_2
+:else_2:
+    xor     p04     0dd255
+    jfl     TF      end_if_2
+:end_if_2:
+    NOP
+    jfl     TF      end_if_1
+:end_if_1:
+    jfl     TF      next_iteration
+:next_iteration:
+    add     p00     0dd1
+    jfl     TF      loop_test
+:loop_test:
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop_body
+    jfl     TF      loop_end
+:loop_end:
+    exit    0bx01
+"""
+
+# The programs, as (name, source code) pairs.
+def corpus (iterations):
+    programs = []
+    for name, source in translationBenchmark.kernels.items():
+        programs.append(("translation " + name, source.format(iterations=iterations, outer=max(iterations // 16, 1))))
+    for name, source in profilerBenchmark.kernels.items():
+        programs.append(("profiler " + name, source.format(iterations=iterations)))
+    for name, body in windowBenchmark.kernels.items():
+        programs.append(("window " + name, windowBenchmark.kernelLoop.format(body=body, iterations=iterations)))
+    table = SIMDBenchmark.tableSource()
+    for name, body in SIMDBenchmark.kernels.items():
+        programs.append(("SIMD " + name, SIMDBenchmark.kernelLoop.format(mode="sInt dword", body=body,
+                                                                         iterations=iterations, table=table)))
+    programs.append(("debugger", debuggerBenchmark.programSource.format(iterations=iterations)))
+    programs.append(("snapshot", snapshotBenchmark.programSource))
+    programs.append(("generated", generatedSource.format(iterations=iterations)))
+    return programs
+
+# Assemble and run a program. Returns the size of the machine code, the machine and its output.
+def run (source, optimize):
+    assembler = uaAssembler.Assembler(optimize)
+    program = assembler.assemble(source)
+    stdout = io.BytesIO()
+    machine = uaEmulator.Machine(io.BytesIO(), stdout)
+    machine.loadProgram(uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint()))
+    machine.run()
+    return len(program), machine, stdout.getvalue(), assembler.optimizations
+
+def main ():
+    # More than 400 iterations take the window of the stream read kernel around the end of memory
+    # and over the code, which the optimizer changes.
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    totals = [0, 0, 0, 0]
+    rewrites = dict.fromkeys(uaAssembler.peepholeRewrites, 0)
+    print("{:<24}{:>10}{:>10}{:>14}{:>14}".format("program", "bytes", "-O", "instructions", "-O"))
+    for name, source in corpus(iterations):
+        size, machine, output, unused = run(source, False)
+        optimizedSize, optimized, optimizedOutput, counts = run(source, True)
+        if ((machine.exitCode, output, machine.dataPool[0x80:])
+                != (optimized.exitCode, optimizedOutput, optimized.dataPool[0x80:])):
+            print("{}: the optimized program does something else.".format(name))
+            exit()
+        for rewrite, count in counts.items():
+            rewrites[rewrite] += count
+        results = (size, optimizedSize, machine.instructionCount, optimized.instructionCount)
+        totals = [total + result for total, result in zip(totals, results)]
+        print("{:<24}{:>10,}{:>10,}{:>14,}{:>14,}".format(name, *results))
+    print("{:<24}{:>10,}{:>10,}{:>14,}{:>14,}".format("total", *totals))
+    print("{:<24}{:>20.1%}{:>28.1%}".format("saved", 1 - totals[1] / totals[0], 1 - totals[3] / totals[2]))
+    print("rewrites: {}".format(", ".join("{} {}".format(count, rewrite) for rewrite, count in rewrites.items())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Measures the overhead of the profiler; how much longer a program takes to run under
+# Profiler.run than under the emulator's interpreter. Both must execute the same number of
+# instructions and exit with the same code.
+#
+# usage: python profilerBenchmark.py [loop iterations per kernel]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+import uaProfiler
+
+kernels = {
+    # A tight loop with no calls; the per-instruction cost of profiling.
+    "loop": """
+:main:
+    mode    sInt    dword
+    mov     p00     0dd0
+:loop:
+    add     p00     0bd1
+    xor     p04     p00
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+""",
+    # A loop calling a short routine which calls another; the cost of tracking call stacks.
+    "calls": """
+:main:
+    mode    sInt    dword
+    mov     p00     0dd0
+:loop:
+    call    outer
+    add     p00     0bd1
+    cmp     p00     0dd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+:outer:
+    call    inner
+    ret
+:inner:
+    xor     p04     p00
+    ret
+""",
+}
+
+def buildKernel (source, iterations):
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(source.format(iterations=iterations))
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+# Run an image with 'run', a function taking the machine, and return the best time of 3 and the
+# machine of the last run.
+def timeRun (image, run):
+    best = None
+    for _ in range(3):
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        run(machine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, machine
+
+def main ():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    print("{:<10}{:>14}{:>14}{:>14}{:>10}".format("kernel", "instructions", "interpreter", "profiler", "overhead"))
+    for name, source in kernels.items():
+        image = buildKernel(source, iterations)
+        interpreterTime, interpreted = timeRun(image, lambda m: m.run())
+        profilerTime, profiled = timeRun(image, lambda m: uaProfiler.Profiler().run(m))
+        if (interpreted.exitCode, interpreted.instructionCount) != (profiled.exitCode, profiled.instructionCount):
+            print("{}: the profiler and the interpreter disagree.".format(name))
+            exit()
+        print("{:<10}{:>14,}{:>12.3f} s{:>12.3f} s{:>9.0f}%".format(
+            name, interpreted.instructionCount, interpreterTime, profilerTime,
+            (profilerTime / interpreterTime - 1) * 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Measures the time to assemble a small source file three ways: by starting the assembler, by
+# starting uaClient.py to send it to a running uaServer.py, and by sending the request from a
+# process which is already running, which is the time a build tool talking to the server itself
+# waits. The source is edited between requests so that the server's response cache doesn't
+# answer them, and the outputs are checked against each other.
+#
+# usage: python serverBenchmark.py [requests]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, directory)
+import uaClient
+
+sourceTemplate = """
+:main:
+    mode    sInt    word
+    mov     p00     0wd{count}
+:loop:
+    sub     p00     0wd1
+    cmp     p00     0wd0
+    sfl     ZF      loop
+    outs    message
+    exit    0bx01
+:message:
+    dm "done" 0bx0A 0bx00
+"""
+
+def best (times):
+    return min(times) * 1000, sum(times) / len(times) * 1000
+
+def main ():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as temporary:
+        socketPath = os.path.join(temporary, "server.sock")
+        sourcePath = os.path.join(temporary, "small.uas")
+        assemblerOutput = os.path.join(temporary, "assembler.bin")
+        clientOutput = os.path.join(temporary, "client.bin")
+        server = subprocess.Popen([sys.executable, os.path.join(directory, "uaServer.py"), "--socket", socketPath],
+                                  stderr=subprocess.DEVNULL)
+        try:
+            # Wait for the server to start listening.
+            while not os.path.exists(socketPath):
+                time.sleep(0.01)
+
+            coldTimes = []
+            clientTimes = []
+            requestTimes = []
+            for i in range(count):
+                with open(sourcePath, "w") as f:
+                    f.write(sourceTemplate.format(count=i + 1))
+
+                start = time.perf_counter()
+                subprocess.run([sys.executable, os.path.join(directory, "UA assembler.py"), sourcePath, assemblerOutput],
+                               check=True, stdout=subprocess.DEVNULL)
+                coldTimes.append(time.perf_counter() - start)
+
+                with open(sourcePath, "w") as f:
+                    f.write(sourceTemplate.format(count=i + 1) + "// client\n")
+                start = time.perf_counter()
+                subprocess.run([sys.executable, os.path.join(directory, "uaClient.py"), "--socket", socketPath,
+                                sourcePath, clientOutput], check=True, stdout=subprocess.DEVNULL)
+                clientTimes.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                response = uaClient.request(socketPath, {"source": sourceTemplate.format(count=i + 1) + "// request\n"})
+                requestTimes.append(time.perf_counter() - start)
+
+                with open(assemblerOutput, "rb") as f, open(clientOutput, "rb") as g:
+                    if f.read() != g.read() or not response["ok"]:
+                        print("The assembler and the server disagree.")
+                        exit()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print("{:<40}{:>12}{:>12}".format("{} small files".format(count), "best", "mean"))
+    for name, times in (("start the assembler", coldTimes), ("start uaClient.py", clientTimes),
+                        ("request from a running process", requestTimes)):
+        print("{:<40}{:>9.2f} ms{:>9.2f} ms".format(name, *best(times)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Measures starting machines from a snapshot instead of loading the image and running a program's
+# set-up every time: the time to restore a snapshot into a new machine (forkMachine) and into an
+# existing one, the size of the snapshot and the memory each forked machine takes. A fork must run
+# the rest of the program to the same state as the machine the snapshot was taken of.
+#
+# usage: python snapshotBenchmark.py [forks]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+import uaSnapshot
+
+# Sets up a stack frame and the memory window and fills a table, then sums the table.
+programSource = """
+:main:
+    alloc   0bx80
+    mw      @ap
+    mode    sInt    word
+    mov     ar0     0x1000
+    mov     w00     0wd0
+:fill:
+    mov     @ar0    w00
+    add     w00     0wd3
+    add     ar0     0wd2
+    cmp     ar0     0x1800
+    sfl     ZF      fill
+:start:
+    mov     ar0     0x1000
+:sum:
+    add     p00     @ar0
+    add     ar0     0wd2
+    cmp     ar0     0x1100
+    sfl     ZF      sum
+    exit    0bx01
+"""
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+def best (function, repeats = 200):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main ():
+    forks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(programSource)
+    image = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    setUpEnd = assembler.labels()["start"]
+
+    # Count the instructions of the set-up, up to the start label.
+    machine = uaEmulator.Machine()
+    machine.loadProgram(image)
+    while machine.ip != setUpEnd:
+        machine.run(1)
+    setUpInstructions = machine.instructionCount
+
+    def setUp ():
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        machine.run(setUpInstructions)
+        return machine
+
+    machine = setUp()
+    data = uaSnapshot.packSnapshot(machine.snapshot())
+    snapshot = uaSnapshot.readSnapshot(data)
+    fork = uaEmulator.forkMachine(snapshot)
+    machine.run()
+    fork.run()
+    if machineState(machine) != machineState(fork):
+        print("The fork and the machine it was forked from disagree.")
+        exit()
+
+    existing = uaEmulator.Machine()
+    times = [
+        ("load the image and run the set-up", best(setUp, 10)),
+        ("read the snapshot", best(lambda: uaSnapshot.readSnapshot(data))),
+        ("fork a new machine", best(lambda: uaEmulator.forkMachine(snapshot))),
+        ("restore into an existing machine", best(lambda: existing.restore(snapshot))),
+    ]
+    for name, seconds in times:
+        print("{:<40}{:>10.1f} us".format(name, seconds * 1e6))
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    machines = [uaEmulator.forkMachine(snapshot) for _ in range(forks)]
+    perFork = (tracemalloc.get_traced_memory()[0] - before) / len(machines)
+    tracemalloc.stop()
+    print("{:<40}{:>10,} bytes, {:,} of memory and data-pool".format("snapshot", len(data), len(snapshot.memory) + 256))
+    print("{:<40}{:>10,.0f} bytes".format("memory per forked machine", perFork))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Measures the peak memory and time of assembling sources which are mostly a large dm table,
+# in memory and streamed with Assembler.assembleStream, for tables of increasing size. Memory is
+# the peak of the allocations tracemalloc sees while the source file is read and assembled and
+# the image is written. Both ways must write the same image.
+#
+# usage: python streamBenchmark.py
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaImage
+
+# A short program which sums a table, followed by the table; 16 bytes per dm line.
+programHeader = """
+:main:
+    mode    sInt    byte
+    mov     ar0     table
+    mov     ar1     0wd0
+:loop:
+    add     p00     @ar0
+    add     ar0     0wd1
+    add     ar1     0wd1
+    cmp     ar1     0wd{size}
+    sfl     ZF      loop
+    exit    0bx01
+:table:
+"""
+
+def writeSource (path, tableLines):
+    with open(path, "w") as f:
+        f.write(programHeader.format(size=tableLines * 16))
+        for i in range(tableLines):
+            values = " ".join("0bd{}".format((i * 16 + j) % 128) for j in range(16))
+            f.write("    dm {}    // row {} of the generated table\n".format(values, i))
+
+def assembleInMemory (sourcePath, outputPath):
+    with open(sourcePath) as f:
+        sourceCode = f.read()
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(sourceCode)
+    with open(outputPath, "wb") as f:
+        f.write(uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint()))
+
+def assembleStreamed (sourcePath, outputPath):
+    with open(sourcePath) as source, open(outputPath, "w+b") as f:
+        uaAssembler.Assembler().assembleStream(source, f)
+
+# Returns the time and the peak memory allocated of assembling a source one way.
+def measure (assemble, sourcePath, outputPath):
+    start = time.perf_counter()
+    assemble(sourcePath, outputPath)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        assemble(sourcePath, outputPath)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+def main ():
+    print("{:>10}{:>14}{:>16}{:>12}{:>16}{:>12}".format(
+        "table", "source", "in memory", "time", "streamed", "time"))
+    with tempfile.TemporaryDirectory() as directory:
+        sourcePath = os.path.join(directory, "table.uas")
+        memoryOutput = os.path.join(directory, "memory.bin")
+        streamOutput = os.path.join(directory, "stream.bin")
+        for tableLines in (64, 256, 1024, 4000):
+            writeSource(sourcePath, tableLines)
+            memoryTime, memoryPeak = measure(assembleInMemory, sourcePath, memoryOutput)
+            streamTime, streamPeak = measure(assembleStreamed, sourcePath, streamOutput)
+            with open(memoryOutput, "rb") as f, open(streamOutput, "rb") as g:
+                if f.read() != g.read():
+                    print("The streamed image differs.")
+                    exit()
+            print("{:>8} B{:>12,} B{:>14,} B{:>10.3f} s{:>14,} B{:>10.3f} s".format(
+                tableLines * 16, os.path.getsize(sourcePath), memoryPeak, memoryTime, streamPeak, streamTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# Checks the tracer and measures what tracing costs. The programs of the other benchmarks are
+# traced and must leave the machine in the same state as '-e blocks'. A program which reads
+# console lines and a file is recorded and replayed with the console input and the file gone; the
+# replay must trace the same instructions, and the writes to its input buffer must be the 'in'
+# instructions which filled it. Then a loop is run by the interpreter, '-e blocks', the tracer
+# keeping the last records, the tracer writing every record to a file, and a tracer which prints
+# each instruction to a text file as a baseline.
+#
+# usage: python traceBenchmark.py [loop iterations]
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+import uaTrace
+
+import debuggerBenchmark
+import peepholeBenchmark
+
+inputSource = """
+:main:
+    mode    sInt    byte
+    mov     ar1     0wd0
+:lines:
+    in      0x4000  0x400F
+    mov     ar0     0x4000
+    xor     p00     @ar0
+    xor     p01     @ar0+1
+    add     ar1     0wd1
+    cmp     ar1     0wd{lines}
+    sfl     ZF      lines
+    IOchan  file
+    in      0x5000  0x50FF
+    mov     ar0     0x5000
+    xor     p00     @ar0+3
+    IOchan  0
+    mov     @ar0    p00
+    exit    0bx01
+// File names have to be above address 255, which is reserved for other channels.
+:padding:
+{padding}
+:file:
+    dm "input.dat" 0bx00
+"""
+
+def buildImage (source):
+    assembler = uaAssembler.Assembler()
+    program = assembler.assemble(source)
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+
+def machineState (m):
+    return (bytes(m.memory), bytes(m.dataPool), m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3,
+            m.exitCode, m.instructionCount)
+
+def checkPrograms ():
+    for name, source in peepholeBenchmark.corpus(200):
+        image = buildImage(source)
+        reference = uaEmulator.Machine(io.BytesIO(), io.BytesIO())
+        reference.loadProgram(image)
+        reference.runBlocks()
+        machine = uaEmulator.Machine(io.BytesIO(), io.BytesIO())
+        machine.loadProgram(image)
+        tracer = uaTrace.Tracer(capacity=1000)
+        tracer.run(machine)
+        trace = uaTrace.readTrace(tracer.finish(machine))
+        if machineState(machine) != machineState(reference):
+            print("Tracing {} leaves the machine in another state than '-e blocks'.".format(name))
+            exit(1)
+        if (trace.instructions, trace.exitCode, len(trace)) != (reference.instructionCount, reference.exitCode,
+                                                                 min(reference.instructionCount, 1000)):
+            print("The trace of {} doesn't end where the program did.".format(name))
+            exit(1)
+    print("Traced programs leave the machine in the same state as '-e blocks'.")
+
+def checkReplay (directory, lines = 20):
+    image = buildImage(inputSource.format(lines=lines, padding="    dm" + " 0qx0" * 32))
+    stdin = io.BytesIO(b"".join(b"line %d of the console input\n" % i for i in range(lines)))
+    path = os.path.join(directory, "input.dat")
+    with open(path, "wb") as f:
+        f.write(bytes(range(256)))
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        machine = uaEmulator.Machine()
+        machine.io = uaTrace.RecordingIO(stdin, io.BytesIO())
+        machine.loadProgram(image)
+        tracer = uaTrace.Tracer(capacity=16)
+        tracer.run(machine)
+        machine.io.close()
+        recorded = uaTrace.readTrace(tracer.finish(machine))
+        os.remove(path)
+
+        replayMachine = uaEmulator.Machine()
+        replayMachine.io = uaTrace.ReplayIO(recorded.inputs)
+        replayMachine.loadProgram(image)
+        tracer = uaTrace.Tracer(capacity=16)
+        tracer.run(replayMachine)
+        replayed = uaTrace.readTrace(tracer.finish(replayMachine))
+    finally:
+        os.chdir(cwd)
+    if machineState(replayMachine) != machineState(machine) or bytes(replayed.records) != bytes(recorded.records):
+        print("The replay of the input program differs from the recorded run.")
+        exit(1)
+
+    # Every record of the whole run this time, to look for the writes to the input buffer in.
+    machine = uaEmulator.Machine()
+    machine.io = uaTrace.ReplayIO(recorded.inputs)
+    machine.loadProgram(image)
+    tracer = uaTrace.Tracer()
+    tracer.run(machine)
+    trace = uaTrace.readTrace(tracer.finish(machine))
+    writes = trace.writes(uaTrace.writeMemory, 0x4001)
+    numpy = uaTrace.numpy
+    try:
+        uaTrace.numpy = None
+        plainWrites = trace.writes(uaTrace.writeMemory, 0x4001)
+    finally:
+        uaTrace.numpy = numpy
+    inIndexes = [index for index in range(len(trace)) if trace.record(index)[1] >> 3 == uaEmulator.op_codes.iIn]
+    if writes != plainWrites or writes != inIndexes[:lines]:
+        print("The writes to the input buffer aren't the 'in' instructions which read the console.")
+        exit(1)
+    print("The input program replays the same without its input; {} inputs, {} writes to its buffer.".format(
+        len(recorded.inputs), len(writes)))
+
+# The naive way: a line of text for every instruction.
+def textTrace (m, file):
+    cache = m.blockCache = uaEmulator.BlockCache()
+    count = 0
+    try:
+        while not m.halted:
+            block = cache.blocks.get(m.ip) or cache.build(m, m.ip)
+            for i, instruction in enumerate(block.instructions):
+                if m.pendingError is not None and not instruction.testsErrorFlag:
+                    m.halt(m.pendingError)
+                    return
+                m.ip = instruction.nextAddress
+                try:
+                    instruction.handler(m, instruction)
+                finally:
+                    operands = " ".join(str(arg) for unused, arg in instruction.operands)
+                    print("{:04X} {} {} flg {:04X}".format(instruction.address, uaEmulator.opCodeNames[instruction.opCode],
+                                                          operands, m.flg), file=file)
+                count += 1
+                if block.writesMemory[i] and not block.valid:
+                    break
+    except uaEmulator.Halt as halt:
+        count += 1
+        m.halt(halt.exitCode)
+    finally:
+        m.instructionCount += count
+
+def timeRun (image, run):
+    best = None
+    for _ in range(3):
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        start = time.perf_counter()
+        run(machine)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, machine
+
+def main ():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    checkPrograms()
+    with tempfile.TemporaryDirectory() as directory:
+        checkReplay(directory)
+
+        def ring (machine):
+            tracer = uaTrace.Tracer()
+            tracer.run(machine)
+            tracer.finish(machine)
+
+        def spill (machine):
+            with open(os.path.join(directory, "trace.uat"), "wb") as f:
+                tracer = uaTrace.Tracer(f)
+                tracer.run(machine)
+                tracer.finish(machine)
+
+        def text (machine):
+            with open(os.path.join(directory, "trace.txt"), "w") as f:
+                textTrace(machine, f)
+
+        image = buildImage(debuggerBenchmark.programSource.format(iterations=iterations))
+        runs = (("interpreter", uaEmulator.Machine.run), ("-e blocks", uaEmulator.Machine.runBlocks),
+                ("tracer, last records", ring), ("tracer, to a file", spill), ("text trace", text))
+        results = []
+        reference = None
+        for name, run in runs:
+            seconds, machine = timeRun(image, run)
+            if reference is None:
+                reference = machineState(machine)
+            elif machineState(machine) != reference:
+                print("The {} run leaves the machine in another state than the interpreter.".format(name))
+                exit(1)
+            results.append((name, seconds))
+        blocksSeconds = results[1][1]
+        print("{:<24}{:>10}{:>14}".format("run", "MIPS", "vs blocks"))
+        for name, seconds in results:
+            print("{:<24}{:>10.2f}{:>13.2f}x".format(name, reference[-1] / seconds / 1e6, seconds / blocksSeconds))
+        size = os.path.getsize(os.path.join(directory, "trace.uat"))
+        textSize = os.path.getsize(os.path.join(directory, "trace.txt"))
+        print("Trace file: {:,} bytes; text trace: {:,} bytes.".format(size, textSize))
+
+if __name__ == "__main__":
+    main()
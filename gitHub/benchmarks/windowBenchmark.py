@@ -0,0 +1,106 @@
+# Measures the cost of the mw instruction in loops which move the memory window every iteration,
+# comparing the emulator's moveWindow() with the one it replaced, which always wrote back and read
+# the whole window. Both must leave the machine in the same state.
+#
+# usage: python windowBenchmark.py [loop iterations per kernel]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import uaAssembler
+import uaEmulator
+import uaImage
+
+# Every kernel maps the window at 0x1000 and runs its loop body 'iterations' times, counting in ar0.
+kernelLoop = """
+:main:
+    mode    sInt    byte
+    mov     ar0     0wd0
+    mw      0wx1000
+:loop:
+{body}
+    add     ar0     0wd1
+    cmp     ar0     0wd{iterations}
+    sfl     ZF      loop
+    exit    0bx01
+"""
+
+kernels = {
+    # Sum a stream of memory into the parameter space, the SIMD streaming idiom.
+    "stream read": """
+    add     psg0    wsg0
+    add     psg1    wsg1
+    mw      wl+128
+""",
+    # A window sliding back and forth over the same memory, updating a single byte every step.
+    "sparse write": """
+    xor     w00     0bx01
+    mw      0wx1040
+    xor     w00     0bx01
+    mw      0wx1000
+""",
+    # Refresh the window in place, as after calling a function that works on the same memory.
+    "same place": """
+    add     p00     w10
+    mw      @wl
+""",
+    # Every byte of the window changes, so all of it has to be written back.
+    "full write": """
+    xor     wsg0    0bx5A
+    xor     wsg1    0bxA5
+    mw      0wx1080
+    xor     wsg0    0bx5A
+    xor     wsg1    0bxA5
+    mw      0wx1000
+""",
+}
+
+# The moveWindow() the emulator used before dirty bytes were tracked; kept as the baseline.
+def legacyMoveWindow (m, newLocation):
+    m.store(m.wl, m.dataPool[0:uaEmulator.windowSize])
+    m.wl = newLocation
+    m.dataPool[0:uaEmulator.windowSize] = m.load(newLocation, uaEmulator.windowSize)
+    m.windowBytesWritten += uaEmulator.windowSize
+    m.windowBytesRead += uaEmulator.windowSize
+
+def buildKernel (body, iterations):
+    program = uaAssembler.assemble(kernelLoop.format(body=body, iterations=iterations))
+    return uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], 0)
+
+def timeKernel (image, moveWindow, repeats = 5):
+    uaEmulator.moveWindow = moveWindow
+    best = None
+    for _ in range(repeats):
+        machine = uaEmulator.Machine()
+        machine.loadProgram(image)
+        for address in range(0x1000, uaEmulator.memorySize, 0x100):
+            machine.memory[address] = address >> 8 & 0xFF
+        start = time.perf_counter()
+        machine.runBlocks()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, machine
+
+def main ():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    currentMoveWindow = uaEmulator.moveWindow
+
+    print("{:<14}{:>12}{:>12}{:>10}{:>16}{:>16}".format(
+        "kernel", "before", "after", "speedup", "bytes before", "bytes after"))
+    for name, body in kernels.items():
+        image = buildKernel(body, iterations)
+        legacyTime, legacyMachine = timeKernel(image, legacyMoveWindow)
+        newTime, newMachine = timeKernel(image, currentMoveWindow)
+        if (legacyMachine.memory != newMachine.memory or legacyMachine.dataPool != newMachine.dataPool
+                or legacyMachine.exitCode != newMachine.exitCode):
+            print("The two versions of moveWindow() disagree on the {} kernel.".format(name))
+            exit()
+        legacyTraffic = legacyMachine.windowBytesWritten + legacyMachine.windowBytesRead
+        newTraffic = newMachine.windowBytesWritten + newMachine.windowBytesRead
+        print("{:<14}{:>10.3f} s{:>10.3f} s{:>9.2f}x{:>16,}{:>16,}".format(
+            name, legacyTime, newTime, legacyTime / newTime, legacyTraffic, newTraffic))
+    uaEmulator.moveWindow = currentMoveWindow
+
+if __name__ == "__main__":
+    main()
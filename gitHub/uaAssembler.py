@@ -0,0 +1,17 @@
+# The assembler lives in "UA assembler.py" so that it can be run directly, but the space in that
+# file name keeps it from being imported with an import statement. Other modules (the benchmarks,
+# and later the emulator and tools built around it) import it through this module instead:
+#
+#     import uaAssembler
+#     program = uaAssembler.Assembler().assemble(sourceCode)
+import importlib.util
+import os
+import sys
+
+assemblerPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "UA assembler.py")
+spec = importlib.util.spec_from_file_location(__name__, assemblerPath)
+module = importlib.util.module_from_spec(spec)
+# Replace this module with the assembler itself before running it so that anything importing
+# uaAssembler, including the assembler's own code, sees a single copy of its global state.
+sys.modules[__name__] = module
+spec.loader.exec_module(module)
@@ -0,0 +1,104 @@
+# A client for the resident assembler of uaServer.py. It takes the same arguments as the
+# assembler's command line, sends the source file to the server and writes what it gets back, so
+# a build can call it once per file instead of starting the assembler every time. It imports
+# nothing of the assembler, so it starts as fast as Python does. Errors in the source code are
+# printed like the assembler prints them and the client exits with status 1.
+#
+# With '--start' the client starts a server in the background if none is listening yet.
+#
+# usage: python uaClient.py source.uas program.bin [-f bin|hex] [-c] [-m program.map] [-O] [--socket path] [--start]
+import argparse
+import base64
+import json
+import os
+import socket
+import sys
+
+# The same as uaServer.defaultSocketPath, which isn't imported because that imports the assembler.
+def defaultSocketPath ():
+    return os.environ.get("UA_ASSEMBLER_SOCKET",
+                          os.path.join(os.environ.get("TMPDIR", "/tmp"), "uaAssembler-{}.sock".format(os.getuid())))
+
+def connect (path, start):
+    try:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(path)
+        return client
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not start:
+            raise
+    # Only imported when needed, to keep the client quick to start.
+    import subprocess
+    import time
+    server = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uaServer.py")
+    subprocess.Popen([sys.executable, server, "--socket", path], stdin=subprocess.DEVNULL,
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    # Wait for the server to start listening.
+    for _ in range(100):
+        time.sleep(0.05)
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            return client
+        except (FileNotFoundError, ConnectionRefusedError):
+            pass
+    raise ConnectionRefusedError("The server didn't start listening on {}.".format(path))
+
+# Send a request to a server and return its response.
+def request (path, message, start = False):
+    with connect(path, start) as client:
+        client.sendall((json.dumps(message) + "\n").encode())
+        with client.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("The server closed the connection without responding.")
+    return json.loads(line)
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Assemble a UA assembly source file with a resident assembler.")
+    argParser.add_argument("source", help="the source file containing main")
+    argParser.add_argument("output", help="the file to write the assembled program to")
+    argParser.add_argument("-f", "--format", choices=("bin", "hex"), default="bin",
+                           help="write a binary image (the default) or the program as hex code")
+    argParser.add_argument("-c", "--object", action="store_true",
+                           help="write a relocatable object to be linked with uaLinker.py instead of a program")
+    argParser.add_argument("-m", "--map", help="also write a symbol map of the program's labels to this file")
+    argParser.add_argument("-O", "--optimize", action="store_true",
+                           help="rewrite the code to be smaller and faster with the peephole optimizer")
+    argParser.add_argument("--socket", default=defaultSocketPath(),
+                           help="the server's Unix socket (default: {})".format(defaultSocketPath()))
+    argParser.add_argument("--start", action="store_true", help="start a server if none is running")
+    args = argParser.parse_args()
+
+    try:
+        with open(args.source, "r") as f:
+            sourceCode = f.read()
+    except OSError as error:
+        print("Could not read {}: {}".format(args.source, error), file=sys.stderr)
+        exit(1)
+
+    message = {"source": sourceCode, "format": "object" if args.object else args.format, "map": args.map is not None,
+               "optimize": args.optimize}
+    try:
+        response = request(args.socket, message, args.start)
+    except (OSError, ValueError) as error:
+        print("Could not reach the assembler server on {}: {}".format(args.socket, error), file=sys.stderr)
+        exit(1)
+
+    if not response["ok"]:
+        if "text" in response:
+            print(response["text"])
+        else:
+            for error in response["errors"]:
+                print("{} error on line {}. {}".format(error["type"], error["line"], error["message"]))
+        exit(1)
+
+    with open(args.output, "wb") as f:
+        f.write(base64.b64decode(response["output"]))
+    if args.map:
+        with open(args.map, "w") as f:
+            f.write(response["map"])
+    print("Assembler output written to {}.".format(args.output))
+
+if __name__ == "__main__":
+    main()
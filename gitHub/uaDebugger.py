@@ -0,0 +1,313 @@
+# This program runs a UA program in the emulator until it reaches a breakpoint or a watchpoint
+# sees a value change, then reports where it stopped and the machine's registers. Breakpoints
+# stop before the instruction at an address is executed. Watchpoints stop after an instruction
+# changes the bytes of a memory range, data-pool bytes or a register; memory is what's in memory,
+# so data in the memory window only changes it when the window is written back. Given a symbol
+# map (see uaImage.py) addresses can be given and are reported as label names, e.g. 'loop+0x0C'.
+#
+#     -b ADDRESS          a breakpoint; an address like 0x01A4 or a label, optionally plus an
+#                         offset like loop+0x0C
+#     -w REGISTER         a register watchpoint: sp, ap, wl, flg, rs, ar0, ar1, ar2 or ar3
+#     -w POOL[:SIZE]      a data-pool watchpoint on SIZE bytes (default 1) from w00-w7F or p00-p7F
+#     -w ADDRESS[:SIZE]   a memory watchpoint on SIZE bytes (default 1) from an address or label
+#
+# Overhead: like the profiler, the debugger runs the program with its own loop, so the emulator's
+# loops have no hooks in them. With nothing armed, Debugger.run hands the machine to the engine it
+# was asked for and costs nothing. Armed, it runs basic blocks out of the machine's BlockCache
+# like '-e blocks'. Breakpoints don't cost a check per instruction; every block is marked once
+# with the indexes of the instructions in it that have breakpoints (Block.breakpoints), and a
+# marked block is only run up to its first one. Memory watchpoints are compared after the
+# instructions which can write to memory and the others after every instruction (see
+# benchmarks/debuggerBenchmark.py.)
+#
+# usage: python uaDebugger.py program.bin [-m program.map] [-b address]... [-w watch]... [-c stops] [-e engine] [-n max instructions] [--save-snapshot file]
+import argparse
+import sys
+
+import uaEmulator
+import uaImage
+import uaProfiler
+import uaSnapshot
+
+Halt = uaEmulator.Halt
+
+watchableRegisters = ("sp", "ap", "wl", "flg", "rs", "ar0", "ar1", "ar2", "ar3")
+
+# Parse an address; a number, or a label of 'symbols' optionally followed by '+' and an offset.
+def parseAddress (text, symbols):
+    name, plus, offset = text.partition("+")
+    try:
+        if name in symbols:
+            address = symbols[name]
+        else:
+            address = int(name, 0)
+        if plus:
+            address += int(offset, 0)
+    except ValueError:
+        raise ValueError("'{}' is not an address or a label in the symbol map.".format(text))
+    return address & 0xFFFF
+
+# A watched memory range, data-pool range or register. 'value' is what it held when it was last
+# looked at.
+class Watchpoint:
+    def __init__(self, name, kind, address = 0, size = 0):
+        self.name = name
+        self.kind = kind
+        self.address = address
+        self.size = size
+        self.value = None
+
+    def read (self, m):
+        if self.kind == "register":
+            return getattr(m, self.name)
+        if self.kind == "pool":
+            return bytes(m.dataPool[self.address:self.address + self.size])
+        return bytes(m.load(self.address, self.size))
+
+    def format (self, value):
+        if self.kind == "register":
+            return "0x{:0{}X}".format(value, 2 if self.name == "rs" else 4)
+        return value.hex(" ").upper()
+
+# Parse a watchpoint; a register name, a data-pool operand or a memory address, the last two
+# optionally followed by ':' and a number of bytes.
+def parseWatchpoint (text, symbols):
+    if text in watchableRegisters:
+        return Watchpoint(text, "register")
+    location, colon, size = text.partition(":")
+    try:
+        size = int(size, 0) if colon else 1
+    except ValueError:
+        raise ValueError("'{}' is not a number of bytes.".format(size))
+    if size < 1:
+        raise ValueError("A watchpoint must watch at least one byte.")
+    if len(location) == 3 and location[0] in "wp":
+        try:
+            offset = int(location[1:], 16)
+        except ValueError:
+            offset = None
+        if offset is not None and offset < uaEmulator.windowSize:
+            address = offset + (uaEmulator.windowSize if location[0] == "p" else 0)
+            if address + size > uaSnapshot.dataPoolSize:
+                raise ValueError("The watchpoint {} runs past the end of the data-pool.".format(text))
+            return Watchpoint(text, "pool", address, size)
+    return Watchpoint(text, "memory", parseAddress(location, symbols), size)
+
+# Why the debugger stopped: at a breakpoint, before the instruction at 'address', or because
+# 'watchpoint' changed from 'old' to 'new' when the instruction at 'address' was executed.
+class Stop:
+    def __init__(self, address, watchpoint = None, old = None, new = None):
+        self.address = address
+        self.watchpoint = watchpoint
+        self.old = old
+        self.new = new
+
+    def describe (self, symbols):
+        where = "{} ({:04X})".format(symbols.name(self.address), self.address)
+        if self.watchpoint is None:
+            return "Breakpoint at {}".format(where)
+        watchpoint = self.watchpoint
+        return "Watchpoint {} changed from {} to {} by the instruction at {}".format(
+            watchpoint.name, watchpoint.format(self.old), watchpoint.format(self.new), where)
+
+class Debugger:
+    def __init__(self, engine = "interpreter"):
+        self.engine = engine
+        self.breakpoints = set()
+        self.watchpoints = []
+        self.stop = None
+        self.cache = None
+
+    def addBreakpoint (self, address):
+        self.breakpoints.add(address & 0xFFFF)
+        self.unmarkBlocks()
+
+    def removeBreakpoint (self, address):
+        self.breakpoints.discard(address & 0xFFFF)
+        self.unmarkBlocks()
+
+    def addWatchpoint (self, watchpoint):
+        self.watchpoints.append(watchpoint)
+
+    # Forget the marks of the blocks in the cache, after the breakpoints have changed.
+    def unmarkBlocks (self):
+        if self.cache is not None:
+            for block in self.cache.blocks.values():
+                block.breakpoints = None
+
+    def markBlock (self, block):
+        breakpoints = self.breakpoints
+        block.breakpoints = tuple(i for i, instruction in enumerate(block.instructions)
+                                  if instruction.address in breakpoints)
+        return block.breakpoints
+
+    # Compare the watchpoints in 'watchpoints' with the values they last held. Returns a Stop for
+    # the first that changed.
+    def checkWatchpoints (self, m, watchpoints, address):
+        for watchpoint in watchpoints:
+            value = watchpoint.read(m)
+            if value != watchpoint.value:
+                old = watchpoint.value
+                watchpoint.value = value
+                return Stop(address, watchpoint, old, value)
+        return None
+
+    # Run a machine until it halts, stops at a breakpoint or watchpoint, or has executed
+    # maxInstructions instructions. Returns the exit code, or None if the program is still
+    # running, in which case 'stop' tells why if it stopped for the debugger. Running on after
+    # stopping at a breakpoint executes the instruction at it.
+    def run (self, m, maxInstructions = None):
+        resumeAddress = None
+        if self.stop is not None and self.stop.watchpoint is None and self.stop.address == m.ip:
+            resumeAddress = m.ip
+        self.stop = None
+        if not self.breakpoints and not self.watchpoints:
+            return uaEmulator.engines[self.engine](m, maxInstructions)
+
+        if m.blockCache is None:
+            m.blockCache = uaEmulator.BlockCache()
+        if m.blockCache is not self.cache:
+            self.cache = m.blockCache
+            self.unmarkBlocks()
+        cache = self.cache
+        blocks = cache.blocks
+        memoryWatchpoints = [watchpoint for watchpoint in self.watchpoints if watchpoint.kind == "memory"]
+        otherWatchpoints = [watchpoint for watchpoint in self.watchpoints if watchpoint.kind != "memory"]
+        for watchpoint in self.watchpoints:
+            watchpoint.value = watchpoint.read(m)
+        checkWatchpoints = self.checkWatchpoints
+        stop = None
+        count = 0
+        try:
+            while not m.halted:
+                remaining = maxInstructions - count if maxInstructions is not None else sys.maxsize
+                if remaining <= 0:
+                    break
+                block = blocks.get(m.ip)
+                if block is None:
+                    cache.misses += 1
+                    block = cache.build(m, m.ip)
+                else:
+                    cache.hits += 1
+                instructions = block.instructions
+                marks = block.breakpoints
+                if marks is None:
+                    marks = self.markBlock(block)
+                end = len(instructions)
+                if marks:
+                    end = marks[0]
+                    if end == 0 and block.start == resumeAddress:
+                        end = marks[1] if len(marks) > 1 else len(instructions)
+                    if end == 0:
+                        stop = Stop(block.start)
+                        break
+                resumeAddress = None
+                if end > remaining:
+                    end = remaining
+                writesMemory = block.writesMemory
+                for i in range(end):
+                    instruction = instructions[i]
+                    if m.pendingError is not None and not instruction.testsErrorFlag:
+                        m.halt(m.pendingError)
+                        return m.exitCode
+                    m.ip = instruction.nextAddress
+                    instruction.handler(m, instruction)
+                    count += 1
+                    if otherWatchpoints:
+                        stop = checkWatchpoints(m, otherWatchpoints, instruction.address)
+                    if memoryWatchpoints and writesMemory[i] and stop is None:
+                        stop = checkWatchpoints(m, memoryWatchpoints, instruction.address)
+                    if stop is not None or writesMemory[i] and not block.valid:
+                        break
+                else:
+                    if end < len(instructions) and end < remaining:
+                        stop = Stop(instructions[end].address)
+                if stop is not None:
+                    break
+        except Halt as halt:
+            count += 1
+            m.halt(halt.exitCode)
+        finally:
+            m.instructionCount += count
+            self.stop = stop
+        return m.exitCode
+
+def formatRegisters (m):
+    return "ip {:04X}  sp {:04X}  ap {:04X}  wl {:04X}  flg {:04X}  rs {:02X}  ar0 {:04X}  ar1 {:04X}  ar2 {:04X}  ar3 {:04X}".format(
+        m.ip, m.sp, m.ap, m.wl, m.flg, m.rs, m.ar0, m.ar1, m.ar2, m.ar3)
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Run a UA program up to breakpoints and watchpoints.")
+    argParser.add_argument("program", help="a binary image or hex code written by the assembler, or a snapshot")
+    argParser.add_argument("-m", "--map", help="a symbol map of the program, to give and report addresses by label")
+    argParser.add_argument("-b", "--break", dest="breakpoints", action="append", default=[], metavar="ADDRESS",
+                           help="stop before the instruction at this address or label")
+    argParser.add_argument("-w", "--watch", dest="watchpoints", action="append", default=[], metavar="WATCH",
+                           help="stop when a register, data-pool bytes (w00:SIZE, p00:SIZE) or memory bytes "
+                                "(ADDRESS:SIZE) change")
+    argParser.add_argument("-c", "--stops", type=int, default=1,
+                           help="report this many stops before stopping the program (default: 1)")
+    argParser.add_argument("-e", "--engine", choices=sorted(uaEmulator.engines), default="interpreter",
+                           help="how to execute the program when nothing is armed (default: interpreter)")
+    argParser.add_argument("-n", "--max-instructions", type=int, default=None,
+                           help="stop after this many instructions")
+    argParser.add_argument("--save-snapshot", metavar="FILE",
+                           help="save the machine's state to this file when it stops, to run on from there later")
+    args = argParser.parse_args()
+
+    machine = uaEmulator.Machine()
+    try:
+        with open(args.program, "rb") as f:
+            isSnapshot = uaSnapshot.isSnapshot(f.read(len(uaSnapshot.magicNumber)))
+        if isSnapshot:
+            machine.restore(uaSnapshot.loadSnapshotFile(args.program))
+        else:
+            machine.loadProgramFile(args.program)
+        symbols = {}
+        if args.map:
+            with open(args.map) as f:
+                symbols = uaImage.parseSymbolMap(f.read())
+    except (OSError, uaImage.ImageFormatError, uaSnapshot.SnapshotFormatError, ValueError) as error:
+        print("Could not load {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+
+    debugger = Debugger(args.engine)
+    try:
+        for text in args.breakpoints:
+            debugger.addBreakpoint(parseAddress(text, symbols))
+        for text in args.watchpoints:
+            debugger.addWatchpoint(parseWatchpoint(text, symbols))
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        exit(1)
+    symbols = uaProfiler.SymbolTable(symbols)
+
+    stops = 0
+    while True:
+        remaining = args.max_instructions - machine.instructionCount if args.max_instructions is not None else None
+        exitCode = debugger.run(machine, remaining)
+        if debugger.stop is None:
+            break
+        stops += 1
+        machine.io.flush()
+        print("{} after {} instructions.".format(debugger.stop.describe(symbols), machine.instructionCount),
+              file=sys.stderr)
+        print("    " + formatRegisters(machine), file=sys.stderr)
+        if stops >= args.stops:
+            break
+    if args.save_snapshot:
+        try:
+            uaSnapshot.saveSnapshotFile(args.save_snapshot, machine.snapshot())
+        except OSError as error:
+            print("Could not save the snapshot to {}: {}".format(args.save_snapshot, error), file=sys.stderr)
+            exit(1)
+    machine.io.close()
+
+    if exitCode is None:
+        if debugger.stop is None:
+            print("The program was stopped after {} instructions.".format(machine.instructionCount), file=sys.stderr)
+        exit(0)
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,457 @@
+# This program turns UA images back into assembly source code. The tables it decodes with are
+# built once from the assembler's own op_codes and oper_ID classes, read backwards, so the
+# disassembler can't disagree with the assembler about what an op-code or operand ID means.
+#
+# Code is decoded in a linear sweep from the start of every section. The length of an instruction
+# follows from its op-code, and for the instructions with operand fields, from the payload sizes
+# of the operands whose type bits are set. With NumPy the length of an instruction starting at
+# every byte of a section is worked out at once from the op-code and type bits of every byte, so
+# the sweep only has to hop from one instruction to the next. Instructions are decoded into text
+# once for every distinct sequence of bytes, since programs repeat the same few instructions over
+# and over, and in a dump of many images the decoded instructions of one are reused by the others.
+#
+# The listing assembles back into the same bytes. Anything the assembler wouldn't have written,
+# like an unused op-code or a literal as a destination, is written as 'dm' bytes, and so is an
+# instruction a label has to be placed inside of, or one whose address operand is outside the
+# section, since the assembler can only write an address operand as a label. Labels are named
+# after a symbol map written by the assembler or the linker with '-m', if one is given, and
+# otherwise after their addresses, like 'L_01A4'. The entry point is labelled main.
+#
+# The input is a binary image, a dump of many images one after another, or hex code.
+#
+# usage: python uaDisassembler.py program.bin [-m program.map] [-o listing.uas] [-a]
+import argparse
+import bisect
+import sys
+
+import uaAssembler
+import uaImage
+
+# NumPy is optional. Without it the length of each instruction is worked out as the sweep gets to it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+op_codes = uaAssembler.op_codes
+oper_ID = uaAssembler.oper_ID
+
+# The layouts of instructions, one for each of the assembler's assemble functions.
+FORMAT_OPERANDS = 0     # op-code and type bits, operand fields, payloads
+FORMAT_BYTE = 1         # exit and ret; op-code and a code byte
+FORMAT_IGN = 2          # ign; the value is in the type bits
+FORMAT_MODE = 3         # mode; op-code and a mode byte
+FORMAT_BRANCH = 4       # jfl and sfl; the branch ID is in the type bits and an address follows
+FORMAT_ADDRESS = 5      # call and inth; op-code and an address
+FORMAT_NONE = 6         # NOP
+
+assembleFuncFormats = {uaAssembler.iOneByteFunc: FORMAT_BYTE, uaAssembler.iTwoStandardOperandsFunc: FORMAT_OPERANDS,
+                       uaAssembler.iIgnFunc: FORMAT_IGN, uaAssembler.iModeFunc: FORMAT_MODE,
+                       uaAssembler.iOneStandardOperandFunc: FORMAT_OPERANDS, uaAssembler.iCmpFunc: FORMAT_OPERANDS,
+                       uaAssembler.iBranchFunc: FORMAT_BRANCH, uaAssembler.iOneWordFunc: FORMAT_ADDRESS,
+                       uaAssembler.iNOPFunc: FORMAT_NONE}
+
+# What the disassembler knows about an op-code. 'size' is the size sans payload, as in the
+# assembler. 'destinationCount' is the number of leading operands which can't be literals, which
+# the assembler's assemble functions pass to assembleStandardOperands.
+class OpCodeInfo:
+    def __init__(self, mnemonic, instruction):
+        self.mnemonic = mnemonic
+        self.format = assembleFuncFormats[instruction.assembleFunc]
+        self.size = instruction.basicSize
+        self.operandCount = self.size - 1 if self.format == FORMAT_OPERANDS else 0
+        if instruction.opCode in (op_codes.iIn, op_codes.iOut, op_codes.iCmp):
+            self.destinationCount = 0
+        elif self.operandCount == 1:
+            self.destinationCount = 1 if instruction.opCode == op_codes.iNot else 0
+        else:
+            self.destinationCount = self.operandCount - 1
+        # The type bits of operands the instruction doesn't have, which the assembler leaves clear.
+        self.unusedTypeBits = 0b111 >> self.operandCount if self.format == FORMAT_OPERANDS else 0
+
+opCodeInfo = [None] * 32
+for mnemonic, instruction in op_codes.pneumonics.items():
+    opCodeInfo[instruction.opCode] = OpCodeInfo(mnemonic, instruction)
+
+# The names of operands by ID. Registers, flags and the like are written as they are named in
+# oper_ID.pneumonics and register offsets as the register followed by the offset.
+operandNames = {}
+payloadSizes = {}
+for name, operand in oper_ID.pneumonics.items():
+    payloadSizes[operand.operandID] = operand.payloadSize
+    if operand.operandID not in uaAssembler.literalOperandIDs and operand.operandID != oper_ID.litAddr:
+        operandNames[operand.operandID] = name.rstrip("+")
+literalOperandPrefixes = {operand.operandID: name for name, operand in oper_ID.pneumonics.items()
+                          if operand.operandID in uaAssembler.literalOperandIDs}
+
+conditionalBranchNames = {branchID: name for name, branchID in uaAssembler.conditionalBranchIDs.items()}
+numberModeNames = {0x00: "sInt", 0x10: "float"}
+wordLengthModeNames = {value: name for name, value in uaAssembler.wordLengthModes.items()}
+
+# Tables for working out instruction lengths by the first byte of the instruction and by operand
+# ID. The lengths are at most 28 bytes, so they fit in a byte, and 0 stands for bytes which can't
+# be an instruction; an op-code which isn't one, or an operand ID which isn't one, whose length of
+# 0x100 makes the length of the instruction it's in too long to be one.
+invalidOperandLength = 0x100
+firstByteLengths = [0] * 256
+firstByteOperandCounts = [0] * 256
+for byte in range(256):
+    info = opCodeInfo[byte >> 3]
+    if info is not None:
+        firstByteLengths[byte] = info.size
+        firstByteOperandCounts[byte] = info.operandCount
+operandLengths = [payloadSizes.get(operandID, invalidOperandLength) for operandID in range(256)]
+
+if numpy is not None:
+    firstByteLengthArray = numpy.array(firstByteLengths, numpy.int32)
+    firstByteOperandCountArray = numpy.array(firstByteOperandCounts, numpy.uint8)
+    operandLengthArray = numpy.array(operandLengths, numpy.int32)
+
+# The length of the instruction at 'position', or 0 if there can't be one there.
+def instructionLength (code, position):
+    byte = code[position]
+    length = firstByteLengths[byte]
+    end = len(code)
+    for i in range(firstByteOperandCounts[byte]):
+        if byte & (0b100 >> i):
+            if position + 1 + i >= end:
+                return 0
+            length += operandLengths[code[position + 1 + i]]
+    return length if length < invalidOperandLength else 0
+
+# The length of the instruction which would start at every byte of 'code', as bytes.
+def instructionLengths (code):
+    codes = numpy.frombuffer(code, numpy.uint8)
+    # Operand fields of instructions at the end of the code are read as zeroes; the sweep doesn't
+    # use the lengths of instructions which run past the end anyway.
+    padded = numpy.zeros(len(codes) + 3, numpy.uint8)
+    padded[:len(codes)] = codes
+    lengths = firstByteLengthArray[codes]
+    counts = firstByteOperandCountArray[codes]
+    for i in range(3):
+        hasPayload = (counts > i) & (codes & (0b100 >> i) != 0)
+        lengths += numpy.where(hasPayload, operandLengthArray[padded[1 + i:1 + i + len(codes)]], 0)
+    lengths[lengths >= invalidOperandLength] = 0
+    return lengths.astype(numpy.uint8).tobytes()
+
+byteLiterals = ["0bx{:02X}".format(byte) for byte in range(256)]
+
+def poolOperandName (field):
+    return "w{:02X}".format(field) if field < 0x80 else "p{:02X}".format(field - 0x80)
+
+# Decode the bytes of an instruction. Returns the instruction as text, with '{}' in place of its
+# address operand or target if it has one, the address and whether it must be written as a label;
+# or None if the assembler wouldn't have written these bytes.
+def decodeInstruction (instruction):
+    byte = instruction[0]
+    info = opCodeInfo[byte >> 3]
+    typeBits = byte & 0b111
+    mnemonic = info.mnemonic
+    instructionFormat = info.format
+
+    if instructionFormat == FORMAT_OPERANDS:
+        if typeBits & info.unusedTypeBits:
+            return None
+        tokens = [mnemonic]
+        address = None
+        payloadCount = 0
+        position = 1 + info.operandCount
+        for i in range(info.operandCount):
+            field = instruction[1 + i]
+            if not typeBits & (0b100 >> i):
+                tokens.append(poolOperandName(field))
+                continue
+            size = payloadSizes[field]
+            payload = instruction[position:position + size]
+            position += size
+            if size:
+                payloadCount += 1
+            if field in literalOperandPrefixes:
+                if i < info.destinationCount:
+                    return None
+                tokens.append("{}x{}".format(literalOperandPrefixes[field], payload.hex().upper()))
+            elif field == oper_ID.litAddr:
+                # An address operand is written as a label, and an instruction only has one.
+                if address is not None:
+                    return None
+                address = int.from_bytes(payload, "big")
+                tokens.append("{}")
+            elif size:
+                tokens.append("{}+0x{}".format(operandNames[field], payload.hex().upper()))
+            else:
+                tokens.append(operandNames[field])
+        if payloadCount > 1 and byte >> 3 not in (op_codes.iIn, op_codes.iOut):
+            return None
+        return formatInstruction(tokens), address, True
+
+    if instructionFormat == FORMAT_IGN:
+        return formatInstruction([mnemonic, str(typeBits)] if typeBits else [mnemonic]), None, False
+    if instructionFormat == FORMAT_BRANCH:
+        return (formatInstruction([mnemonic, conditionalBranchNames[typeBits], "{}"]),
+                int.from_bytes(instruction[1:3], "big"), False)
+    if typeBits:
+        return None
+    if instructionFormat == FORMAT_BYTE:
+        if byte >> 3 == op_codes.iRet and instruction[1] == 0:
+            return formatInstruction([mnemonic]), None, False
+        return formatInstruction([mnemonic, "0bx{:02X}".format(instruction[1])]), None, False
+    if instructionFormat == FORMAT_MODE:
+        modeByte = instruction[1]
+        if modeByte & 0xF0 in numberModeNames and modeByte & 0x0F in wordLengthModeNames:
+            tokens = [mnemonic, numberModeNames[modeByte & 0xF0], wordLengthModeNames[modeByte & 0x0F]]
+        else:
+            tokens = [mnemonic, "0bx{:02X}".format(modeByte)]
+        return formatInstruction(tokens), None, False
+    if instructionFormat == FORMAT_ADDRESS:
+        return formatInstruction([mnemonic, "{}"]), int.from_bytes(instruction[1:3], "big"), False
+    return formatInstruction([mnemonic]), None, False
+
+# Lay an instruction out the way the programs in this repository are; indented, with the
+# mnemonic and every operand but the last padded to 8 characters, or followed by a space if they
+# are longer.
+def formatInstruction (tokens):
+    return "    " + "".join("{:<7} ".format(token) for token in tokens[:-1]) + tokens[-1]
+
+# Names which can be written as an address operand. Some valid label names would be read as
+# something else there, like 'w1A' or 'ZF'.
+def isOperandName (name):
+    return (uaAssembler.validNamePattern.search(name) is not None
+            and not uaAssembler.memoryWindowAddrPattern.search(name)
+            and not uaAssembler.parameterSpaceAddrPattern.search(name)
+            and name not in oper_ID.pneumonics)
+
+class Disassembler:
+    # 'symbols' is a dictionary of label addresses, as returned by uaImage.parseSymbolMap. With
+    # 'addresses' every line of the listing ends with a comment of its address and bytes.
+    def __init__(self, symbols = None, addresses = False):
+        self.symbols = {}
+        for name, address in (symbols or {}).items():
+            if uaAssembler.validNamePattern.search(name):
+                self.symbols.setdefault(address, []).append(name)
+        for names in self.symbols.values():
+            names.sort()
+        self.addresses = addresses
+        # Decoded instructions by their bytes, shared by every image the disassembler is given.
+        self.decoded = {}
+
+    # Disassemble a binary image or hex code. Returns the lines of the listing.
+    def disassemble (self, program):
+        lines = []
+        if uaImage.isImage(program):
+            self.disassembleImage(memoryview(program), None, 0, lines)
+        else:
+            if isinstance(program, (bytes, bytearray, memoryview)):
+                program = bytes(program).decode("ascii")
+            code = uaImage.parseHex(program)
+            self.disassembleSection(code, 0, 0, True, True, None, 0, lines)
+        return lines
+
+    # Disassemble images written one after another, e.g. by a program which logs every image it
+    # builds. Returns the lines of the listing, with a comment in front of every image. With
+    # NumPy, the instruction lengths are worked out for the whole dump at once.
+    def disassembleDump (self, dump):
+        view = memoryview(dump)
+        lengths = instructionLengths(view) if numpy is not None else None
+        lines = []
+        offset = 0
+        count = 0
+        while offset < len(view):
+            if not uaImage.isImage(view[offset:]) or len(view) - offset < uaImage.headerFormat.size:
+                raise uaImage.ImageFormatError("The data at offset 0x{:X} of the dump is not a UA image.".format(offset))
+            magic, version, sectionCount, entryPoint, dataSize = uaImage.headerFormat.unpack_from(view, offset)
+            size = uaImage.imageHeaderSize(sectionCount) + dataSize
+            count += 1
+            lines.append("// image {} at offset 0x{:X}, entry point {:04X}".format(count, offset, entryPoint))
+            self.disassembleImage(view[offset:offset + size], lengths, offset, lines)
+            offset += size
+        return lines
+
+    # Disassemble an image onto the end of 'lines'. 'lengths' are the instruction lengths of the
+    # bytes it was cut from, starting 'offset' bytes before it, or None.
+    def disassembleImage (self, image, lengths, offset, lines):
+        entryPoint, sections = uaImage.readImage(image)
+        for i, section in enumerate(sections):
+            if len(sections) > 1:
+                lines.append("// section at {:04X}, {} bytes of {}".format(
+                    section.address, len(section.data), "code" if section.flags & uaImage.sectionCode else "data"))
+            sectionOffset = uaImage.sectionFormat.unpack_from(image, uaImage.imageHeaderSize(i))[3]
+            self.disassembleSection(bytes(section.data), section.address, entryPoint, section.flags & uaImage.sectionCode,
+                                    i == len(sections) - 1, lengths, offset + sectionOffset, lines)
+
+    # Disassemble the bytes of one section, which is loaded at 'base', onto the end of 'lines'.
+    # Data sections are written as 'dm' bytes only. Labels at the end of the section are only
+    # written after the 'last' section of an image, as they are the start of the next one
+    # otherwise. 'lengths' are as for disassembleImage, starting 'offset' bytes before the section.
+    def disassembleSection (self, code, base, entryPoint, isCode, last, lengths, offset, lines):
+        end = len(code)
+        limit = end if last else end - 1
+        decoded = self.decoded
+        if lengths is None and numpy is not None and isCode:
+            lengths = instructionLengths(code)
+            offset = 0
+
+        # The sweep. Every item is the position of an instruction and its decoded bytes, or of a
+        # byte of data and None.
+        positions = []
+        instructions = []
+        position = 0
+        while position < end:
+            if isCode:
+                length = lengths[offset + position] if lengths is not None else instructionLength(code, position)
+                if length and position + length <= end:
+                    key = code[position:position + length]
+                    instruction = decoded.get(key, False)
+                    if instruction is False:
+                        instruction = decoded[key] = decodeInstruction(key)
+                    if instruction is not None:
+                        positions.append(position)
+                        instructions.append(instruction)
+                        position += length
+                        continue
+            positions.append(position)
+            instructions.append(None)
+            position += 1
+
+        # Address operands need labels, so an instruction with one outside the section is data.
+        # Labels have to go between instructions, so an instruction a label is inside of is data too.
+        labelled = set()
+        for address in self.symbols:
+            if 0 <= address - base <= limit:
+                labelled.add(address - base)
+        hasEntryPoint = 0 <= entryPoint - base <= limit
+        if hasEntryPoint:
+            labelled.add(entryPoint - base)
+        split = set()
+        for i, instruction in enumerate(instructions):
+            if instruction is not None and instruction[2] and instruction[1] is not None:
+                target = instruction[1] - base
+                if 0 <= target <= limit:
+                    labelled.add(target)
+                else:
+                    split.add(i)
+        for position in labelled:
+            i = bisect.bisect_right(positions, position) - 1
+            if i >= 0 and positions[i] != position and instructions[i] is not None:
+                split.add(i)
+        if split:
+            positions, instructions = self.splitInstructions(code, positions, instructions, split)
+
+        # Name the labels. main is the entry point whatever the symbol map says. Targets of
+        # branches and calls get a label too when they're the start of an instruction or data.
+        labels = {}
+        for position in labelled:
+            labels[position] = [name for name in self.symbols.get(base + position, ()) if name != "main"]
+        if hasEntryPoint:
+            labels[entryPoint - base].insert(0, "main")
+        starts = set(positions)
+        if last:
+            starts.add(end)
+        for instruction in instructions:
+            if instruction is not None and instruction[1] is not None and not instruction[2]:
+                target = instruction[1] - base
+                if target in starts and target not in labels:
+                    labels[target] = []
+        used = set(name for names in labels.values() for name in names)
+        targetNames = {}
+        for position, names in labels.items():
+            operandName = next((name for name in names if isOperandName(name)), None)
+            if operandName is None:
+                operandName = "L_{:04X}".format(base + position)
+                while operandName in used:
+                    operandName += "_"
+                used.add(operandName)
+                names.append(operandName)
+            targetNames[position] = operandName
+
+        # Write the listing.
+        addresses = self.addresses
+        data = []
+        dataStart = 0
+        for i, (position, instruction) in enumerate(zip(positions, instructions)):
+            names = labels.get(position)
+            if data and (names or instruction is not None or len(data) == 8):
+                self.writeData(lines, base + dataStart, data)
+                data = []
+            if names:
+                lines.extend(":{}:".format(name) for name in names)
+            if instruction is None:
+                if not data:
+                    dataStart = position
+                data.append(code[position])
+                continue
+            text, address, isRequired = instruction
+            if address is not None:
+                target = address - base
+                if target in targetNames:
+                    text = text.format(targetNames[target])
+                else:
+                    text = text.format("0x{:04X}".format(address))
+            if addresses:
+                length = (positions[i + 1] if i + 1 < len(positions) else end) - position
+                text = "{:<40}// {:04X}  {}".format(text, base + position, code[position:position + length].hex(" ").upper())
+            lines.append(text)
+        if data:
+            self.writeData(lines, base + dataStart, data)
+        if end in labels:
+            lines.extend(":{}:".format(name) for name in labels[end])
+
+    def writeData (self, lines, address, data):
+        text = "    dm      " + ", ".join([byteLiterals[byte] for byte in data])
+        if self.addresses:
+            text = "{:<40}// {:04X}".format(text, address)
+        lines.append(text)
+
+    # Replace the instructions at the indices in 'split' with a byte of data for each of their bytes.
+    def splitInstructions (self, code, positions, instructions, split):
+        newPositions = []
+        newInstructions = []
+        for i, (position, instruction) in enumerate(zip(positions, instructions)):
+            if i not in split:
+                newPositions.append(position)
+                newInstructions.append(instruction)
+                continue
+            end = positions[i + 1] if i + 1 < len(positions) else len(code)
+            for dataPosition in range(position, end):
+                newPositions.append(dataPosition)
+                newInstructions.append(None)
+        return newPositions, newInstructions
+
+# Disassemble a binary image or hex code into the text of a listing.
+def disassemble (program, symbols = None):
+    return "\n".join(Disassembler(symbols).disassemble(program)) + "\n"
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Disassemble a UA program.")
+    argParser.add_argument("program", help="a binary image, images one after another, or hex code written by the assembler")
+    argParser.add_argument("-m", "--map", help="a symbol map of the program, to name labels after")
+    argParser.add_argument("-o", "--output", help="write the listing to this file instead of stdout")
+    argParser.add_argument("-a", "--addresses", action="store_true",
+                           help="end every line with a comment of its address and bytes")
+    args = argParser.parse_args()
+
+    try:
+        with open(args.program, "rb") as f:
+            program = f.read()
+        symbols = {}
+        if args.map:
+            with open(args.map) as f:
+                symbols = uaImage.parseSymbolMap(f.read())
+        disassembler = Disassembler(symbols, args.addresses)
+        if uaImage.isImage(program):
+            lines = disassembler.disassembleDump(program)
+        else:
+            lines = disassembler.disassemble(program)
+    except (OSError, uaImage.ImageFormatError, ValueError) as error:
+        print("Could not disassemble {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+
+    listing = "\n".join(lines) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(listing)
+        print("Disassembly written to {}.".format(args.output))
+    else:
+        sys.stdout.write(listing)
+
+if __name__ == "__main__":
+    main()
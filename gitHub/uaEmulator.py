@@ -0,0 +1,2343 @@
+# This program is an emulator for the universal architecture. It executes the binary images
+# written by the assembler (see uaImage.py) or, for programs assembled with '-f hex', hex code
+# loaded at address 0.
+#
+# The machine's state is a flat 64 KiB memory, the 256 byte data-pool and the special registers.
+# Instructions are decoded through tables built once from the assembler's op_codes and oper_ID
+# classes: a 256 entry table indexed by the first byte of an instruction (the op-code and the
+# operand type bits together) and a 256 entry table indexed by operand ID. With '-e blocks' the
+# decoded instructions of every basic block are kept in a cache so that loops are decoded once;
+# blocks are dropped from the cache when a memory write changes their bytes. '-e translated' goes
+# a step further and translates the blocks which are executed most into Python functions (see
+# BlockTranslator.) When NumPy is installed, SIMD operations are performed on NumPy arrays viewing
+# the data-pool.
+#
+# A few details the specification leaves open are settled here as follows.
+#   - The operand type bits belong to the operands from the most significant bit down.
+#   - The word length of an operation is that of its destination; the data-pool word length for
+#     data-pool operands, 16 bits for registers, 8 bits for rs and for mov to memory the width
+#     of the source. Sources are sign extended (literals, data-pool, memory) or zero extended
+#     (registers) to that width.
+#   - Registers hold unsigned addresses, so arithmetic on them sets OF on a carry or borrow but
+#     never raises a signed overflow error. This makes alloc identical to 'sub ap'.
+#   - In floating-point mode, arithmetic with a data-pool destination is performed on IEEE
+#     floats of the word length (16, 32 or 64 bits) and sets the flags of the result as stored.
+#     Literal, register and memory sources are converted by value. Logic instructions and mov
+#     always work on the raw bits.
+#   - The flags register holds the flags from its most significant bit down in the order
+#     ZF SF OF NOF TF EF DZF RF SEF FMF WLF0 WLF1, followed by 4 unused bits.
+import argparse
+import collections
+import os
+import struct
+import sys
+import time
+
+import uaAssembler
+import uaImage
+import uaSnapshot
+
+# NumPy is optional. Without it SIMD operations are performed one word at a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+op_codes = uaAssembler.op_codes
+oper_ID = uaAssembler.oper_ID
+
+# This class is a name space for the exit codes in the specification's table.
+class exit_codes:
+    outOfBoundsError = 0x00
+    successfulCompletion = 0x01
+    SIMDError = 0x02
+    divideByZero = 0x03
+    unresolvedError = 0x04
+    signBitOverflow = 0x05
+    invalidInstruction = 0x06
+
+# This class is a name space for the bits of the flags register.
+class flag_bits:
+    ZF = 0x8000; SF = 0x4000; OF = 0x2000; NOF = 0x1000
+    TF = 0x0800; EF = 0x0400; DZF = 0x0200; RF = 0x0100
+    SEF = 0x0080; FMF = 0x0040; WLF0 = 0x0020; WLF1 = 0x0010
+    WLB = WLF0 | WLF1
+    WLBShift = 4
+    # The bits which can be set at all; the lowest 4 bits of the register are unused.
+    used = 0xFFF0
+
+# The flags tested by jfl and sfl, indexed by conditional branch ID.
+branchFlags = tuple(flag_bits.ZF >> i for i in range(8))
+errorFlagBranchID = 5
+
+# The mode flags; the word length and floating-point mode set by the mode instruction.
+modeFlagBits = flag_bits.WLB | flag_bits.FMF
+
+# Operand kinds.
+KIND_POOL = 0       # a data-pool address
+KIND_REGISTER = 1   # a register or imaginary register
+KIND_MEMORY = 2     # memory addressed by a literal, register value or register offset
+KIND_LITERAL = 3
+KIND_FLAG = 4       # a single flag bit, or the 2-bit WLB field
+KIND_SIMD = 5
+
+memorySize = 0x10000
+windowSize = 0x80
+SIMDGroupSize = 64
+
+# The bits of Machine.windowDirty for the halves of the memory window (its two SIMD groups), and
+# the bit of the half each data-pool byte is in; none for the parameter space.
+windowLowHalf = 1
+windowHighHalf = 2
+windowBothHalves = windowLowHalf | windowHighHalf
+windowHalves = bytes([windowLowHalf] * SIMDGroupSize + [windowHighHalf] * SIMDGroupSize + [0] * (256 - windowSize))
+
+# Raised inside instruction handlers to stop the machine with an exit code.
+class Halt(Exception):
+    def __init__(self, exitCode):
+        super().__init__(exitCode)
+        self.exitCode = exitCode
+
+class InvalidInstruction(Halt):
+    def __init__(self, message):
+        super().__init__(exit_codes.invalidInstruction)
+        self.message = message
+
+def toSigned (value, bits):
+    value &= (1 << bits) - 1
+    if value >> (bits - 1):
+        return value - (1 << bits)
+    return value
+
+# The I/O channel state. Channel 0 is the console, any address above 255 names a file by a null
+# terminated path.
+#
+# Output is collected in a buffer which is written out when it grows past bufferSize, when the
+# channel changes, before console input is read and when the machine halts. Files stay open in a
+# pool of up to maxOpenFiles handles, keyed by their resolved path, so selecting a file again
+# doesn't open it again. Selecting another channel still ends the file's session as the
+# specification has it, so its read and write positions start at 0 again when it's selected again.
+# File reads and writes pass the position along (os.pread and os.pwrite) instead of seeking, and
+# file reads of at least directReadSize bytes go straight into the machine's memory. 'calls' counts
+# the system calls made for each kind of access.
+class IOState:
+    def __init__(self, stdin, stdout, bufferSize = 0x10000, maxOpenFiles = 8, directReadSize = 256):
+        self.stdin = stdin
+        self.stdout = stdout
+        self.bufferSize = bufferSize
+        self.maxOpenFiles = maxOpenFiles
+        self.directReadSize = directReadSize
+        self.channel = 0
+        self.file = None
+        self.files = collections.OrderedDict()
+        self.resolvedPaths = {}
+        self.output = bytearray()
+        self.readPosition = 0
+        self.writePosition = 0
+        self.calls = {"open": 0, "close": 0, "read": 0, "write": 0}
+
+    def select (self, machine, channel):
+        self.flush()
+        self.channel = channel
+        self.file = None
+        self.readPosition = 0
+        self.writePosition = 0
+        if channel > 0xFF:
+            self.file = self.open(machine.readString(channel).decode("latin-1"))
+            if self.file is None:
+                machine.raiseError(exit_codes.unresolvedError)
+
+    # Return the pooled handle of a file, opening it if it isn't open, or None if it can't be.
+    def open (self, path):
+        resolvedPath = self.resolvedPaths.get(path)
+        if resolvedPath is None:
+            resolvedPath = self.resolvedPaths[path] = os.path.realpath(path)
+        file = self.files.get(resolvedPath)
+        if file is not None:
+            self.files.move_to_end(resolvedPath)
+            return file
+        try:
+            try:
+                file = open(resolvedPath, "r+b", buffering=0)
+            except FileNotFoundError:
+                file = open(resolvedPath, "w+b", buffering=0)
+        except OSError:
+            return None
+        self.calls["open"] += 1
+        self.files[resolvedPath] = file
+        if len(self.files) > self.maxOpenFiles:
+            self.files.popitem(last=False)[1].close()
+            self.calls["close"] += 1
+        return file
+
+    def read (self, size):
+        if self.channel == 0:
+            self.flush()
+            line = self.stdin.readline()
+            if line.endswith(b"\n"):
+                line = line[:-1]
+            # Console input which doesn't fit is discarded.
+            return line[:size]
+        if self.file is None:
+            return b""
+        self.flush()
+        data = os.pread(self.file.fileno(), size, self.readPosition)
+        self.calls["read"] += 1
+        self.readPosition += len(data)
+        return data
+
+    # Read up to 'size' bytes into memory at 'address', followed by a null if fewer are read.
+    def readInto (self, machine, address, size):
+        if (self.file is not None and size >= self.directReadSize and address + size <= memorySize
+                and hasattr(os, "preadv") and not machine.holdsCode(address, size)):
+            self.flush()
+            count = os.preadv(self.file.fileno(), [memoryview(machine.memory)[address:address + size]], self.readPosition)
+            machine.windowWrite(address, address + count)
+            self.calls["read"] += 1
+            self.readPosition += count
+            if count < size:
+                machine.store(address + count, b"\x00")
+            return
+        data = self.read(size)
+        if len(data) < size:
+            data += b"\x00"
+        machine.store(address, data)
+
+    def write (self, data):
+        if self.channel == 0 or self.file is not None:
+            self.output += data
+            self.writePosition += len(data)
+            if len(self.output) >= self.bufferSize:
+                self.flush()
+
+    def seek (self, position):
+        self.readPosition = position
+
+    # Write out the buffered output.
+    def flush (self):
+        output = self.output
+        if self.channel == 0:
+            if output:
+                self.stdout.write(output)
+                self.calls["write"] += 1
+            self.stdout.flush()
+        elif self.file is not None:
+            position = self.writePosition - len(output)
+            written = 0
+            while written < len(output):
+                written += os.pwrite(self.file.fileno(), output[written:], position + written)
+                self.calls["write"] += 1
+        if output:
+            self.output = bytearray()
+
+    # Flush the output and close every file.
+    def close (self):
+        self.flush()
+        for file in self.files.values():
+            file.close()
+            self.calls["close"] += 1
+        self.files.clear()
+        self.file = None
+
+# The description of one kind of operand, stored in operandTable by operand ID. 'read' and
+# 'write' take the machine, the operand's argument (its data-pool address, payload or the fixed
+# argument of the operand type) and the width of the operation in bytes. 'address' returns the
+# operand as a 16-bit address for instructions which take addresses, like mw and outs.
+class OperandType:
+    __slots__ = ("name", "kind", "width", "payloadSize", "signedPayload", "fixedArg", "read", "write", "address")
+
+    def __init__(self, name, kind, width, payloadSize, fixedArg, read, write, address, signedPayload = False):
+        self.name = name
+        self.kind = kind
+        self.width = width
+        self.payloadSize = payloadSize
+        self.signedPayload = signedPayload
+        self.fixedArg = fixedArg
+        self.read = read
+        self.write = write
+        self.address = address
+
+# A decoded instruction. 'operands' is a tuple of (OperandType, argument) pairs and 'immediate'
+# holds the operand of instructions with a single constant operand field (exit codes, mode
+# bytes and branch addresses.)
+class DecodedInstruction:
+    __slots__ = ("address", "length", "nextAddress", "handler", "opCode", "typeBits", "immediate", "operands",
+                 "testsErrorFlag")
+
+    def __init__(self, address, length, handler, opCode, typeBits, immediate, operands):
+        self.address = address
+        self.length = length
+        self.nextAddress = (address + length) & 0xFFFF
+        self.handler = handler
+        self.opCode = opCode
+        self.typeBits = typeBits
+        self.immediate = immediate
+        self.operands = operands
+        self.testsErrorFlag = (opCode == op_codes.iJfl or opCode == op_codes.iSfl) and typeBits == errorFlagBranchID
+
+    # Whether execution may continue anywhere other than the next instruction; branches, calls,
+    # returns, exits and anything that writes to ip.
+    def endsBlock (self):
+        if self.opCode in blockEndingOpCodes or self.opCode > op_codes.iNOP:
+            return True
+        for operandType, arg in self.operands:
+            if operandType.name == "ip":
+                return True
+        return False
+
+    def writesMemory (self):
+        return self.opCode in memoryWritingOpCodes
+
+# Op-codes after which a basic block ends, and op-codes of instructions which can write to memory.
+blockEndingOpCodes = frozenset((op_codes.iExit, op_codes.iJfl, op_codes.iSfl, op_codes.iCall, op_codes.iRet))
+memoryWritingOpCodes = frozenset((op_codes.iMov, op_codes.iMw, op_codes.iIn, op_codes.iCall))
+
+# A straight run of decoded instructions starting at 'start' and occupying the bytes up to 'end'.
+# Only the last instruction can transfer control anywhere other than the next instruction.
+# 'translations' holds the functions the block has been translated into, by the mode flags they
+# were translated for, and 'executions' counts the times it has been executed without one.
+# 'breakpoints' is for uaDebugger; the indexes of the instructions it has to stop at, or None until
+# it has looked at the block. 'links' holds the Links of other translations to its translations and
+# 'exits' the Links of its own translations.
+class Block:
+    __slots__ = ("start", "end", "instructions", "writesMemory", "valid", "translations", "executions",
+                 "breakpoints", "links", "exits")
+
+    def __init__(self, start, end, instructions):
+        self.start = start
+        self.end = end
+        self.instructions = instructions
+        self.writesMemory = tuple(instruction.writesMemory() for instruction in instructions)
+        self.valid = True
+        self.translations = {}
+        self.executions = 0
+        self.breakpoints = None
+        self.links = set()
+        self.exits = []
+
+# An exit of a translation to a known address: a branch, a call or falling through to the next
+# block. Once Machine.runTranslated has dispatched the translation of the block at 'address' for
+# 'modeFlags', the mode the exit leaves the machine in, the link holds it and the block, and the
+# exit goes straight on to it. The link is cut when either block is invalidated.
+class Link:
+    __slots__ = ("source", "address", "modeFlags", "translation", "block")
+
+    def __init__(self, source, address, modeFlags):
+        self.source = source
+        self.address = address
+        self.modeFlags = modeFlags
+        self.translation = None
+        self.block = None
+
+    def cut (self):
+        self.translation = None
+        self.block = None
+
+# Decoded basic blocks by start address. Memory is divided into pages of 64 bytes and every page
+# a cached block occupies records that block, so a write to memory only has to look at the pages
+# it touches and only does any work if one of them holds code. Blocks whose bytes are actually
+# changed by a write are dropped from the cache; writes that store the same bytes, like the memory
+# window being written back over code it was loaded from, leave them alone.
+class BlockCache:
+    pageShift = 6
+    maxBlockInstructions = 64
+
+    def __init__(self):
+        self.blocks = {}
+        self.pageBlocks = [None] * (memorySize >> self.pageShift)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.translations = 0
+        self.chained = 0
+
+    def build (self, m, start):
+        instructions = []
+        address = start
+        while len(instructions) < self.maxBlockInstructions:
+            try:
+                instruction = m.decode(address)
+            except Halt:
+                # An undecodable instruction ends the block before it, unless it's the first one,
+                # in which case decoding it again raises the error when the block is executed.
+                if instructions:
+                    break
+                raise
+            instructions.append(instruction)
+            if instruction.endsBlock() or instruction.nextAddress < address:
+                break
+            address = instruction.nextAddress
+        end = instructions[-1].address + instructions[-1].length
+        block = Block(start, end, instructions)
+        self.blocks[start] = block
+        for page in range(start >> self.pageShift, ((end - 1) >> self.pageShift) + 1):
+            page &= len(self.pageBlocks) - 1
+            if self.pageBlocks[page] is None:
+                self.pageBlocks[page] = set()
+            self.pageBlocks[page].add(block)
+        return block
+
+    # Called by Machine.store before 'data' is written at 'address'.
+    def checkWrite (self, memory, address, data):
+        pageBlocks = self.pageBlocks
+        end = address + len(data)
+        firstPage = address >> self.pageShift
+        lastPage = (end - 1) >> self.pageShift
+        for page in range(firstPage, lastPage + 1):
+            if pageBlocks[page & (len(pageBlocks) - 1)] is not None:
+                break
+        else:
+            return
+        if end <= memorySize and memory[address:end] == data:
+            return
+        for page in range(firstPage, lastPage + 1):
+            blocks = pageBlocks[page & (len(pageBlocks) - 1)]
+            if blocks is None:
+                continue
+            for block in list(blocks):
+                if block.start < end and address < block.end or end > memorySize and block.start < end - memorySize:
+                    self.invalidate(block)
+
+    # Whether a block occupies any of the pages of the bytes from 'address' up to 'end'.
+    def holdsCode (self, address, end):
+        pageBlocks = self.pageBlocks
+        for page in range(address >> self.pageShift, ((end - 1) >> self.pageShift) + 1):
+            if pageBlocks[page & (len(pageBlocks) - 1)] is not None:
+                return True
+        return False
+
+    def invalidate (self, block):
+        block.valid = False
+        self.invalidations += 1
+        if self.blocks.get(block.start) is block:
+            del self.blocks[block.start]
+        for page in range(block.start >> self.pageShift, ((block.end - 1) >> self.pageShift) + 1):
+            page &= len(self.pageBlocks) - 1
+            blocks = self.pageBlocks[page]
+            blocks.discard(block)
+            if not blocks:
+                self.pageBlocks[page] = None
+        for link in block.links:
+            link.cut()
+        block.links.clear()
+        for link in block.exits:
+            if link.block is not None:
+                link.block.links.discard(link)
+            link.cut()
+
+    def stats (self):
+        return {"blocks": len(self.blocks), "hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations, "translations": self.translations,
+                "chained": self.chained}
+
+class Machine:
+    __slots__ = ("memory", "dataPool", "ip", "sp", "ap", "wl", "flags", "flagResult", "rs", "ar0", "ar1", "ar2",
+                 "ar3", "wordBytes", "floatMode", "kernels", "halted", "exitCode", "pendingError", "instructionCount",
+                 "interruptHandler", "io", "blockCache", "SIMDViews", "windowDirty", "windowBytesWritten",
+                 "windowBytesRead")
+
+    def __init__(self, stdin = None, stdout = None):
+        self.memory = bytearray(memorySize)
+        self.dataPool = bytearray(256)
+        self.ip = 0; self.sp = 0; self.ap = 0; self.wl = 0
+        self.flags = flag_bits.TF | flag_bits.RF
+        self.flagResult = None
+        self.rs = 0
+        self.ar0 = 0; self.ar1 = 0; self.ar2 = 0; self.ar3 = 0
+        self.kernels = modeKernels[0]
+        self.wordBytes = 1
+        self.floatMode = False
+        self.halted = False
+        self.exitCode = None
+        self.pendingError = None
+        self.instructionCount = 0
+        self.interruptHandler = 0
+        self.blockCache = None
+        self.SIMDViews = {}
+        self.windowDirty = 0
+        self.windowBytesWritten = 0
+        self.windowBytesRead = 0
+        self.io = IOState(stdin if stdin is not None else sys.stdin.buffer,
+                          stdout if stdout is not None else sys.stdout.buffer)
+
+    # Load a binary image, or hex code if the data isn't an image, and point ip at its entry
+    # point. The memory window starts out mapped to address 0.
+    def loadProgram (self, data):
+        if uaImage.isImage(data):
+            self.ip = uaImage.loadImage(data, self.memory)
+        else:
+            program = uaImage.parseHex(bytes(data).decode("ascii"))
+            self.memory[0:len(program)] = program
+            self.ip = 0
+        self.dataPool[0:windowSize] = self.load(self.wl, windowSize)
+        self.windowDirty = 0
+
+    def loadProgramFile (self, path):
+        with open(path, "rb") as f:
+            isImage = uaImage.isImage(f.read(len(uaImage.magicNumber)))
+        if isImage:
+            self.ip = uaImage.loadImageFile(path, self.memory)
+            self.dataPool[0:windowSize] = self.load(self.wl, windowSize)
+            self.windowDirty = 0
+        else:
+            with open(path, "rb") as f:
+                self.loadProgram(f.read())
+
+    # Save the machine's state in a uaSnapshot.Snapshot. Buffered output is written out first.
+    def snapshot (self):
+        self.io.flush()
+        registers = {name: getattr(self, name) for name in uaSnapshot.registerNames}
+        registers["rs"] = self.rs
+        return uaSnapshot.Snapshot(registers, bytes(self.memory), bytes(self.dataPool), self.halted, self.exitCode,
+                                   self.pendingError, self.instructionCount, self.io.channel, self.io.readPosition,
+                                   self.io.writePosition)
+
+    # Put the machine in the state a snapshot was taken in. The block cache is dropped, since it
+    # describes the old memory, and the snapshot's I/O channel is selected again.
+    def restore (self, snapshot):
+        self.memory[:] = snapshot.memory
+        self.dataPool[:] = snapshot.dataPool
+        self.blockCache = None
+        self.io.select(self, snapshot.channel)
+        self.io.readPosition = snapshot.readPosition
+        self.io.writePosition = snapshot.writePosition
+        for name, value in snapshot.registers.items():
+            setattr(self, name, value)
+        self.setFlags(self.flg)
+        self.halted = snapshot.halted
+        self.exitCode = snapshot.exitCode
+        self.pendingError = snapshot.pendingError
+        self.instructionCount = snapshot.instructionCount
+        # Nothing says whether the window matches memory, so the next mw writes all of it back.
+        self.windowDirty = windowBothHalves
+
+    # Memory access. Accesses which run past the end of memory wrap around to address 0. Every
+    # write to memory goes through store(), or calls windowWrite() itself.
+    def load (self, address, size):
+        end = address + size
+        if end <= memorySize:
+            return self.memory[address:end]
+        return self.memory[address:] + self.memory[:end - memorySize]
+
+    def store (self, address, data):
+        if self.blockCache is not None:
+            self.blockCache.checkWrite(self.memory, address, data)
+        end = address + len(data)
+        if self.windowDirty != windowBothHalves and (address < self.wl + windowSize and end > self.wl
+                                                     or end > memorySize):
+            self.windowWrite(address, end)
+        if end <= memorySize:
+            self.memory[address:end] = data
+        else:
+            split = memorySize - address
+            self.memory[address:] = data[:split]
+            self.memory[:end - memorySize] = data[split:]
+
+    # Memory under the memory window is written from 'address' up to 'end'. The window's copy of
+    # those bytes is what mw writes back over them, so the halves of the window over them are
+    # marked dirty.
+    def windowWrite (self, address, end):
+        wl = self.wl
+        if end > memorySize or wl + windowSize > memorySize:
+            self.windowDirty = windowBothHalves
+            return
+        if address < wl + SIMDGroupSize and end > wl:
+            self.windowDirty |= windowLowHalf
+        if address < wl + windowSize and end > wl + SIMDGroupSize:
+            self.windowDirty |= windowHighHalf
+
+    # Whether memory from 'address' may hold cached code, so that it has to be written with store().
+    def holdsCode (self, address, size):
+        return self.blockCache is not None and self.blockCache.holdsCode(address, address + size)
+
+    def readMemory (self, address, size):
+        return int.from_bytes(self.load(address, size), "big", signed=True)
+
+    def writeMemory (self, address, size, value):
+        self.store(address, (value & ((1 << (size * 8)) - 1)).to_bytes(size, "big"))
+
+    # Read a null terminated string, without the null.
+    def readString (self, address):
+        end = self.memory.find(0, address)
+        if end != -1:
+            return bytes(self.memory[address:end])
+        end = self.memory.find(0, 0, address)
+        if end == -1:
+            return bytes(self.memory[address:] + self.memory[:address])
+        return bytes(self.memory[address:] + self.memory[:end])
+
+    # The flags register. The arithmetic and logic instructions leave ZF and SF to be worked out
+    # from their result when the register is next read, since most results are overwritten before
+    # anything tests them; flagResult holds the result and its sign bit until then (see
+    # setResultFlags.) All the other flags are kept up to date in 'flags', which can be read
+    # directly for them.
+    @property
+    def flg (self):
+        pending = self.flagResult
+        if pending is not None:
+            result, signBit = pending
+            flags = self.flags & ~(flag_bits.ZF | flag_bits.SF)
+            if result == 0:
+                flags |= flag_bits.ZF
+            elif result & signBit:
+                flags |= flag_bits.SF
+            self.flags = flags
+            self.flagResult = None
+        return self.flags
+
+    @flg.setter
+    def flg (self, value):
+        self.flags = value
+        self.flagResult = None
+
+    # Write the flags register, including the mode flags, and swap in the kernels of the mode.
+    def setFlags (self, value):
+        self.flg = (value & flag_bits.used) | flag_bits.TF
+        kernels = modeKernels[self.flags & modeFlagBits]
+        self.kernels = kernels
+        self.wordBytes = kernels.wordBytes
+        self.floatMode = kernels.floatMode
+
+    # Set the error flag and remember the exit code to use if the next instruction doesn't test
+    # it. Errors are ignored while the response flag is unset.
+    def raiseError (self, exitCode):
+        if self.flg & flag_bits.RF:
+            self.flg |= flag_bits.EF
+            self.pendingError = exitCode
+
+    def halt (self, exitCode):
+        self.halted = True
+        self.exitCode = exitCode
+        self.io.flush()
+
+    def decode (self, address):
+        byte0 = self.memory[address]
+        decoder, handler, opCode, typeBits = instructionTable[byte0]
+        return decoder(self, address, handler, opCode, typeBits)
+
+    # Execute one instruction.
+    def step (self):
+        try:
+            instruction = self.decode(self.ip)
+        except Halt as halt:
+            self.halt(halt.exitCode)
+            return
+        self.execute(instruction)
+
+    def execute (self, instruction):
+        if self.pendingError is not None and not instruction.testsErrorFlag:
+            self.halt(self.pendingError)
+            return
+        self.ip = instruction.nextAddress
+        try:
+            instruction.handler(self, instruction)
+        except Halt as halt:
+            self.halt(halt.exitCode)
+        self.instructionCount += 1
+
+    # Run until the program exits or, if maxInstructions is given, until that many more
+    # instructions have been executed. Returns the exit code, or None if the program is still
+    # running.
+    def run (self, maxInstructions = None):
+        decode = self.decode
+        count = 0
+        try:
+            while not self.halted:
+                if maxInstructions is not None and count >= maxInstructions:
+                    break
+                instruction = decode(self.ip)
+                if self.pendingError is not None and not instruction.testsErrorFlag:
+                    self.halt(self.pendingError)
+                    break
+                self.ip = instruction.nextAddress
+                instruction.handler(self, instruction)
+                count += 1
+        except Halt as halt:
+            count += 1
+            self.halt(halt.exitCode)
+        finally:
+            self.instructionCount += count
+        return self.exitCode
+
+    # Run like run(), but execute basic blocks which are decoded once and kept in a BlockCache.
+    # A block is left early if one of its instructions writes over the block itself.
+    def runBlocks (self, maxInstructions = None):
+        if self.blockCache is None:
+            self.blockCache = BlockCache()
+        cache = self.blockCache
+        blocks = cache.blocks
+        count = 0
+        try:
+            while not self.halted:
+                block = blocks.get(self.ip)
+                if block is None:
+                    cache.misses += 1
+                    block = cache.build(self, self.ip)
+                else:
+                    cache.hits += 1
+                instructions = block.instructions
+                if maxInstructions is not None and len(instructions) > maxInstructions - count:
+                    instructions = instructions[:maxInstructions - count]
+                    if not instructions:
+                        break
+                writesMemory = block.writesMemory
+                for i, instruction in enumerate(instructions):
+                    if self.pendingError is not None and not instruction.testsErrorFlag:
+                        self.halt(self.pendingError)
+                        return self.exitCode
+                    self.ip = instruction.nextAddress
+                    instruction.handler(self, instruction)
+                    count += 1
+                    if writesMemory[i] and not block.valid:
+                        break
+        except Halt as halt:
+            count += 1
+            self.halt(halt.exitCode)
+        finally:
+            self.instructionCount += count
+        return self.exitCode
+
+    # Run like runBlocks(), but once a block has been executed translationThreshold times in the
+    # same mode, translate it with a BlockTranslator and call the translation from then on. A
+    # block is executed instruction by instruction while an error is pending, since the next
+    # instruction decides whether it halts the machine, and when fewer instructions than it holds
+    # may be executed.
+    #
+    # A translation which leaves through a Link that holds the next translation goes straight on
+    # to it without looking the block up again. A link which doesn't hold one yet is given the
+    # translation dispatched next.
+    def runTranslated (self, maxInstructions = None):
+        if self.blockCache is None:
+            self.blockCache = BlockCache()
+        cache = self.blockCache
+        blocks = cache.blocks
+        count = 0
+        chained = 0
+        link = None
+        try:
+            while not self.halted:
+                remaining = maxInstructions - count if maxInstructions is not None else sys.maxsize
+                if remaining <= 0:
+                    break
+                block = blocks.get(self.ip)
+                if block is None:
+                    cache.misses += 1
+                    block = cache.build(self, self.ip)
+                else:
+                    cache.hits += 1
+                instructions = block.instructions
+                if self.pendingError is None and len(instructions) <= remaining:
+                    modeFlags = self.flags & modeFlagBits
+                    translation = block.translations.get(modeFlags)
+                    if translation is None and block.executions >= translationThreshold:
+                        translation = BlockTranslator(block, modeFlags).translate()
+                        block.translations[modeFlags] = translation
+                        cache.translations += 1
+                    if translation is not None:
+                        if (link is not None and link.address == self.ip and link.modeFlags == modeFlags
+                                and link.source.valid):
+                            link.translation = translation
+                            link.block = block
+                            block.links.add(link)
+                        while True:
+                            try:
+                                executed, link = translation(self, remaining)
+                            except Halt as halt:
+                                count += translatedInstructionsBefore(halt, translation, block, self.ip)
+                                raise
+                            count += executed
+                            remaining -= executed
+                            if link is None or link.translation is None:
+                                break
+                            block = link.block
+                            if self.pendingError is not None or len(block.instructions) > remaining:
+                                link = None
+                                break
+                            translation = link.translation
+                            chained += 1
+                        continue
+                link = None
+                block.executions += 1
+                if len(instructions) > remaining:
+                    instructions = instructions[:remaining]
+                writesMemory = block.writesMemory
+                for i, instruction in enumerate(instructions):
+                    if self.pendingError is not None and not instruction.testsErrorFlag:
+                        self.halt(self.pendingError)
+                        return self.exitCode
+                    self.ip = instruction.nextAddress
+                    instruction.handler(self, instruction)
+                    count += 1
+                    if writesMemory[i] and not block.valid:
+                        break
+        except Halt as halt:
+            count += 1
+            self.halt(halt.exitCode)
+        finally:
+            self.instructionCount += count
+            cache.chained += chained
+        return self.exitCode
+
+# Operand access functions.
+
+def readPool (m, address, width):
+    end = address + m.wordBytes
+    if end > 256:
+        raise InvalidInstruction("A data-pool operand runs past the end of the data-pool.")
+    return int.from_bytes(m.dataPool[address:end], "big", signed=True)
+
+def writePool (m, address, width, value):
+    size = m.wordBytes
+    if address + size > 256:
+        raise InvalidInstruction("A data-pool operand runs past the end of the data-pool.")
+    m.dataPool[address:address + size] = (value & ((1 << (size * 8)) - 1)).to_bytes(size, "big")
+    m.windowDirty |= windowHalves[address] | windowHalves[address + size - 1]
+
+def poolAddress (m, address):
+    if address > 254:
+        raise InvalidInstruction("A data-pool address operand runs past the end of the data-pool.")
+    return (m.dataPool[address] << 8) | m.dataPool[address + 1]
+
+def readPoolRegister (m, offset, width):
+    return (m.dataPool[offset] << 8) | m.dataPool[offset + 1]
+
+def writePoolRegister (m, offset, width, value):
+    m.dataPool[offset] = (value >> 8) & 0xFF
+    m.dataPool[offset + 1] = value & 0xFF
+    m.windowDirty |= windowHalves[offset]
+
+def poolRegisterAddress (m, offset):
+    return (m.dataPool[offset] << 8) | m.dataPool[offset + 1]
+
+def readLiteral (m, value, width):
+    return value
+
+def writeLiteral (m, value, width, newValue):
+    raise InvalidInstruction("Literals cannot be destination operands.")
+
+def literalAddress (m, value):
+    return value & 0xFFFF
+
+def readFlag (m, bit, width):
+    return 1 if m.flg & bit else 0
+
+def writeFlag (m, bit, width, value):
+    if value & 1:
+        m.setFlags(m.flg | bit)
+    else:
+        m.setFlags(m.flg & ~bit)
+
+def readWordLengthBits (m, unused, width):
+    return (m.flg & flag_bits.WLB) >> flag_bits.WLBShift
+
+def writeWordLengthBits (m, unused, width, value):
+    m.setFlags((m.flg & ~flag_bits.WLB) | ((value & 3) << flag_bits.WLBShift))
+
+def flagAddress (m, bit):
+    raise InvalidInstruction("Flags cannot be used as addresses.")
+
+def readSIMD (m, offset, width):
+    raise Halt(exit_codes.SIMDError)
+
+def SIMDAddress (m, offset):
+    raise Halt(exit_codes.SIMDError)
+
+# Build the operand type of a special register stored in a slot of the machine.
+def slotRegister (name, slot, width):
+    mask = (1 << (width * 8)) - 1
+    if slot == "flg":
+        def write (m, unused, size, value):
+            m.setFlags(value)
+    elif slot == "wl":
+        # Moving wl without mw leaves the window's copy over other memory, which mw then writes
+        # back over it.
+        def write (m, unused, size, value):
+            m.wl = value & mask
+            m.windowDirty = windowBothHalves
+    else:
+        def write (m, unused, size, value):
+            setattr(m, slot, value & mask)
+    def read (m, unused, size):
+        return getattr(m, slot)
+    def address (m, unused):
+        return getattr(m, slot) & 0xFFFF
+    return OperandType(name, KIND_REGISTER, width, 0, None, read, write, address)
+
+# Build the operand type of memory addressed by a register's value, or by a register's value
+# plus the 16-bit offset in the payload when withOffset is true.
+def memoryOperand (name, register, withOffset):
+    registerAddress = register.address
+    registerArg = register.fixedArg
+    if withOffset:
+        def address (m, offset):
+            return (registerAddress(m, registerArg) + offset) & 0xFFFF
+    else:
+        def address (m, unused):
+            return registerAddress(m, registerArg)
+    def read (m, arg, width):
+        return m.readMemory(address(m, arg), width)
+    def write (m, arg, width, value):
+        m.writeMemory(address(m, arg), width, value)
+    return OperandType(name, KIND_MEMORY, 0, 2 if withOffset else 0, None, read, write, address)
+
+def literalMemoryAddress (m, address):
+    return address
+
+def readLiteralMemory (m, address, width):
+    return m.readMemory(address, width)
+
+def writeLiteralMemory (m, address, width, value):
+    m.writeMemory(address, width, value)
+
+poolOperand = OperandType("data-pool", KIND_POOL, 0, 0, None, readPool, writePool, poolAddress)
+
+def buildOperandTable ():
+    table = [None] * 256
+    registers = {}
+    for i in range(4):
+        registers["wi%d" % i] = OperandType("wi%d" % i, KIND_REGISTER, 2, 0, 2 * i,
+                                            readPoolRegister, writePoolRegister, poolRegisterAddress)
+        registers["pi%d" % i] = OperandType("pi%d" % i, KIND_REGISTER, 2, 0, 0x80 + 2 * i,
+                                            readPoolRegister, writePoolRegister, poolRegisterAddress)
+        registers["ar%d" % i] = slotRegister("ar%d" % i, "ar%d" % i, 2)
+    for name in ("ip", "sp", "ap", "wl", "flg"):
+        registers[name] = slotRegister(name, name, 2)
+    registers["rs"] = slotRegister("rs", "rs", 1)
+
+    for name, register in registers.items():
+        table[getattr(oper_ID, name)] = register
+
+    for i in range(4):
+        for prefix, idName in (("wi", "wi%dOffset"), ("pi", "pi%dOffset"), ("ar", "ar%dOffset")):
+            table[getattr(oper_ID, idName % i)] = memoryOperand("@%s%d+" % (prefix, i), registers[prefix + str(i)], True)
+        for prefix, idName in (("wi", "atWi%d"), ("pi", "atPi%d"), ("ar", "atAr%d")):
+            table[getattr(oper_ID, idName % i)] = memoryOperand("@%s%d" % (prefix, i), registers[prefix + str(i)], False)
+    for name in ("sp", "ap", "wl"):
+        table[getattr(oper_ID, name + "Offset")] = memoryOperand("@%s+" % name, registers[name], True)
+        table[getattr(oper_ID, "at" + name.capitalize())] = memoryOperand("@" + name, registers[name], False)
+
+    for name, size in (("lit8", 1), ("lit16", 2), ("lit32", 4), ("lit64", 8)):
+        table[getattr(oper_ID, name)] = OperandType(name, KIND_LITERAL, size, size, None,
+                                                    readLiteral, writeLiteral, literalAddress, True)
+    table[oper_ID.litAddr] = OperandType("@", KIND_MEMORY, 0, 2, None,
+                                         readLiteralMemory, writeLiteralMemory, literalMemoryAddress)
+
+    for name in ("ZF", "SF", "OF", "NOF", "TF", "EF", "DZF", "RF", "SEF", "FMF"):
+        table[getattr(oper_ID, name)] = OperandType(name, KIND_FLAG, 1, 0, getattr(flag_bits, name),
+                                                    readFlag, writeFlag, flagAddress)
+    table[oper_ID.WLB] = OperandType("WLB", KIND_FLAG, 1, 0, None, readWordLengthBits, writeWordLengthBits, flagAddress)
+
+    for name, offset in (("wsg0", 0), ("wsg1", 64), ("psg0", 128), ("psg1", 192)):
+        table[getattr(oper_ID, name)] = OperandType(name, KIND_SIMD, SIMDGroupSize, 0, offset,
+                                                    readSIMD, writeLiteral, SIMDAddress)
+    return table
+
+operandTable = buildOperandTable()
+
+# Instruction decoders. Each takes the machine, the address of the instruction, its handler,
+# op-code and operand type bits and returns a DecodedInstruction.
+
+def decodeNoOperands (m, address, handler, opCode, typeBits):
+    return DecodedInstruction(address, 1, handler, opCode, typeBits, None, ())
+
+def decodeByteOperand (m, address, handler, opCode, typeBits):
+    return DecodedInstruction(address, 2, handler, opCode, typeBits, m.memory[(address + 1) & 0xFFFF], ())
+
+def decodeAddressOperand (m, address, handler, opCode, typeBits):
+    target = int.from_bytes(m.load((address + 1) & 0xFFFF, 2), "big")
+    return DecodedInstruction(address, 3, handler, opCode, typeBits, target, ())
+
+def makeStandardDecoder (operandCount):
+    def decodeStandardOperands (m, address, handler, opCode, typeBits):
+        memory = m.memory
+        operands = []
+        position = (address + 1 + operandCount) & 0xFFFF
+        for i in range(operandCount):
+            field = memory[(address + 1 + i) & 0xFFFF]
+            if typeBits & (0b100 >> i):
+                operandType = operandTable[field]
+                if operandType is None:
+                    raise InvalidInstruction("Unknown operand ID {:02X}.".format(field))
+                if operandType.payloadSize:
+                    size = operandType.payloadSize
+                    arg = int.from_bytes(m.load(position, size), "big", signed=operandType.signedPayload)
+                    position = (position + size) & 0xFFFF
+                else:
+                    arg = operandType.fixedArg
+                operands.append((operandType, arg))
+            else:
+                operands.append((poolOperand, field))
+        length = (position - address) & 0xFFFF
+        return DecodedInstruction(address, length, handler, opCode, typeBits, None, tuple(operands))
+    return decodeStandardOperands
+
+# Instruction handlers. Each takes the machine and the decoded instruction. ip already points to
+# the next instruction when a handler runs.
+
+def executeExit (m, instruction):
+    raise Halt(instruction.immediate)
+
+def operationWidth (m, operandType):
+    if operandType.kind == KIND_POOL:
+        return m.wordBytes
+    return operandType.width
+
+def sourceWidth (m, operandType):
+    if operandType.kind == KIND_POOL:
+        return m.wordBytes
+    if operandType.kind == KIND_MEMORY:
+        return 0
+    return operandType.width
+
+def checkSIMD (operands):
+    for operandType, arg in operands:
+        if operandType.kind == KIND_SIMD:
+            return True
+    return False
+
+def checkMemoryOperands (operands):
+    memoryOperands = 0
+    for operandType, arg in operands:
+        if operandType.kind == KIND_MEMORY:
+            memoryOperands += 1
+    if memoryOperands > 1:
+        raise InvalidInstruction("Only one operand of an instruction can be memory.")
+
+# Set ZF and SF from a result, and any further flags passed in 'setBits'. The flags in 'clearBits',
+# which include those of 'setBits', are cleared first. ZF and SF are only recorded, as the result
+# and its sign bit, to be set when the flags register is read; a later result replaces them.
+def setResultFlags (m, result, signBit, clearBits, setBits):
+    if clearBits:
+        m.flags = (m.flags & ~clearBits) | setBits
+    m.flagResult = (result, signBit)
+
+# The arithmetic and logic operations on integers. Each takes the unsigned operands, the width in
+# bits and whether the destination is signed (data-pool or memory rather than a register) and
+# returns the unsigned result, the flags to set and an exit code if the operation raises an error.
+def addIntegers (a, b, bits, isSigned):
+    mask = (1 << bits) - 1; signBit = 1 << (bits - 1)
+    total = a + b
+    result = total & mask
+    flags = flag_bits.OF if total > mask else 0
+    if isSigned and not ((a ^ b) & signBit) and ((result ^ a) & signBit):
+        return result, flags | flag_bits.NOF, exit_codes.signBitOverflow
+    return result, flags, None
+
+def subtractIntegers (a, b, bits, isSigned):
+    mask = (1 << bits) - 1; signBit = 1 << (bits - 1)
+    result = (a - b) & mask
+    flags = flag_bits.OF if a < b else 0
+    if isSigned and ((a ^ b) & signBit) and ((result ^ a) & signBit):
+        return result, flags | flag_bits.NOF, exit_codes.signBitOverflow
+    return result, flags, None
+
+def andIntegers (a, b, bits, isSigned):
+    return a & b, 0, None
+
+def orIntegers (a, b, bits, isSigned):
+    return a | b, 0, None
+
+def norIntegers (a, b, bits, isSigned):
+    return ~(a | b) & ((1 << bits) - 1), 0, None
+
+def xorIntegers (a, b, bits, isSigned):
+    return a ^ b, 0, None
+
+integerOperations = {op_codes.iAdd: addIntegers, op_codes.iSub: subtractIntegers, op_codes.iAnd: andIntegers,
+                     op_codes.iOr: orIntegers, op_codes.iNor: norIntegers, op_codes.iXor: xorIntegers}
+# The flags an operation recomputes besides ZF and SF.
+arithmeticFlags = flag_bits.OF | flag_bits.NOF
+operationClearBits = {op_codes.iAdd: arithmeticFlags, op_codes.iSub: arithmeticFlags, op_codes.iAnd: 0,
+                      op_codes.iOr: 0, op_codes.iNor: 0, op_codes.iXor: 0}
+
+floatFormats = {2: struct.Struct(">e"), 4: struct.Struct(">f"), 8: struct.Struct(">d")}
+
+def readPoolFloat (m, address):
+    size = m.wordBytes
+    if address + size > 256:
+        raise InvalidInstruction("A data-pool operand runs past the end of the data-pool.")
+    return floatFormats[size].unpack_from(m.dataPool, address)[0]
+
+# Store a float of the word length and return the value stored, rounded to the word length.
+def writePoolFloat (m, address, value):
+    size = m.wordBytes
+    if address + size > 256:
+        raise InvalidInstruction("A data-pool operand runs past the end of the data-pool.")
+    m.windowDirty |= windowHalves[address] | windowHalves[address + size - 1]
+    return packPoolFloat(m.dataPool, address, value, floatFormats[size])
+
+# Values too large for the format are stored as infinities, like IEEE arithmetic rounds them.
+def packPoolFloat (pool, address, value, format):
+    try:
+        format.pack_into(pool, address, value)
+    except OverflowError:
+        format.pack_into(pool, address, float("inf") if value > 0 else float("-inf"))
+    return format.unpack_from(pool, address)[0]
+
+# Read a source operand as a float for floating-point arithmetic.
+def readFloatSource (m, operandType, arg):
+    if operandType.kind == KIND_POOL:
+        return readPoolFloat(m, arg)
+    if operandType.kind == KIND_MEMORY:
+        return floatFormats[m.wordBytes].unpack(bytes(m.load(operandType.address(m, arg), m.wordBytes)))[0]
+    return float(operandType.read(m, arg, m.wordBytes))
+
+def isFloatOperation (m, destinationType):
+    return m.floatMode and m.wordBytes > 1 and destinationType.kind == KIND_POOL
+
+def setFloatFlags (m, result, clearBits, setBits):
+    flags = m.flg & ~(flag_bits.ZF | flag_bits.SF | clearBits)
+    if result == 0:
+        flags |= flag_bits.ZF
+    elif result < 0:
+        flags |= flag_bits.SF
+    m.flg = flags | setBits
+
+floatOperations = {op_codes.iAdd: lambda a, b: a + b, op_codes.iSub: lambda a, b: a - b}
+
+# add, sub, and, or, nor and xor. A data-pool destination is left to the kernels of the mode (see
+# ModeKernels); other destinations are unsigned and as wide as they are.
+def executeBinary (m, instruction):
+    (destinationType, destination), (sourceType, source) = instruction.operands
+    if destinationType.kind == KIND_POOL and sourceType.kind != KIND_SIMD:
+        m.kernels.binary[instruction.opCode](m, destination, sourceType, source)
+        return
+    if destinationType.kind == KIND_SIMD or sourceType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_MEMORY or destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Memory and literals can only be destinations of mov.")
+    opCode = instruction.opCode
+    width = destinationType.width
+    bits = width * 8; mask = (1 << bits) - 1
+    a = destinationType.read(m, destination, width) & mask
+    b = sourceType.read(m, source, width) & mask
+    result, flags, unused = integerOperations[opCode](a, b, bits, False)
+    destinationType.write(m, destination, width, result)
+    setResultFlags(m, result, 1 << (bits - 1), operationClearBits[opCode], flags)
+
+def executeNot (m, instruction):
+    ((destinationType, destination),) = instruction.operands
+    if destinationType.kind == KIND_POOL:
+        m.kernels.invert(m, destination)
+        return
+    if destinationType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_MEMORY or destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Memory and literals can only be destinations of mov.")
+    width = destinationType.width
+    bits = width * 8; mask = (1 << bits) - 1
+    result = ~destinationType.read(m, destination, width) & mask
+    destinationType.write(m, destination, width, result)
+    setResultFlags(m, result, 1 << (bits - 1), 0, 0)
+
+def executeCmp (m, instruction):
+    (firstType, first), (secondType, second) = instruction.operands
+    if firstType.kind == KIND_SIMD or secondType.kind == KIND_SIMD:
+        m.flg |= flag_bits.SEF
+        m.raiseError(exit_codes.SIMDError)
+        return
+    if firstType.kind == KIND_POOL:
+        m.kernels.compare(m, first, secondType, second)
+        return
+    checkMemoryOperands(instruction.operands)
+
+    if isFloatOperation(m, secondType):
+        result = readFloatSource(m, firstType, first) - readFloatSource(m, secondType, second)
+        setFloatFlags(m, result, arithmeticFlags, 0)
+        return
+
+    width = sourceWidth(m, firstType) or sourceWidth(m, secondType) or 2
+    bits = width * 8; mask = (1 << bits) - 1
+    a = firstType.read(m, first, width) & mask
+    b = secondType.read(m, second, width) & mask
+    isSigned = firstType.kind != KIND_REGISTER
+    result, flags, error = subtractIntegers(a, b, bits, isSigned)
+    setResultFlags(m, result, 1 << (bits - 1), arithmeticFlags, flags)
+    if error is not None:
+        m.raiseError(error)
+
+# mul and div. The first operand receives the upper half of the product or the modulo and the
+# second the lower half of the product or the quotient. When the first two operands are the same,
+# only the second result is stored.
+def executeMulDiv (m, instruction):
+    (highType, high), (lowType, low), (sourceType, source) = instruction.operands
+    if highType.kind == KIND_SIMD or lowType.kind == KIND_SIMD or sourceType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    for operandType in (highType, lowType):
+        if operandType.kind == KIND_MEMORY or operandType.kind == KIND_LITERAL:
+            raise InvalidInstruction("Memory and literals can only be destinations of mov.")
+    singleDestination = highType is lowType and high == low
+    isMul = instruction.opCode == op_codes.iMul
+
+    if isFloatOperation(m, lowType):
+        a = readPoolFloat(m, low)
+        b = readFloatSource(m, sourceType, source)
+        if isMul:
+            results = (0.0, a * b)
+        elif b == 0:
+            m.flg |= flag_bits.DZF
+            m.raiseError(exit_codes.divideByZero)
+            return
+        else:
+            results = (a % b, a // b)
+        if not singleDestination and highType.kind == KIND_POOL:
+            writePoolFloat(m, high, results[0])
+        setFloatFlags(m, writePoolFloat(m, low, results[1]), arithmeticFlags | flag_bits.DZF, 0)
+        return
+
+    width = operationWidth(m, lowType)
+    bits = width * 8; mask = (1 << bits) - 1; signBit = 1 << (bits - 1)
+    isSigned = lowType.kind == KIND_POOL
+    a = lowType.read(m, low, width) & mask
+    b = sourceType.read(m, source, width) & mask
+    if isSigned:
+        a = toSigned(a, bits); b = toSigned(b, bits)
+    setBits = 0; error = None
+    if isMul:
+        product = a * b
+        lowResult = product & mask
+        highResult = (product >> bits) & mask
+        if singleDestination:
+            if (a & mask) * (b & mask) > mask:
+                setBits |= flag_bits.OF; error = exit_codes.unresolvedError
+            if isSigned and toSigned(lowResult, bits) != product:
+                setBits |= flag_bits.NOF; error = exit_codes.signBitOverflow
+        # The flags of a full product come from the product of twice the width; its sign bit is
+        # that of a Python int one bit further up, which is only set when the product is negative.
+        flagValue = product & mask if singleDestination else product
+        flagSignBit = signBit if singleDestination else 1 << (2 * bits)
+    else:
+        if b == 0:
+            m.flg |= flag_bits.DZF
+            m.raiseError(exit_codes.divideByZero)
+            return
+        quotient = a // b
+        highResult = (a % b) & mask
+        lowResult = quotient & mask
+        if isSigned and toSigned(lowResult, bits) != quotient:
+            setBits |= flag_bits.NOF; error = exit_codes.signBitOverflow
+        flagValue = lowResult
+        flagSignBit = signBit
+
+    if not singleDestination:
+        highType.write(m, high, width, highResult)
+    lowType.write(m, low, width, lowResult)
+    setResultFlags(m, flagValue, flagSignBit, arithmeticFlags | flag_bits.DZF, setBits)
+    if error is not None:
+        m.raiseError(error)
+
+def executeIgn (m, instruction):
+    if instruction.typeBits:
+        m.flg |= flag_bits.RF
+    else:
+        m.flg &= ~flag_bits.RF
+
+def executeMode (m, instruction):
+    mode = instruction.immediate
+    if mode & 0x0F > 3:
+        raise InvalidInstruction("The word length in a mode instruction must be 0 to 3.")
+    flags = (m.flg & ~(flag_bits.WLB | flag_bits.FMF)) | ((mode & 0x03) << flag_bits.WLBShift)
+    if mode & 0xF0:
+        flags |= flag_bits.FMF
+    m.setFlags(flags)
+
+def executeJfl (m, instruction):
+    flagBit = branchFlags[instruction.typeBits]
+    if m.flg & flagBit:
+        m.ip = instruction.immediate
+    if flagBit == flag_bits.EF:
+        m.flg &= ~flag_bits.EF
+        m.pendingError = None
+
+def executeSfl (m, instruction):
+    flagBit = branchFlags[instruction.typeBits]
+    if not m.flg & flagBit:
+        m.ip = instruction.immediate
+    if flagBit == flag_bits.EF:
+        m.flg &= ~flag_bits.EF
+        m.pendingError = None
+
+# call saves ip (already pointing at the next instruction,) sp and ap at ap-6, ap-4 and ap-2 and
+# starts a new stack frame at ap-6. ret reverses it.
+def executeCall (m, instruction):
+    frame = (m.ap - 6) & 0xFFFF
+    m.store(frame, m.ip.to_bytes(2, "big") + m.sp.to_bytes(2, "big") + m.ap.to_bytes(2, "big"))
+    m.sp = frame
+    m.ap = frame
+    m.ip = instruction.immediate
+    m.flg |= flag_bits.RF
+
+def executeRet (m, instruction):
+    frame = m.load(m.sp, 6)
+    m.ip = (frame[0] << 8) | frame[1]
+    m.ap = (frame[4] << 8) | frame[5]
+    m.sp = (frame[2] << 8) | frame[3]
+    m.flg |= flag_bits.RF
+    status = instruction.immediate
+    if status:
+        m.rs = status
+        m.raiseError(status)
+
+def executeMov (m, instruction):
+    (destinationType, destination), (sourceType, source) = instruction.operands
+    if destinationType.kind == KIND_SIMD or sourceType.kind == KIND_SIMD:
+        executeSIMD(m, instruction)
+        return
+    if destinationType.kind == KIND_POOL:
+        m.kernels.move(m, destination, sourceType, source)
+        return
+    if destinationType.kind == KIND_LITERAL:
+        raise InvalidInstruction("Literals cannot be destination operands.")
+    checkMemoryOperands(instruction.operands)
+    if destinationType.kind == KIND_MEMORY:
+        width = sourceWidth(m, sourceType)
+    else:
+        width = operationWidth(m, destinationType)
+    destinationType.write(m, destination, width, sourceType.read(m, source, width))
+
+# Write the memory window back to where it's mapped and read the window at its new location.
+#
+# Only the halves of the window (its two SIMD groups) marked in windowDirty are written back. A
+# half is marked when the data-pool is written there, by the operand writes, the mode kernels,
+# the SIMD operations and translated code, and when memory under it is written (see
+# Machine.windowWrite), since writing the whole window back would overwrite that memory with the
+# window's copy. That leaves memory exactly as writing the whole window would. A window that is
+# moved to where it already is doesn't need to be read again after being written back.
+def moveWindow (m, newLocation):
+    oldLocation = m.wl
+    if oldLocation + windowSize <= memorySize:
+        dirty = m.windowDirty
+        if dirty:
+            # With both halves marked, store() doesn't mark the bytes being written back again.
+            m.windowDirty = windowBothHalves
+            if dirty == windowBothHalves:
+                m.store(oldLocation, m.dataPool[0:windowSize])
+                m.windowBytesWritten += windowSize
+            elif dirty == windowLowHalf:
+                m.store(oldLocation, m.dataPool[0:SIMDGroupSize])
+                m.windowBytesWritten += SIMDGroupSize
+            else:
+                m.store(oldLocation + SIMDGroupSize, m.dataPool[SIMDGroupSize:windowSize])
+                m.windowBytesWritten += SIMDGroupSize
+        if newLocation == oldLocation:
+            m.windowDirty = 0
+            return
+    else:
+        m.store(oldLocation, m.dataPool[0:windowSize])
+        m.windowBytesWritten += windowSize
+    m.wl = newLocation
+    m.dataPool[0:windowSize] = m.load(newLocation, windowSize)
+    m.windowBytesRead += windowSize
+    m.windowDirty = 0
+
+def executeMw (m, instruction):
+    ((sourceType, source),) = instruction.operands
+    moveWindow(m, sourceType.address(m, source))
+
+def executeAlloc (m, instruction):
+    ((sourceType, source),) = instruction.operands
+    if sourceType.kind == KIND_SIMD:
+        m.flg |= flag_bits.SEF
+        m.raiseError(exit_codes.SIMDError)
+        return
+    b = sourceType.read(m, source, 2) & 0xFFFF
+    result, flags, error = subtractIntegers(m.ap, b, 16, False)
+    m.ap = result
+    setResultFlags(m, result, 0x8000, arithmeticFlags, flags)
+
+def executeIOchan (m, instruction):
+    ((sourceType, source),) = instruction.operands
+    m.io.select(m, sourceType.address(m, source))
+
+def executeIn (m, instruction):
+    (startType, start), (endType, end) = instruction.operands
+    startAddress = startType.address(m, start)
+    size = ((endType.address(m, end) - startAddress) & 0xFFFF) + 1
+    m.io.readInto(m, startAddress, size)
+
+def executeOut (m, instruction):
+    (startType, start), (endType, end) = instruction.operands
+    startAddress = startType.address(m, start)
+    size = ((endType.address(m, end) - startAddress) & 0xFFFF) + 1
+    m.io.write(bytes(m.load(startAddress, size)))
+
+def executeOuts (m, instruction):
+    ((sourceType, source),) = instruction.operands
+    m.io.write(m.readString(sourceType.address(m, source)))
+
+def executeSeek (m, instruction):
+    ((sourceType, source),) = instruction.operands
+    m.io.seek(sourceType.read(m, source, 8) & 0xFFFFFFFFFFFFFFFF)
+
+def executeInth (m, instruction):
+    m.interruptHandler = instruction.immediate
+
+def executeNOP (m, instruction):
+    pass
+
+# Mode kernels. The mode flags decide how wide data-pool operands are and whether add, sub and cmp
+# on them work on integers or IEEE floats. Instead of the handlers looking at the mode for every
+# instruction, a ModeKernels holds the work of add, sub, and, or, nor, xor, not, cmp and mov on a
+# data-pool destination (the first operand of cmp) for one mode, with the width, masks and struct
+# formats fixed. The machine keeps the kernels of its mode in m.kernels, which setFlags() swaps
+# whenever the mode flags are written; by mode, or by writing flg, WLB or FMF. There are no byte
+# floats, so in byte mode the floating-point kernels are the integer ones.
+poolOverrun = "A data-pool operand runs past the end of the data-pool."
+unsignedFormats = {1: struct.Struct(">B"), 2: struct.Struct(">H"), 4: struct.Struct(">I"), 8: struct.Struct(">Q")}
+
+class ModeKernels:
+    def __init__(self, modeFlags):
+        self.wordBytes = size = 1 << ((modeFlags & flag_bits.WLB) >> flag_bits.WLBShift)
+        self.floatMode = bool(modeFlags & flag_bits.FMF)
+        isFloat = self.floatMode and size > 1
+        self.binary = {}
+        for opCode, operation in integerOperations.items():
+            if isFloat and opCode in floatOperations:
+                self.binary[opCode] = floatBinaryKernel(floatOperations[opCode], size)
+            else:
+                self.binary[opCode] = integerBinaryKernel(operation, operationClearBits[opCode], size)
+        self.invert = notKernel(size)
+        self.compare = floatCompareKernel(size) if isFloat else integerCompareKernel(size)
+        self.move = moveKernel(size)
+
+# The source operand of an integer kernel, as an unsigned integer of the kernel's width.
+def integerSourceReader (size):
+    mask = (1 << (size * 8)) - 1
+    unpack = unsignedFormats[size].unpack_from
+    def read (m, sourceType, source):
+        if sourceType.kind == KIND_POOL:
+            if source + size > 256:
+                raise InvalidInstruction(poolOverrun)
+            return unpack(m.dataPool, source)[0]
+        return sourceType.read(m, source, size) & mask
+    return read
+
+# The source operand of a floating-point kernel, like readFloatSource().
+def floatSourceReader (size):
+    format = floatFormats[size]
+    def read (m, sourceType, source):
+        if sourceType.kind == KIND_POOL:
+            if source + size > 256:
+                raise InvalidInstruction(poolOverrun)
+            return format.unpack_from(m.dataPool, source)[0]
+        if sourceType.kind == KIND_MEMORY:
+            return format.unpack(bytes(m.load(sourceType.address(m, source), size)))[0]
+        return float(sourceType.read(m, source, size))
+    return read
+
+def integerBinaryKernel (operation, clearBits, size):
+    bits = size * 8; signBit = 1 << (bits - 1)
+    format = unsignedFormats[size]
+    unpack = format.unpack_from; pack = format.pack_into
+    readSource = integerSourceReader(size)
+    def kernel (m, destination, sourceType, source):
+        if destination + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        pool = m.dataPool
+        a = unpack(pool, destination)[0]
+        result, flags, error = operation(a, readSource(m, sourceType, source), bits, True)
+        pack(pool, destination, result)
+        if destination < windowSize:
+            m.windowDirty |= windowHalves[destination] | windowHalves[destination + size - 1]
+        setResultFlags(m, result, signBit, clearBits, flags)
+        if error is not None:
+            m.raiseError(error)
+    return kernel
+
+def floatBinaryKernel (operation, size):
+    format = floatFormats[size]
+    readSource = floatSourceReader(size)
+    def kernel (m, destination, sourceType, source):
+        if destination + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        pool = m.dataPool
+        result = operation(format.unpack_from(pool, destination)[0], readSource(m, sourceType, source))
+        result = packPoolFloat(pool, destination, result, format)
+        if destination < windowSize:
+            m.windowDirty |= windowHalves[destination] | windowHalves[destination + size - 1]
+        setFloatFlags(m, result, arithmeticFlags, flag_bits.OF if result in (float("inf"), float("-inf")) else 0)
+    return kernel
+
+def notKernel (size):
+    mask = (1 << (size * 8)) - 1; signBit = 1 << (size * 8 - 1)
+    format = unsignedFormats[size]
+    def kernel (m, destination):
+        if destination + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        result = ~format.unpack_from(m.dataPool, destination)[0] & mask
+        format.pack_into(m.dataPool, destination, result)
+        if destination < windowSize:
+            m.windowDirty |= windowHalves[destination] | windowHalves[destination + size - 1]
+        setResultFlags(m, result, signBit, 0, 0)
+    return kernel
+
+def integerCompareKernel (size):
+    bits = size * 8; signBit = 1 << (bits - 1)
+    unpack = unsignedFormats[size].unpack_from
+    readSource = integerSourceReader(size)
+    def kernel (m, first, secondType, second):
+        if first + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        a = unpack(m.dataPool, first)[0]
+        result, flags, error = subtractIntegers(a, readSource(m, secondType, second), bits, True)
+        setResultFlags(m, result, signBit, arithmeticFlags, flags)
+        if error is not None:
+            m.raiseError(error)
+    return kernel
+
+def floatCompareKernel (size):
+    format = floatFormats[size]
+    readSource = floatSourceReader(size)
+    def kernel (m, first, secondType, second):
+        if first + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        result = format.unpack_from(m.dataPool, first)[0] - readSource(m, secondType, second)
+        setFloatFlags(m, result, arithmeticFlags, 0)
+    return kernel
+
+def moveKernel (size):
+    pack = unsignedFormats[size].pack_into
+    readSource = integerSourceReader(size)
+    def kernel (m, destination, sourceType, source):
+        value = readSource(m, sourceType, source)
+        if destination + size > 256:
+            raise InvalidInstruction(poolOverrun)
+        pack(m.dataPool, destination, value)
+        if destination < windowSize:
+            m.windowDirty |= windowHalves[destination] | windowHalves[destination + size - 1]
+    return kernel
+
+# The kernels of every mode, by mode flags.
+def buildModeKernels ():
+    kernels = {}
+    for floatFlag in (0, flag_bits.FMF):
+        for wordLength in range(4):
+            modeFlags = floatFlag | (wordLength << flag_bits.WLBShift)
+            kernels[modeFlags] = ModeKernels(modeFlags)
+    return kernels
+
+modeKernels = buildModeKernels()
+
+# SIMD operands. Each group is 64 bytes of the data-pool divided into words of the data-pool word
+# length. An operation with a SIMD destination is performed on every word of the group, with the
+# source being another SIMD group, 64 bytes of memory or a scalar applied to every word. Flags
+# aren't set by SIMD operations. A scalar destination with a SIMD source sets SEF and EF.
+
+def SIMDLanes (m, operandType, arg, width):
+    if operandType.kind == KIND_SIMD:
+        return [int.from_bytes(m.dataPool[offset:offset + width], "big", signed=True)
+                for offset in range(arg, arg + SIMDGroupSize, width)]
+    if operandType.kind == KIND_MEMORY:
+        data = m.load(operandType.address(m, arg), SIMDGroupSize)
+        return [int.from_bytes(data[offset:offset + width], "big", signed=True)
+                for offset in range(0, SIMDGroupSize, width)]
+    return [toSigned(operandType.read(m, arg, width), width * 8)] * (SIMDGroupSize // width)
+
+def writeSIMDLanes (m, offset, width, lanes):
+    mask = (1 << (width * 8)) - 1
+    m.dataPool[offset:offset + SIMDGroupSize] = b"".join((lane & mask).to_bytes(width, "big") for lane in lanes)
+
+def SIMDFloatLanes (m, operandType, arg, width):
+    laneFormat = struct.Struct(">%d%s" % (SIMDGroupSize // width, floatFormats[width].format[-1]))
+    if operandType.kind == KIND_SIMD:
+        return list(laneFormat.unpack_from(m.dataPool, arg))
+    if operandType.kind == KIND_MEMORY:
+        return list(laneFormat.unpack(bytes(m.load(operandType.address(m, arg), SIMDGroupSize))))
+    return [float(operandType.read(m, arg, width))] * (SIMDGroupSize // width)
+
+def writeSIMDFloatLanes (m, offset, width, lanes):
+    laneFormat = struct.Struct(">%d%s" % (SIMDGroupSize // width, floatFormats[width].format[-1]))
+    try:
+        laneFormat.pack_into(m.dataPool, offset, *lanes)
+    except OverflowError:
+        for i, lane in enumerate(lanes):
+            writePoolFloat(m, offset + i * width, lane)
+
+SIMDIntegerOperations = {
+    op_codes.iAdd: lambda a, b: a + b, op_codes.iSub: lambda a, b: a - b,
+    op_codes.iAnd: lambda a, b: a & b, op_codes.iOr: lambda a, b: a | b,
+    op_codes.iNor: lambda a, b: ~(a | b), op_codes.iXor: lambda a, b: a ^ b,
+    op_codes.iMul: lambda a, b: a * b,
+}
+SIMDFloatOperations = {op_codes.iAdd: lambda a, b: a + b, op_codes.iSub: lambda a, b: a - b,
+                       op_codes.iMul: lambda a, b: a * b}
+
+# Mark the halves of the memory window an SIMD instruction writes dirty; the group of its
+# destination, or the groups of both destinations of mul and div.
+def markSIMDDestinations (m, opCode, operands):
+    for operandType, arg in operands[:2] if opCode == op_codes.iMul or opCode == op_codes.iDiv else operands[:1]:
+        if operandType.kind == KIND_SIMD:
+            m.windowDirty |= windowHalves[arg]
+
+def SIMDError (m):
+    m.flg |= flag_bits.SEF
+    m.raiseError(exit_codes.SIMDError)
+
+def executeSIMDLanes (m, instruction):
+    opCode = instruction.opCode
+    operands = instruction.operands
+    width = m.wordBytes
+    markSIMDDestinations(m, opCode, operands)
+
+    if opCode == op_codes.iMov:
+        (destinationType, destination), (sourceType, source) = operands
+        if destinationType.kind == KIND_MEMORY and sourceType.kind == KIND_SIMD:
+            m.store(destinationType.address(m, destination), m.dataPool[source:source + SIMDGroupSize])
+            return
+        if destinationType.kind != KIND_SIMD:
+            SIMDError(m)
+            return
+        if sourceType.kind == KIND_SIMD:
+            m.dataPool[destination:destination + SIMDGroupSize] = m.dataPool[source:source + SIMDGroupSize]
+        elif sourceType.kind == KIND_MEMORY:
+            m.dataPool[destination:destination + SIMDGroupSize] = m.load(sourceType.address(m, source), SIMDGroupSize)
+        else:
+            writeSIMDLanes(m, destination, width, SIMDLanes(m, sourceType, source, width))
+        return
+
+    if opCode == op_codes.iNot:
+        ((destinationType, destination),) = operands
+        writeSIMDLanes(m, destination, width, [~lane for lane in SIMDLanes(m, destinationType, destination, width)])
+        return
+
+    if opCode == op_codes.iMul or opCode == op_codes.iDiv:
+        (highType, high), (lowType, low), (sourceType, source) = operands
+        if highType.kind != KIND_SIMD or lowType.kind != KIND_SIMD:
+            SIMDError(m)
+            return
+        if opCode == op_codes.iDiv:
+            a = SIMDLanes(m, lowType, low, width)
+            b = SIMDLanes(m, sourceType, source, width)
+            if 0 in b:
+                m.flg |= flag_bits.DZF
+                m.raiseError(exit_codes.divideByZero)
+                return
+            if high != low:
+                writeSIMDLanes(m, high, width, [x % y for x, y in zip(a, b)])
+            writeSIMDLanes(m, low, width, [x // y for x, y in zip(a, b)])
+            return
+        operands = ((lowType, low), (sourceType, source))
+        if high != low:
+            a = SIMDLanes(m, lowType, low, width)
+            b = SIMDLanes(m, sourceType, source, width)
+            products = [x * y for x, y in zip(a, b)]
+            writeSIMDLanes(m, high, width, [product >> (width * 8) for product in products])
+            writeSIMDLanes(m, low, width, products)
+            return
+
+    (destinationType, destination), (sourceType, source) = operands
+    if destinationType.kind != KIND_SIMD:
+        SIMDError(m)
+        return
+    if m.floatMode and width > 1 and opCode in SIMDFloatOperations:
+        operation = SIMDFloatOperations[opCode]
+        a = SIMDFloatLanes(m, destinationType, destination, width)
+        b = SIMDFloatLanes(m, sourceType, source, width)
+        writeSIMDFloatLanes(m, destination, width, [operation(x, y) for x, y in zip(a, b)])
+        return
+    operation = SIMDIntegerOperations[opCode]
+    a = SIMDLanes(m, destinationType, destination, width)
+    b = SIMDLanes(m, sourceType, source, width)
+    writeSIMDLanes(m, destination, width, [operation(x, y) for x, y in zip(a, b)])
+
+# The same operations performed with NumPy. Every SIMD group is a NumPy array viewing the
+# data-pool directly, with big-endian elements of the word length, so an operation on a group is
+# a single vectorized operation writing straight into the data-pool. 64 byte memory operands are
+# viewed in place too, unless they wrap around the end of memory.
+
+SIMDIntegerTypes = {1: ">i1", 2: ">i2", 4: ">i4", 8: ">i8"}
+SIMDFloatTypes = {2: ">f2", 4: ">f4", 8: ">f8"}
+
+if numpy is not None:
+    def SIMDNor (a, b, out):
+        numpy.bitwise_or(a, b, out=out)
+        numpy.invert(out, out=out)
+
+    SIMDVectorOperations = {
+        op_codes.iAdd: numpy.add, op_codes.iSub: numpy.subtract,
+        op_codes.iAnd: numpy.bitwise_and, op_codes.iOr: numpy.bitwise_or,
+        op_codes.iNor: SIMDNor, op_codes.iXor: numpy.bitwise_xor,
+        op_codes.iMul: numpy.multiply,
+    }
+    SIMDFloatVectorOperations = {op_codes.iAdd: numpy.add, op_codes.iSub: numpy.subtract,
+                                 op_codes.iMul: numpy.multiply}
+
+# The views of a machine's data-pool are made once per group, word length and number mode.
+def SIMDView (m, offset, width, isFloat):
+    key = (offset, width, isFloat)
+    view = m.SIMDViews.get(key)
+    if view is None:
+        dtype = SIMDFloatTypes[width] if isFloat else SIMDIntegerTypes[width]
+        view = numpy.frombuffer(m.dataPool, dtype, SIMDGroupSize // width, offset)
+        m.SIMDViews[key] = view
+    return view
+
+# The source of a SIMD operation as an array, or as a scalar to be broadcast over the group.
+def SIMDVectorSource (m, operandType, arg, width, isFloat):
+    if operandType.kind == KIND_SIMD:
+        return SIMDView(m, arg, width, isFloat)
+    dtype = SIMDFloatTypes[width] if isFloat else SIMDIntegerTypes[width]
+    if operandType.kind == KIND_MEMORY:
+        address = operandType.address(m, arg)
+        if address + SIMDGroupSize <= memorySize:
+            return numpy.frombuffer(m.memory, dtype, SIMDGroupSize // width, address)
+        return numpy.frombuffer(m.load(address, SIMDGroupSize), dtype)
+    value = operandType.read(m, arg, width)
+    if isFloat:
+        return float(value)
+    return toSigned(value, width * 8)
+
+def executeSIMDVectorized (m, instruction):
+    opCode = instruction.opCode
+    operands = instruction.operands
+    width = m.wordBytes
+    markSIMDDestinations(m, opCode, operands)
+
+    if opCode == op_codes.iMov:
+        (destinationType, destination), (sourceType, source) = operands
+        if destinationType.kind == KIND_MEMORY and sourceType.kind == KIND_SIMD:
+            m.store(destinationType.address(m, destination), m.dataPool[source:source + SIMDGroupSize])
+            return
+        if destinationType.kind != KIND_SIMD:
+            SIMDError(m)
+            return
+        if sourceType.kind == KIND_SIMD:
+            m.dataPool[destination:destination + SIMDGroupSize] = m.dataPool[source:source + SIMDGroupSize]
+        elif sourceType.kind == KIND_MEMORY:
+            m.dataPool[destination:destination + SIMDGroupSize] = m.load(sourceType.address(m, source), SIMDGroupSize)
+        else:
+            SIMDView(m, destination, width, False)[:] = SIMDVectorSource(m, sourceType, source, width, False)
+        return
+
+    if opCode == op_codes.iNot:
+        ((destinationType, destination),) = operands
+        view = SIMDView(m, destination, width, False)
+        numpy.invert(view, out=view)
+        return
+
+    if opCode == op_codes.iMul or opCode == op_codes.iDiv:
+        (highType, high), (lowType, low), (sourceType, source) = operands
+        if highType.kind != KIND_SIMD or lowType.kind != KIND_SIMD:
+            SIMDError(m)
+            return
+        a = SIMDView(m, low, width, False)
+        b = SIMDVectorSource(m, sourceType, source, width, False)
+        if opCode == op_codes.iDiv:
+            if not numpy.all(b):
+                m.flg |= flag_bits.DZF
+                m.raiseError(exit_codes.divideByZero)
+                return
+            with numpy.errstate(over="ignore"):
+                quotient, remainder = numpy.divmod(a, b)
+            if high != low:
+                SIMDView(m, high, width, False)[:] = remainder
+            a[:] = quotient
+            return
+        operands = ((lowType, low), (sourceType, source))
+        if high != low:
+            # The high words of 64-bit products don't fit any NumPy integer type.
+            if width == 8:
+                executeSIMDLanes(m, instruction)
+                return
+            products = a.astype(numpy.int64) * b
+            SIMDView(m, high, width, False)[:] = products >> (width * 8)
+            a[:] = products
+            return
+
+    (destinationType, destination), (sourceType, source) = operands
+    if destinationType.kind != KIND_SIMD:
+        SIMDError(m)
+        return
+    if m.floatMode and width > 1 and opCode in SIMDFloatVectorOperations:
+        # Like the scalar operations, compute in double precision and round once to the word length.
+        view = SIMDView(m, destination, width, True)
+        with numpy.errstate(all="ignore"):
+            view[:] = SIMDFloatVectorOperations[opCode](view, SIMDVectorSource(m, sourceType, source, width, True),
+                                                        dtype=numpy.float64)
+        return
+    view = SIMDView(m, destination, width, False)
+    SIMDVectorOperations[opCode](view, SIMDVectorSource(m, sourceType, source, width, False), out=view)
+
+executeSIMD = executeSIMDVectorized if numpy is not None else executeSIMDLanes
+
+# The decoder and handler of every op-code. Op-codes greater than NOP are alternative op-codes for
+# the exit instruction.
+instructionFormats = {
+    op_codes.iExit: (decodeByteOperand, executeExit),
+    op_codes.iAdd: (makeStandardDecoder(2), executeBinary),
+    op_codes.iSub: (makeStandardDecoder(2), executeBinary),
+    op_codes.iMul: (makeStandardDecoder(3), executeMulDiv),
+    op_codes.iDiv: (makeStandardDecoder(3), executeMulDiv),
+    op_codes.iIgn: (decodeNoOperands, executeIgn),
+    op_codes.iMode: (decodeByteOperand, executeMode),
+    op_codes.iAnd: (makeStandardDecoder(2), executeBinary),
+    op_codes.iOr: (makeStandardDecoder(2), executeBinary),
+    op_codes.iNor: (makeStandardDecoder(2), executeBinary),
+    op_codes.iXor: (makeStandardDecoder(2), executeBinary),
+    op_codes.iNot: (makeStandardDecoder(1), executeNot),
+    op_codes.iCmp: (makeStandardDecoder(2), executeCmp),
+    op_codes.iJfl: (decodeAddressOperand, executeJfl),
+    op_codes.iSfl: (decodeAddressOperand, executeSfl),
+    op_codes.iCall: (decodeAddressOperand, executeCall),
+    op_codes.iRet: (decodeByteOperand, executeRet),
+    op_codes.iMov: (makeStandardDecoder(2), executeMov),
+    op_codes.iMw: (makeStandardDecoder(1), executeMw),
+    op_codes.iAlloc: (makeStandardDecoder(1), executeAlloc),
+    op_codes.iIOchan: (makeStandardDecoder(1), executeIOchan),
+    op_codes.iIn: (makeStandardDecoder(2), executeIn),
+    op_codes.iOut: (makeStandardDecoder(2), executeOut),
+    op_codes.iOuts: (makeStandardDecoder(1), executeOuts),
+    op_codes.iSeek: (makeStandardDecoder(1), executeSeek),
+    op_codes.iInth: (decodeAddressOperand, executeInth),
+    op_codes.iNOP: (decodeNoOperands, executeNOP),
+}
+
+# Mnemonics by op-code, for reports.
+opCodeNames = {instruction.opCode: name for name, instruction in op_codes.pneumonics.items()}
+
+def buildInstructionTable ():
+    table = []
+    for byte0 in range(256):
+        opCode = byte0 >> 3
+        decoder, handler = instructionFormats.get(opCode, instructionFormats[op_codes.iExit])
+        table.append((decoder, handler, opCode, byte0 & 0b111))
+    return table
+
+instructionTable = buildInstructionTable()
+
+# Block translation. A BlockTranslator turns a basic block into the source code of a Python
+# function and compiles it, for the mode flags (word length and floating-point mode) the machine
+# is in when the block is entered. Knowing the mode, the operand widths are known too, so the
+# common instructions (add, sub, and, or, nor, xor, not, cmp and mov on the data-pool, registers,
+# literals and memory, and mode, ign, jfl and sfl) are written out as the few Python statements
+# they come to for their particular operands, with literals folded in and the flags register kept
+# in a local variable. ZF and SF are only set from a result where the flags are used next: by a
+# branch, a handler or on leaving the function. Any other instruction is executed by calling its
+# handler, like the interpreter does. A block which branches back to its own start loops inside
+# its function.
+#
+# The function takes the machine and the number of instructions it may execute, at least as many
+# as the block holds, and returns the number it executed, leaving ip at the next instruction, and
+# the Link of the exit it left through, or None where the next block isn't known. It returns
+# early, without a link, when an instruction raises an error, which the next instruction has to
+# see, when a write to memory invalidates the block and after a handler which can change the mode.
+translationThreshold = 16
+
+# The registers kept in slots of the machine which translated code can use as attributes, and the
+# operand types of all registers by name.
+translatedSlotRegisters = frozenset(("ar0", "ar1", "ar2", "ar3", "sp", "ap", "wl", "rs"))
+registerTypes = {operandType.name: operandType for operandType in operandTable
+                 if operandType is not None and operandType.kind == KIND_REGISTER}
+
+class BlockTranslator:
+    def __init__(self, block, modeFlags):
+        self.block = block
+        self.modeFlags = modeFlags
+        self.wordBytes = 1 << ((modeFlags & flag_bits.WLB) >> flag_bits.WLBShift)
+        self.floatMode = bool(modeFlags & flag_bits.FMF)
+        self.lines = []
+        self.depth = 2
+        self.namespace = {"block": block}
+        # The sign bit of the result in r while its ZF and SF haven't been set yet.
+        self.resultSignBit = None
+
+    def translate (self):
+        block = self.block
+        instructions = block.instructions
+        self.emit("def translation (m, limit):", 0)
+        self.emit("pool = m.dataPool", 1)
+        self.emit("flg = m.flg", 1)
+        self.emit("n = 0", 1)
+        self.emit("while True:", 1)
+        for i, instruction in enumerate(instructions):
+            if self.translateInstruction(instruction, i):
+                break
+        else:
+            self.exit(instructions[-1].nextAddress, len(instructions), True)
+        code = compile("\n".join(self.lines), "<block {:04X}>".format(block.start), "exec")
+        exec(code, self.namespace)
+        return self.namespace["translation"]
+
+    def emit (self, line, depth = None):
+        self.lines.append("    " * (self.depth if depth is None else depth) + line)
+
+    # Leave the function with ip at 'address' after 'executed' instructions of this iteration. The
+    # machine has no pending result while a translation runs, so the flags are stored as they are.
+    # If 'linked' is true the next block is the one at 'address' in the mode translated for here.
+    def exit (self, address, executed, linked = False):
+        self.resultFlags(False)
+        self.emit("m.flags = flg")
+        self.emit("m.ip = {}".format(address))
+        self.emitReturn(executed, address if linked else None)
+
+    # Return 'executed' more instructions than n, and a Link to the block at 'target' or None.
+    def emitReturn (self, executed, target = None):
+        if target is None:
+            self.emit("return n + {}, None".format(executed))
+            return
+        link = Link(self.block, target, self.currentModeFlags())
+        self.block.exits.append(link)
+        name = "link{}".format(len(self.block.exits))
+        self.namespace[name] = link
+        self.emit("return n + {}, {}".format(executed, name))
+
+    # The mode flags of the mode the code being translated runs in.
+    def currentModeFlags (self):
+        return ((self.wordBytes.bit_length() - 1) << flag_bits.WLBShift) | (flag_bits.FMF if self.floatMode else 0)
+
+    # Translate the i-th instruction of the block. Returns True if it ends the function.
+    def translateInstruction (self, instruction, i):
+        opCode = instruction.opCode
+        if opCode in integerOperations:
+            translated = self.translateBinary(instruction, i)
+        elif opCode == op_codes.iNot:
+            translated = self.translateNot(instruction)
+        elif opCode == op_codes.iCmp:
+            translated = self.translateCmp(instruction, i)
+        elif opCode == op_codes.iMov:
+            translated = self.translateMov(instruction, i)
+        elif opCode == op_codes.iMode:
+            translated = self.translateMode(instruction)
+        elif opCode == op_codes.iIgn:
+            self.emit("flg |= {}".format(flag_bits.RF) if instruction.typeBits else "flg &= {}".format(~flag_bits.RF & 0xFFFF))
+            translated = True
+        elif opCode == op_codes.iJfl or opCode == op_codes.iSfl:
+            self.translateBranch(instruction, i)
+            return True
+        elif opCode == op_codes.iNOP:
+            translated = True
+        else:
+            translated = False
+        if translated:
+            return False
+        return self.callHandler(instruction, i)
+
+    # Execute an instruction by calling its handler, with the machine's ip and flags up to date.
+    def callHandler (self, instruction, i):
+        self.namespace["handler{}".format(i)] = instruction.handler
+        self.namespace["instruction{}".format(i)] = instruction
+        self.resultFlags()
+        self.emit("m.flags = flg")
+        self.emit("m.ip = {}".format(instruction.nextAddress))
+        self.emit("handler{0}(m, instruction{0})".format(i))
+        if instruction.endsBlock():
+            # call goes on to its routine; where any other block-ending instruction goes isn't known.
+            self.emitReturn(i + 1, instruction.immediate if instruction.opCode == op_codes.iCall else None)
+            return True
+        self.emit("flg = m.flg")
+        self.emit("if m.pendingError is not None:")
+        self.depth += 1
+        self.emitReturn(i + 1)
+        self.depth -= 1
+        if instruction.writesMemory():
+            self.emit("if not block.valid:")
+            self.depth += 1
+            self.emitReturn(i + 1)
+            self.depth -= 1
+        # The rest of the block may be in another mode.
+        for operandType, arg in instruction.operands:
+            if operandType.kind == KIND_FLAG or operandType.name == "flg":
+                self.emitReturn(i + 1)
+                return True
+        return False
+
+    # Expressions for operands. 'width' is the width of the operation in bytes.
+
+    def registerValue (self, operandType, instruction):
+        name = operandType.name
+        if name in translatedSlotRegisters:
+            return "m." + name
+        if name == "flg":
+            self.resultFlags()
+            return "flg"
+        if name == "ip":
+            return str(instruction.nextAddress)
+        offset = operandType.fixedArg
+        return "(pool[{}] << 8 | pool[{}])".format(offset, offset + 1)
+
+    def memoryAddress (self, operandType, arg, instruction):
+        name = operandType.name
+        if name == "@":
+            return str(arg)
+        value = self.registerValue(registerTypes[name.strip("@+")], instruction)
+        if name.endswith("+"):
+            return "(({} + {}) & 0xFFFF)".format(value, arg)
+        return value
+
+    # The operand's value as its read function returns it, or None if it can't be translated.
+    def readExpression (self, operandType, arg, width, instruction):
+        kind = operandType.kind
+        if kind == KIND_POOL:
+            size = self.wordBytes
+            if arg + size > 256:
+                return None
+            if size == 1:
+                return "((pool[{}] ^ 0x80) - 0x80)".format(arg)
+            return "int.from_bytes(pool[{}:{}], 'big', signed=True)".format(arg, arg + size)
+        if kind == KIND_REGISTER:
+            return self.registerValue(operandType, instruction)
+        if kind == KIND_LITERAL:
+            return str(arg)
+        if kind == KIND_MEMORY:
+            return "m.readMemory({}, {})".format(self.memoryAddress(operandType, arg, instruction), width)
+        return None
+
+    # The operand's value masked to the width of the operation, or None.
+    def maskedExpression (self, operandType, arg, width, instruction):
+        kind = operandType.kind
+        mask = (1 << (width * 8)) - 1
+        if kind == KIND_POOL and width == self.wordBytes:
+            if arg + width > 256:
+                return None
+            if width == 1:
+                return "pool[{}]".format(arg)
+            if width == 2:
+                return "(pool[{}] << 8 | pool[{}])".format(arg, arg + 1)
+            return "int.from_bytes(pool[{}:{}], 'big')".format(arg, arg + width)
+        if kind == KIND_LITERAL:
+            return str(arg & mask)
+        if kind == KIND_REGISTER:
+            if operandType.name == "ip":
+                return str(instruction.nextAddress & mask)
+            if operandType.width <= width:
+                return self.registerValue(operandType, instruction)
+            return "({} & {})".format(self.registerValue(operandType, instruction), mask)
+        if kind == KIND_MEMORY:
+            return "int.from_bytes(m.load({}, {}), 'big')".format(self.memoryAddress(operandType, arg, instruction), width)
+        value = self.readExpression(operandType, arg, width, instruction)
+        return None if value is None else "({} & {})".format(value, mask)
+
+    def isDestination (self, operandType, arg):
+        if operandType.kind == KIND_POOL:
+            return arg + self.wordBytes <= 256
+        if operandType.kind == KIND_REGISTER:
+            return operandType.name in translatedSlotRegisters or operandType.fixedArg is not None
+        return False
+
+    def operationWidth (self, operandType):
+        return self.wordBytes if operandType.kind == KIND_POOL else operandType.width
+
+    def sourceWidth (self, operandType):
+        if operandType.kind == KIND_POOL:
+            return self.wordBytes
+        if operandType.kind == KIND_MEMORY:
+            return 0
+        return operandType.width
+
+    # Store 'value', already masked to the width of the operation, in a destination operand.
+    def write (self, operandType, arg, value):
+        if operandType.kind == KIND_POOL:
+            size = self.wordBytes
+            if size == 1:
+                self.emit("pool[{}] = {}".format(arg, value))
+            elif size == 2:
+                self.emit("pool[{}] = {} >> 8".format(arg, value))
+                self.emit("pool[{}] = {} & 0xFF".format(arg + 1, value))
+            else:
+                self.emit("pool[{}:{}] = {}.to_bytes({}, 'big')".format(arg, arg + size, value, size))
+            self.markWindow(arg, size)
+        elif operandType.name in translatedSlotRegisters:
+            self.emit("m.{} = {}".format(operandType.name, value))
+            if operandType.name == "wl":
+                self.emit("m.windowDirty = {}".format(windowBothHalves))
+        else:
+            offset = operandType.fixedArg
+            self.emit("pool[{}] = {} >> 8".format(offset, value))
+            self.emit("pool[{}] = {} & 0xFF".format(offset + 1, value))
+            self.markWindow(offset, 2)
+
+    # Mark the halves of the memory window the data-pool bytes from 'address' are in dirty, like
+    # the operand writes do. Which halves they are is known here.
+    def markWindow (self, address, size):
+        halves = windowHalves[address] | windowHalves[address + size - 1]
+        if halves:
+            self.emit("m.windowDirty |= {}".format(halves))
+
+    # Clear the flags in clearBits and leave ZF and SF to be set from r, like setResultFlags.
+    def setResultFlags (self, signBit, clearBits):
+        if clearBits:
+            self.emit("flg &= {}".format(~clearBits & 0xFFFF))
+        self.resultSignBit = signBit
+
+    # Set ZF and SF from r if they haven't been yet. Unless 'settled' is false, because the code
+    # written here only runs on some of the paths from it, they are set from then on.
+    def resultFlags (self, settled = True):
+        signBit = self.resultSignBit
+        if signBit is None:
+            return
+        self.emit("flg &= {}".format(~(flag_bits.ZF | flag_bits.SF) & 0xFFFF))
+        self.emit("if r == 0:")
+        self.emit("    flg |= {}".format(flag_bits.ZF))
+        self.emit("elif r & {}:".format(signBit))
+        self.emit("    flg |= {}".format(flag_bits.SF))
+        if settled:
+            self.resultSignBit = None
+
+    # The condition for a signed overflow of r = a + b or, if subtract is true, of r = a - b, as
+    # addIntegers and subtractIntegers test it. With a literal b the sign of b is known, which
+    # leaves the signs of a and r to test.
+    def overflowCondition (self, b, signBit, subtract):
+        if b != "b":
+            if bool(int(b) & signBit) == subtract:
+                return "not a & {0} and r & {0}".format(signBit)
+            return "a & {0} and not r & {0}".format(signBit)
+        if subtract:
+            return "(a ^ b) & {0} and (r ^ a) & {0}".format(signBit)
+        return "not (a ^ b) & {0} and (r ^ a) & {0}".format(signBit)
+
+    # Set NOF and raise a sign bit overflow error if 'condition' holds.
+    def signedOverflow (self, condition, instruction, i):
+        self.emit("if {}:".format(condition))
+        self.depth += 1
+        self.emit("flg |= {}".format(flag_bits.NOF))
+        self.emit("if flg & {}:".format(flag_bits.RF))
+        self.depth += 1
+        self.emit("flg |= {}".format(flag_bits.EF))
+        self.emit("m.pendingError = {}".format(exit_codes.signBitOverflow))
+        self.exit(instruction.nextAddress, i + 1)
+        self.depth -= 2
+
+    def translateBinary (self, instruction, i):
+        (destinationType, destination), (sourceType, source) = instruction.operands
+        opCode = instruction.opCode
+        if not self.isDestination(destinationType, destination):
+            return False
+        if opCode in floatOperations and self.floatMode and self.wordBytes > 1 and destinationType.kind == KIND_POOL:
+            return False
+        width = self.operationWidth(destinationType)
+        bits = width * 8; mask = (1 << bits) - 1; signBit = 1 << (bits - 1)
+        a = self.maskedExpression(destinationType, destination, width, instruction)
+        b = self.maskedExpression(sourceType, source, width, instruction)
+        if a is None or b is None:
+            return False
+        self.emit("a = " + a)
+        if sourceType.kind != KIND_LITERAL:
+            self.emit("b = " + b)
+            b = "b"
+        isSigned = destinationType.kind == KIND_POOL
+        overflow = None
+        if opCode == op_codes.iAdd:
+            self.emit("t = a + {}".format(b))
+            self.emit("r = t & {}".format(mask))
+            if isSigned:
+                overflow = self.overflowCondition(b, signBit, False)
+        elif opCode == op_codes.iSub:
+            self.emit("r = (a - {}) & {}".format(b, mask))
+            if isSigned:
+                overflow = self.overflowCondition(b, signBit, True)
+        elif opCode == op_codes.iNor:
+            self.emit("r = ~(a | {}) & {}".format(b, mask))
+        else:
+            self.emit("r = a {} {}".format({op_codes.iAnd: "&", op_codes.iOr: "|", op_codes.iXor: "^"}[opCode], b))
+        self.write(destinationType, destination, "r")
+        self.setResultFlags(signBit, operationClearBits[opCode])
+        if opCode == op_codes.iAdd:
+            self.emit("if t > {}:".format(mask))
+            self.emit("    flg |= {}".format(flag_bits.OF))
+        elif opCode == op_codes.iSub:
+            self.emit("if a < {}:".format(b))
+            self.emit("    flg |= {}".format(flag_bits.OF))
+        if overflow is not None:
+            self.signedOverflow(overflow, instruction, i)
+        return True
+
+    def translateNot (self, instruction):
+        ((destinationType, destination),) = instruction.operands
+        if not self.isDestination(destinationType, destination):
+            return False
+        width = self.operationWidth(destinationType)
+        mask = (1 << (width * 8)) - 1
+        a = self.maskedExpression(destinationType, destination, width, instruction)
+        if a is None:
+            return False
+        self.emit("r = ~{} & {}".format(a, mask))
+        self.write(destinationType, destination, "r")
+        self.setResultFlags(1 << (width * 8 - 1), 0)
+        return True
+
+    def translateCmp (self, instruction, i):
+        (firstType, first), (secondType, second) = instruction.operands
+        if firstType.kind == KIND_MEMORY and secondType.kind == KIND_MEMORY:
+            return False
+        if self.floatMode and self.wordBytes > 1 and (firstType.kind == KIND_POOL or secondType.kind == KIND_POOL):
+            return False
+        width = self.sourceWidth(firstType) or self.sourceWidth(secondType) or 2
+        bits = width * 8; mask = (1 << bits) - 1; signBit = 1 << (bits - 1)
+        a = self.maskedExpression(firstType, first, width, instruction)
+        b = self.maskedExpression(secondType, second, width, instruction)
+        if a is None or b is None:
+            return False
+        self.emit("a = " + a)
+        if secondType.kind != KIND_LITERAL:
+            self.emit("b = " + b)
+            b = "b"
+        self.emit("r = (a - {}) & {}".format(b, mask))
+        self.setResultFlags(signBit, arithmeticFlags)
+        self.emit("if a < {}:".format(b))
+        self.emit("    flg |= {}".format(flag_bits.OF))
+        if firstType.kind != KIND_REGISTER:
+            self.signedOverflow(self.overflowCondition(b, signBit, True), instruction, i)
+        return True
+
+    def translateMov (self, instruction, i):
+        (destinationType, destination), (sourceType, source) = instruction.operands
+        if destinationType.kind == KIND_MEMORY:
+            if sourceType.kind == KIND_POOL and source + self.wordBytes <= 256:
+                value = "pool[{}:{}]".format(source, source + self.wordBytes)
+                self.emit("m.store({}, {})".format(self.memoryAddress(destinationType, destination, instruction), value))
+            else:
+                if sourceType.kind not in (KIND_REGISTER, KIND_LITERAL):
+                    return False
+                width = self.sourceWidth(sourceType)
+                value = self.readExpression(sourceType, source, width, instruction)
+                self.emit("m.writeMemory({}, {}, {})".format(
+                    self.memoryAddress(destinationType, destination, instruction), width, value))
+            self.emit("if not block.valid:")
+            self.depth += 1
+            self.exit(instruction.nextAddress, i + 1)
+            self.depth -= 1
+            return True
+        if not self.isDestination(destinationType, destination):
+            return False
+        width = self.operationWidth(destinationType)
+        if destinationType.kind == KIND_POOL and sourceType.kind == KIND_POOL and source + width <= 256:
+            if width == 1:
+                self.emit("pool[{}] = pool[{}]".format(destination, source))
+            else:
+                self.emit("pool[{}:{}] = pool[{}:{}]".format(destination, destination + width, source, source + width))
+            self.markWindow(destination, width)
+            return True
+        value = self.maskedExpression(sourceType, source, width, instruction)
+        if value is None:
+            return False
+        self.emit("v = " + value)
+        self.write(destinationType, destination, "v")
+        return True
+
+    def translateMode (self, instruction):
+        mode = instruction.immediate
+        if mode & 0x0F > 3:
+            return False
+        self.wordBytes = 1 << (mode & 0x03)
+        self.floatMode = bool(mode & 0xF0)
+        modeFlags = ((mode & 0x03) << flag_bits.WLBShift) | (flag_bits.FMF if self.floatMode else 0)
+        self.emit("flg = (flg & {}) | {}".format(~modeFlagBits & 0xFFFF, modeFlags))
+        self.namespace["kernels{}".format(modeFlags)] = modeKernels[modeFlags]
+        self.emit("m.kernels = kernels{}".format(modeFlags))
+        self.emit("m.wordBytes = {}".format(self.wordBytes))
+        self.emit("m.floatMode = {}".format(self.floatMode))
+        return True
+
+    # jfl and sfl end the block. A branch back to the start of the block, in the mode the block
+    # was translated for, continues the loop while the limit allows another iteration.
+    def translateBranch (self, instruction, i):
+        self.resultFlags()
+        flagBit = branchFlags[instruction.typeBits]
+        condition = "{}flg & {}".format("" if instruction.opCode == op_codes.iJfl else "not ", flagBit)
+        if flagBit == flag_bits.EF:
+            self.emit("taken = " + condition)
+            self.emit("flg &= {}".format(~flag_bits.EF & 0xFFFF))
+            self.emit("m.pendingError = None")
+            condition = "taken"
+        executed = i + 1
+        self.emit("if {}:".format(condition))
+        self.depth += 1
+        target = instruction.immediate
+        if target == self.block.start and self.currentModeFlags() == self.modeFlags:
+            self.emit("n += {}".format(executed))
+            self.emit("if n + {} <= limit:".format(executed))
+            self.emit("    continue")
+            self.exit(target, 0, True)
+        else:
+            self.exit(target, executed, True)
+        self.depth -= 1
+        self.exit(instruction.nextAddress, executed, True)
+
+# The number of instructions a translation executed before the one which raised 'halt'; the
+# iterations it finished, from its frame, and the instructions before the one whose next address
+# ip holds.
+def translatedInstructionsBefore (halt, translation, block, ip):
+    traceback = halt.__traceback__
+    while traceback.tb_frame.f_code is not translation.__code__:
+        traceback = traceback.tb_next
+    executed = traceback.tb_frame.f_locals["n"]
+    for instruction in block.instructions:
+        if instruction.nextAddress == ip:
+            break
+        executed += 1
+    return executed
+
+# Fork a new machine off a snapshot. Forks share nothing but the snapshot, which is never written
+# to, so any number of them can run independently; each costs its own copy of memory and the
+# data-pool.
+def forkMachine (snapshot, stdin = None, stdout = None):
+    machine = Machine(stdin, stdout)
+    machine.restore(snapshot)
+    return machine
+
+# Run a program until it exits, reporting what happened if asked to. Returns the machine.
+# The ways Machine can execute a program: "interpreter" decodes every instruction as it's executed,
+# "blocks" runs basic blocks out of a BlockCache and "translated" translates the hot ones.
+engines = {"interpreter": Machine.run, "blocks": Machine.runBlocks, "translated": Machine.runTranslated}
+
+def runProgram (path, maxInstructions = None, stdin = None, stdout = None, engine = "interpreter"):
+    machine = Machine(stdin, stdout)
+    machine.loadProgramFile(path)
+    engines[engine](machine, maxInstructions)
+    return machine
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Run a UA program.")
+    argParser.add_argument("program", help="a binary image or hex code written by the assembler, or a snapshot")
+    argParser.add_argument("-n", "--max-instructions", type=int, default=None,
+                           help="stop after this many instructions")
+    argParser.add_argument("-s", "--stats", action="store_true",
+                           help="report the number of instructions executed and instructions per second")
+    argParser.add_argument("-e", "--engine", choices=sorted(engines), default="interpreter",
+                           help="how to execute the program (default: interpreter)")
+    argParser.add_argument("--save-snapshot", metavar="FILE",
+                           help="save the machine's state to this file when it stops; with -n, to start runs from later")
+    args = argParser.parse_args()
+
+    machine = Machine()
+    try:
+        with open(args.program, "rb") as f:
+            isSnapshot = uaSnapshot.isSnapshot(f.read(len(uaSnapshot.magicNumber)))
+        if isSnapshot:
+            machine.restore(uaSnapshot.loadSnapshotFile(args.program))
+        else:
+            machine.loadProgramFile(args.program)
+    except (OSError, uaImage.ImageFormatError, uaSnapshot.SnapshotFormatError, ValueError) as error:
+        print("Could not load {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+
+    start = time.perf_counter()
+    exitCode = engines[args.engine](machine, args.max_instructions)
+    elapsed = time.perf_counter() - start
+    if args.save_snapshot:
+        try:
+            uaSnapshot.saveSnapshotFile(args.save_snapshot, machine.snapshot())
+        except OSError as error:
+            print("Could not save the snapshot to {}: {}".format(args.save_snapshot, error), file=sys.stderr)
+            exit(1)
+    machine.io.close()
+
+    if args.stats:
+        print("{} instructions in {:.3f} s ({:,.0f} instructions/s)".format(
+            machine.instructionCount, elapsed, machine.instructionCount / elapsed if elapsed else 0), file=sys.stderr)
+        if machine.blockCache is not None:
+            print("block cache: {blocks} blocks, {hits} hits, {misses} misses, {invalidations} invalidations, "
+                  "{translations} translations".format(
+                **machine.blockCache.stats()), file=sys.stderr)
+        print("I/O system calls: {open} open, {close} close, {read} read, {write} write".format(**machine.io.calls),
+              file=sys.stderr)
+    if exitCode is None:
+        print("The program was stopped after {} instructions.".format(machine.instructionCount), file=sys.stderr)
+        exit(0)
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
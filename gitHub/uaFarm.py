@@ -0,0 +1,195 @@
+# This program runs batches of independent UA programs, one per input case, on a pool of worker
+# processes so that a batch uses every core. The jobs are listed in a manifest with one JSON
+# object per line:
+#
+#     image             the path of a binary image or hex code, relative to the manifest
+#     input             the program's console input (default: none)
+#     output            the console output the program must write (optional)
+#     exitCode          the exit code the program must exit with (optional)
+#     maxInstructions   the job's instruction budget (default: -n)
+#     timeout           the job's time limit in seconds (default: -t)
+#     id                anything; it's returned unchanged in the result
+#
+# and a result is written as a JSON line as soon as its job finishes, in whatever order they
+# finish. A result holds the job's id and index in the manifest, its status, the exit code, the
+# number of instructions executed, the seconds it ran, and the output if it wasn't what was
+# expected. The status is one of
+#
+#     passed    the program exited as expected
+#     failed    the program exited with another exit code or wrote other output
+#     budget    the program used up its instruction budget
+#     timeout   the program ran out of time
+#     error     the image couldn't be loaded or running the job raised an exception
+#
+# Jobs carry the path of their image, not the image. Every worker maps each image it's given once
+# and loads every job's memory straight from the mapping, so the images are read from the page
+# cache all the workers share. Programs run a slice of instructions at a time between checks of
+# their time limit, so a runaway program can't hold on to a worker.
+#
+# usage: python uaFarm.py manifest.jsonl [-j workers] [-n max instructions] [-t seconds] [-e engine] [-o results.jsonl]
+import argparse
+import concurrent.futures
+import io
+import json
+import mmap
+import os
+import sys
+import time
+
+import uaEmulator
+import uaImage
+
+sliceInstructions = 10000
+
+# Images mapped by this process, by path.
+mappedImages = {}
+
+def mapImage (path):
+    mapped = mappedImages.get(path)
+    if mapped is None:
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mappedImages[path] = mapped
+    return mapped
+
+# Run one job. 'job' is a manifest entry with the image's path resolved and the limits filled in.
+# Returns the result, without the id and index.
+def runJob (job, engine = "interpreter"):
+    stdout = io.BytesIO()
+    machine = uaEmulator.Machine(io.BytesIO(job.get("input", "").encode("latin-1")), stdout)
+    try:
+        machine.loadProgram(mapImage(job["image"]))
+    except (OSError, ValueError, uaImage.ImageFormatError) as error:
+        return {"status": "error", "message": "Could not load {}: {}".format(job["image"], error)}
+
+    run = uaEmulator.engines[engine]
+    maxInstructions = job["maxInstructions"]
+    start = time.perf_counter()
+    deadline = start + job["timeout"]
+    status = None
+    while not machine.halted:
+        remaining = maxInstructions - machine.instructionCount
+        if remaining <= 0:
+            status = "budget"
+            break
+        if time.perf_counter() > deadline:
+            status = "timeout"
+            break
+        run(machine, min(remaining, sliceInstructions))
+    machine.io.close()
+    seconds = time.perf_counter() - start
+
+    output = stdout.getvalue().decode("latin-1")
+    if status is None:
+        expectedExitCode = job.get("exitCode")
+        expectedOutput = job.get("output")
+        if (expectedExitCode is not None and machine.exitCode != expectedExitCode
+                or expectedOutput is not None and output != expectedOutput):
+            status = "failed"
+        else:
+            status = "passed"
+    result = {"status": status, "exitCode": machine.exitCode, "instructions": machine.instructionCount,
+              "seconds": round(seconds, 6)}
+    if status != "passed":
+        result["output"] = output
+    return result
+
+# The types of the optional fields of a job, and what each must be.
+jobFieldTypes = {
+    "input": ((str,), "a string"),
+    "output": ((str,), "a string"),
+    "exitCode": ((int,), "an integer"),
+    "maxInstructions": ((int,), "an integer"),
+    "timeout": ((int, float), "a number"),
+}
+
+# Check the fields of a job. Raises a ValueError if one of them has the wrong type.
+def checkJob (job):
+    if not isinstance(job, dict) or not isinstance(job.get("image"), str):
+        raise ValueError("a job needs the path of an image")
+    for field, (types, description) in jobFieldTypes.items():
+        if field in job and (not isinstance(job[field], types) or isinstance(job[field], bool)):
+            raise ValueError("'{}' must be {}".format(field, description))
+    if "input" in job:
+        try:
+            job["input"].encode("latin-1")
+        except UnicodeEncodeError:
+            raise ValueError("the characters of 'input' must fit in a byte")
+
+# Read a manifest. Returns the jobs with their image paths resolved and their limits filled in.
+def readManifest (path, maxInstructions, timeout):
+    directory = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path) as f:
+        for lineNumber, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                checkJob(job)
+            except ValueError as error:
+                raise ValueError("Line {} of the manifest is not a job: {}".format(lineNumber, error))
+            job["image"] = os.path.join(directory, job["image"])
+            job.setdefault("maxInstructions", maxInstructions)
+            job.setdefault("timeout", timeout)
+            jobs.append(job)
+    return jobs
+
+# Run jobs on 'workers' processes and yield each result as its job finishes.
+def runJobs (jobs, workers = None, engine = "interpreter"):
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(runJob, job, engine): index for index, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                # A job which crashes its worker, or the emulator, fails on its own instead of
+                # taking the rest of the batch with it.
+                result = {"status": "error", "message": "{}: {}".format(type(error).__name__, error)}
+            result["index"] = index
+            if "id" in jobs[index]:
+                result["id"] = jobs[index]["id"]
+            yield result
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Run a batch of UA programs on several processes.")
+    argParser.add_argument("manifest", help="a file of jobs, one JSON object per line")
+    argParser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                           help="the number of worker processes (default: the number of CPUs)")
+    argParser.add_argument("-n", "--max-instructions", type=int, default=10000000,
+                           help="the instruction budget of jobs which don't give one (default: 10000000)")
+    argParser.add_argument("-t", "--timeout", type=float, default=60.0,
+                           help="the time limit in seconds of jobs which don't give one (default: 60)")
+    argParser.add_argument("-e", "--engine", choices=sorted(uaEmulator.engines), default="interpreter",
+                           help="how to execute the programs (default: interpreter)")
+    argParser.add_argument("-o", "--output", help="write the results to this file instead of stdout")
+    args = argParser.parse_args()
+
+    try:
+        jobs = readManifest(args.manifest, args.max_instructions, args.timeout)
+    except (OSError, ValueError) as error:
+        print("Could not read the manifest {}: {}".format(args.manifest, error), file=sys.stderr)
+        exit(1)
+
+    counts = {}
+    start = time.perf_counter()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for result in runJobs(jobs, args.workers, args.engine):
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+    finally:
+        if args.output:
+            output.close()
+    elapsed = time.perf_counter() - start
+
+    print("{} jobs in {:.3f} s ({:,.1f} jobs/s): {}".format(
+        len(jobs), elapsed, len(jobs) / elapsed if elapsed else 0,
+        ", ".join("{} {}".format(count, status) for status, count in sorted(counts.items()))), file=sys.stderr)
+    if counts.get("passed", 0) != len(jobs):
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# The binary image format written by the assembler and loaded by the emulator.
+#
+# An image describes the contents of the 64 KiB UA address space. All multi-byte fields are
+# big-endian, like the architecture itself.
+#
+#     header (12 bytes)
+#         0   4   magic number, the ASCII characters "UAIM"
+#         4   1   format version (currently 1)
+#         5   1   number of sections
+#         6   2   entry point; the address execution starts at
+#         8   4   total number of bytes of section data in the file
+#
+#     section table (12 bytes per section, immediately after the header)
+#         0   2   load address in the UA address space
+#         2   2   flags (sectionCode, sectionData)
+#         4   4   size of the section in bytes
+#         8   4   offset of the section's bytes from the start of the file
+#
+#     section data
+#         The bytes of every section, in the order of the section table.
+#
+# A section may not run past the end of the address space. Because the section data is stored
+# exactly as it appears in memory, a loader can mmap an image and copy each section into the
+# emulator's memory with a single slice assignment instead of parsing text.
+import mmap
+import struct
+
+magicNumber = b"UAIM"
+formatVersion = 1
+headerFormat = struct.Struct(">4sBBHI")
+sectionFormat = struct.Struct(">HHII")
+addressSpaceSize = 0x10000
+
+# Section flags.
+sectionCode = 0x0001
+sectionData = 0x0002
+
+class Section:
+    def __init__(self, address, flags, data):
+        self.address = address
+        self.flags = flags
+        self.data = data
+
+class ImageFormatError(Exception):
+    pass
+
+# Build a binary image out of a list of sections and the address of the entry point.
+def packImage (sections, entryPoint):
+    header = packImageHeader([(section.address, section.flags, len(section.data)) for section in sections], entryPoint)
+    return header + b"".join(section.data for section in sections)
+
+# The header and section table of an image, which the data of the sections follows. 'layout' is a
+# list of (address, flags, size) tuples, one for each section. Images can be written a piece at a
+# time by writing the header last, once the sizes of the sections are known.
+def packImageHeader (layout, entryPoint):
+    tableEnd = imageHeaderSize(len(layout))
+    header = bytearray(tableEnd)
+    headerFormat.pack_into(header, 0, magicNumber, formatVersion, len(layout), entryPoint,
+                           sum(size for address, flags, size in layout))
+
+    offset = tableEnd
+    for i, (address, flags, size) in enumerate(layout):
+        if address + size > addressSpaceSize:
+            raise ImageFormatError("The section at {:04X} runs past the end of the address space.".format(address))
+        sectionFormat.pack_into(header, headerFormat.size + sectionFormat.size * i, address, flags, size, offset)
+        offset += size
+
+    return bytes(header)
+
+def imageHeaderSize (sectionCount):
+    return headerFormat.size + sectionFormat.size * sectionCount
+
+# Read the header and section table of an image held in a bytes-like object. Returns the entry
+# point and a list of sections whose data are memoryviews onto the image, so nothing is copied.
+def readImage (image):
+    view = memoryview(image)
+    sections = []
+    try:
+        if len(view) < headerFormat.size:
+            raise ImageFormatError("The file is too short to be a UA image.")
+        magic, version, sectionCount, entryPoint, dataSize = headerFormat.unpack_from(view, 0)
+        if magic != magicNumber:
+            raise ImageFormatError("The file is not a UA image.")
+        if version != formatVersion:
+            raise ImageFormatError("UA image format version {} is not supported.".format(version))
+        if len(view) < imageHeaderSize(sectionCount):
+            raise ImageFormatError("The section table of the image is truncated.")
+
+        for i in range(sectionCount):
+            address, flags, size, offset = sectionFormat.unpack_from(view, headerFormat.size + sectionFormat.size * i)
+            if offset + size > len(view) or address + size > addressSpaceSize:
+                raise ImageFormatError("Section {} of the image is truncated or out of range.".format(i))
+            sections.append(Section(address, flags, view[offset:offset + size]))
+    except struct.error:
+        error = ImageFormatError("The image is truncated or corrupt.")
+    except ImageFormatError as formatError:
+        error = formatError
+    else:
+        return entryPoint, sections
+
+    # The traceback of the error would keep the views alive, and an mmap the image is held in
+    # can't be closed while they are.
+    for section in sections:
+        section.data.release()
+    view.release()
+    raise error
+
+def isImage (data):
+    return bytes(data[:len(magicNumber)]) == magicNumber
+
+# Copy the sections of an image into a 64 KiB memory buffer and return the entry point.
+def loadImage (image, memory):
+    entryPoint, sections = readImage(image)
+    for section in sections:
+        memory[section.address:section.address + len(section.data)] = section.data
+    return entryPoint
+
+# Map an image file into memory and load it into a 64 KiB memory buffer without reading the file
+# into an intermediate buffer first. Returns the entry point.
+def loadImageFile (path, memory):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            entryPoint, sections = readImage(mapped)
+            try:
+                for section in sections:
+                    memory[section.address:section.address + len(section.data)] = section.data
+            finally:
+                for section in sections:
+                    section.data.release()
+            return entryPoint
+
+# The hex code export: the program's bytes as two hex digits each, as the proof of concept
+# assembler used to write them. Programs in this format are loaded at address 0.
+def formatHex (program):
+    return bytes(program).hex()
+
+def parseHex (text):
+    return bytes.fromhex("".join(text.split()))
+
+# Symbol maps name the addresses of a program for tools like the profiler. A map is text with one
+# label per line; the address as four hex digits, a space and the name, e.g. "01A4 loop". The
+# assembler and the linker write them with '-m'.
+def formatSymbolMap (symbols):
+    return "".join("{:04X} {}\n".format(address, name)
+                   for name, address in sorted(symbols.items(), key=lambda symbol: (symbol[1], symbol[0])))
+
+# Returns a dictionary of the addresses of the names in a symbol map.
+def parseSymbolMap (text):
+    symbols = {}
+    for lineNumber, line in enumerate(text.splitlines(), 1):
+        fields = line.split()
+        if not fields:
+            continue
+        try:
+            if len(fields) != 2:
+                raise ValueError
+            symbols[fields[1]] = int(fields[0], 16)
+        except ValueError:
+            raise ImageFormatError("Line {} of the symbol map is not an address and a name.".format(lineNumber))
+    return symbols
@@ -0,0 +1,222 @@
+# This program links UA programs which are split over several source files. Every source file is
+# assembled into a relocatable object (see uaObject.py) and the objects are laid out one after
+# another in the address space, in the order they're given, with the first at address 0. The
+# addresses inside each object are moved by where the object ends up and names an object imports
+# are filled in with the addresses of the labels other objects define. Execution starts at the
+# label main.
+#
+# Assembled objects are kept in a build cache keyed by a hash of the source code and of the
+# assembler itself, so a source file which hasn't changed since it was last built isn't
+# assembled again. Rebuilding a program after editing one of its files costs assembling that
+# file and linking, which is a pass over the relocations and imports of every object.
+#
+# usage: python uaLinker.py -o program.bin main.uas routines.uas more.uao ...
+import argparse
+import hashlib
+import os
+
+import uaAssembler
+import uaImage
+import uaObject
+
+class LinkError(Exception):
+    pass
+
+# An error in one of the source files being built.
+class BuildError(Exception):
+    def __init__(self, path, error):
+        super().__init__(path, error)
+        self.path = path
+        self.error = error
+
+    def __str__ (self):
+        return "In {}:\n{}".format(self.path, self.error)
+
+# Lay out the objects and patch their relocations and imports. 'objects' is a list of (name,
+# ObjectFile) pairs, where the name is only used in error messages. Returns a list of sections,
+# one for each object, the entry point and the addresses of every object's labels.
+def link (objects):
+    bases = []
+    base = 0
+    for name, objectFile in objects:
+        bases.append(base)
+        base += len(objectFile.code)
+    if base > uaImage.addressSpaceSize:
+        raise LinkError("The program is {} bytes long and doesn't fit in the {} byte address space.".format(
+            base, uaImage.addressSpaceSize))
+
+    # The addresses of the labels of every object where they end up.
+    symbols = {}
+    definedIn = {}
+    duplicates = []
+    for (name, objectFile), base in zip(objects, bases):
+        for symbol, offset in objectFile.symbols.items():
+            if symbol in symbols:
+                duplicates.append("'{}' is defined in both {} and {}.".format(symbol, definedIn[symbol], name))
+                continue
+            symbols[symbol] = base + offset
+            definedIn[symbol] = name
+    if duplicates:
+        raise LinkError("\n".join(duplicates))
+
+    sections = []
+    undefinedNames = []
+    for (name, objectFile), base in zip(objects, bases):
+        code = bytearray(objectFile.code)
+        for offset, width in objectFile.relocations:
+            mask = (1 << (width * 8)) - 1
+            value = int.from_bytes(code[offset:offset + width], "big") + base
+            code[offset:offset + width] = (value & mask).to_bytes(width, "big")
+        for offset, width, symbol, lineNumber in objectFile.imports:
+            if symbol not in symbols:
+                undefinedNames.append("'{}' used on line {} of {} is never defined.".format(symbol, lineNumber, name))
+                continue
+            code[offset:offset + width] = (symbols[symbol] & ((1 << (width * 8)) - 1)).to_bytes(width, "big")
+        if code:
+            sections.append(uaImage.Section(base, uaImage.sectionCode, bytes(code)))
+    if undefinedNames:
+        raise LinkError("\n".join(undefinedNames))
+
+    return sections, symbols.get("main", 0), symbols
+
+# Assembled objects stored in a directory, one file per object named after the hash of its
+# source code.
+class BuildCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def path (self, key):
+        return os.path.join(self.directory, key + ".uao")
+
+    def get (self, key):
+        try:
+            with open(self.path(key), "rb") as f:
+                objectFile = uaObject.readObject(f.read())
+        except (OSError, uaObject.ObjectFormatError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return objectFile
+
+    def put (self, key, objectFile):
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so an interrupted build can't leave half an object behind.
+        temporaryPath = self.path(key) + ".{}.tmp".format(os.getpid())
+        with open(temporaryPath, "wb") as f:
+            f.write(uaObject.packObject(objectFile))
+        os.replace(temporaryPath, self.path(key))
+
+# Objects depend on the assembler that produced them as well as the source code, so the cache key
+# includes a hash of the assembler and of the object format.
+def toolHash ():
+    digest = hashlib.sha256()
+    for module in (uaAssembler, uaObject):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+def sourceKey (sourceCode, tools):
+    return hashlib.sha256(tools + sourceCode).hexdigest()
+
+# Get the object for a file given to the linker. Object files are read as they are; source files
+# are assembled unless the cache already holds their object.
+def loadObject (path, cache = None, tools = None):
+    with open(path, "rb") as f:
+        data = f.read()
+    if uaObject.isObject(data):
+        return uaObject.readObject(data)
+
+    if cache is not None:
+        key = sourceKey(data, tools if tools is not None else toolHash())
+        objectFile = cache.get(key)
+        if objectFile is not None:
+            return objectFile
+    try:
+        objectFile = uaAssembler.assembleObject(data.decode())
+    except uaAssembler.AssemblyError as error:
+        raise BuildError(path, error)
+    if cache is not None:
+        cache.put(key, objectFile)
+    return objectFile
+
+# Get the objects for all the files given to the linker, like loadObject, but assemble the source
+# files which aren't in the cache at the same time in a pool of threads.
+def loadObjects (paths, cache = None, tools = None):
+    if tools is None:
+        tools = toolHash()
+    objects = [None] * len(paths)
+    sources = []
+    for i, path in enumerate(paths):
+        with open(path, "rb") as f:
+            data = f.read()
+        if uaObject.isObject(data):
+            objects[i] = uaObject.readObject(data)
+            continue
+        key = sourceKey(data, tools)
+        if cache is not None:
+            objects[i] = cache.get(key)
+        if objects[i] is None:
+            sources.append((i, key, data.decode()))
+
+    results = uaAssembler.assembleBatch([sourceCode for i, key, sourceCode in sources], objects=True)
+    for (i, key, sourceCode), result in zip(sources, results):
+        if isinstance(result, uaAssembler.AssemblyError):
+            raise BuildError(paths[i], result)
+        objects[i] = result
+        if cache is not None:
+            cache.put(key, result)
+    return list(zip(paths, objects))
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Assemble and link a UA program made of several files.")
+    argParser.add_argument("inputs", nargs="+", help="source files and objects, the first is loaded at address 0")
+    argParser.add_argument("-o", "--output", required=True, help="the file to write the linked program to")
+    argParser.add_argument("-f", "--format", choices=("bin", "hex"), default="bin",
+                           help="write a binary image (the default) or the program as hex code")
+    argParser.add_argument("-m", "--map", help="also write a symbol map of the linked program's labels to this file")
+    argParser.add_argument("--cache", default=".uacache", help="the build cache directory (default: .uacache)")
+    argParser.add_argument("--no-cache", action="store_true", help="assemble every source file")
+    args = argParser.parse_args()
+
+    cache = None if args.no_cache else BuildCache(args.cache)
+    tools = toolHash()
+    try:
+        objects = loadObjects(args.inputs, cache, tools)
+    except (OSError, uaObject.ObjectFormatError) as error:
+        print("Could not load an input: {}".format(error))
+        exit()
+    except BuildError as error:
+        print(error)
+        exit()
+
+    try:
+        sections, entryPoint, symbols = link(objects)
+    except LinkError as error:
+        print("Link error. {}".format(error))
+        exit()
+
+    if args.format == "hex":
+        if entryPoint != 0:
+            print("Link error. Hex code is executed from address 0, so main must be at the start of the first file.")
+            exit()
+        program = bytearray()
+        for section in sections:
+            program += section.data
+        with open(args.output, "w") as f:
+            f.write(uaImage.formatHex(program))
+    else:
+        with open(args.output, "wb") as f:
+            f.write(uaImage.packImage(sections, entryPoint))
+    if args.map:
+        with open(args.map, "w") as f:
+            f.write(uaImage.formatSymbolMap(symbols))
+
+    if cache is not None:
+        print("{} object{} linked, {} from the build cache.".format(
+            len(objects), "" if len(objects) == 1 else "s", cache.hits))
+    print("Linker output written to {}.".format(args.output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# The relocatable object format written by the assembler with '-c' and combined into programs by
+# the linker (see uaLinker.py.)
+#
+# An object is the machine code of a single source file assembled at address 0, along with what
+# the linker needs to move it somewhere else and to connect it to other objects. All multi-byte
+# fields are big-endian.
+#
+#     header (20 bytes)
+#         0   4   magic number, the ASCII characters "UAOB"
+#         4   1   format version (currently 1)
+#         5   1   unused
+#         6   2   number of symbols
+#         8   4   number of relocations
+#         12  4   number of imports
+#         16  4   size of the machine code in bytes
+#
+#     machine code
+#
+#     relocations (4 bytes each)
+#         0   2   offset of an address in the machine code which is relative to the object's start
+#         2   2   width of the address in bytes
+#
+#     symbols; the address labels defined by the object
+#         0   2   offset of the label in the machine code
+#         2   1   length of the name
+#         3       the name
+#
+#     imports; names used by the object but defined in another one
+#         0   2   offset in the machine code the value of the name goes
+#         2   1   width of the value in bytes
+#         3   4   line of the source file the name is used on
+#         7   1   length of the name
+#         8       the name
+import struct
+
+magicNumber = b"UAOB"
+formatVersion = 1
+headerFormat = struct.Struct(">4sBxHIII")
+relocationFormat = struct.Struct(">HH")
+symbolFormat = struct.Struct(">HB")
+importFormat = struct.Struct(">HBIB")
+
+# 'symbols' maps the name of every address label in the object to its offset, 'relocations' is a
+# list of (offset, width) pairs and 'imports' a list of (offset, width, name, line number) tuples.
+class ObjectFile:
+    def __init__(self, code, symbols, relocations, imports):
+        self.code = code
+        self.symbols = symbols
+        self.relocations = relocations
+        self.imports = imports
+
+class ObjectFormatError(Exception):
+    pass
+
+def packObject (objectFile):
+    return (packObjectHeader(objectFile, len(objectFile.code)) + bytes(objectFile.code) +
+            packObjectTables(objectFile))
+
+# The parts of an object before and after its machine code, for writing an object a piece at a
+# time. The code of 'objectFile' isn't used, so it can be None when the code isn't held in memory.
+def packObjectHeader (objectFile, codeSize):
+    return headerFormat.pack(magicNumber, formatVersion, len(objectFile.symbols), len(objectFile.relocations),
+                             len(objectFile.imports), codeSize)
+
+def packObjectTables (objectFile):
+    parts = []
+    for offset, width in objectFile.relocations:
+        parts.append(relocationFormat.pack(offset, width))
+    for name, offset in objectFile.symbols.items():
+        encodedName = name.encode("ascii")
+        parts.append(symbolFormat.pack(offset, len(encodedName)))
+        parts.append(encodedName)
+    for offset, width, name, lineNumber in objectFile.imports:
+        encodedName = name.encode("ascii")
+        parts.append(importFormat.pack(offset, width, lineNumber, len(encodedName)))
+        parts.append(encodedName)
+    return b"".join(parts)
+
+def readObject (data):
+    view = memoryview(data)
+    try:
+        magic, version, symbolCount, relocationCount, importCount, codeSize = headerFormat.unpack_from(view, 0)
+        if magic != magicNumber:
+            raise ObjectFormatError("The file is not a UA object.")
+        if version != formatVersion:
+            raise ObjectFormatError("UA object format version {} is not supported.".format(version))
+        position = headerFormat.size
+        code = bytes(view[position:position + codeSize])
+        if len(code) != codeSize:
+            raise ObjectFormatError("The machine code of the object is truncated.")
+        position += codeSize
+
+        relocations = []
+        for _ in range(relocationCount):
+            relocations.append(relocationFormat.unpack_from(view, position))
+            position += relocationFormat.size
+
+        symbols = {}
+        for _ in range(symbolCount):
+            offset, nameLength = symbolFormat.unpack_from(view, position)
+            position += symbolFormat.size
+            symbols[bytes(view[position:position + nameLength]).decode("ascii")] = offset
+            position += nameLength
+
+        imports = []
+        for _ in range(importCount):
+            offset, width, lineNumber, nameLength = importFormat.unpack_from(view, position)
+            position += importFormat.size
+            imports.append((offset, width, bytes(view[position:position + nameLength]).decode("ascii"), lineNumber))
+            position += nameLength
+    except (struct.error, UnicodeDecodeError):
+        raise ObjectFormatError("The object is truncated or corrupt.")
+
+    return ObjectFile(code, symbols, relocations, imports)
+
+def isObject (data):
+    return bytes(data[:len(magicNumber)]) == magicNumber
@@ -0,0 +1,280 @@
+# This program runs a UA program in the emulator and reports where its instructions are spent.
+# It counts how many times every op-code and every instruction address is executed, how often
+# every routine is called and how many instructions are executed in every call stack. Given a
+# symbol map (see uaImage.py; the assembler and the linker write one with '-m') addresses are
+# reported as label names, e.g. 'loop+0x0C'.
+#
+# Call stacks follow the call/ret frame protocol. call saves ip, sp and ap in a new frame at ap-6
+# and sets sp to it, so the profiler keeps a stack of (frame address, call target) pairs which call
+# pushes onto. ret returns from the frame sp points at; the profiler pops that frame and any
+# frames above it which were never returned from. A ret from a frame the profiler didn't see
+# being made leaves its stack alone.
+#
+# Reports are written as sorted text, as JSON, or as collapsed stacks; one line per call stack
+# with the routines from the outermost in, separated by semicolons, followed by the number of
+# instructions executed in it. flamegraph.pl, speedscope and inferno read collapsed stacks.
+#
+# Overhead: the profiler runs the program with its own copy of Machine.run's loop, so the
+# emulator's own loops have no profiling code in them and cost nothing extra when profiling is
+# off. While profiling, each instruction costs two list increments on top of the interpreter,
+# which is lost in the noise of decoding and executing it, and each call and ret a dictionary
+# update and a push or pop. A loop without calls runs as fast as under '-e interpreter' and one
+# where every other instruction is a call or a ret takes about 40% longer (see
+# benchmarks/profilerBenchmark.py.) Memory is bounded too; the address
+# counts are a fixed 64 Ki entry list, stacks deeper than maxStackDepth are recorded as their
+# outermost maxStackDepth routines and after maxStacks different stacks, instructions in new
+# ones are counted under a single '[other]' stack.
+#
+# usage: python uaProfiler.py program.bin [-m program.map] [-f text|json|collapsed] [-o report]
+import argparse
+import bisect
+import json
+import sys
+import time
+
+import uaEmulator
+import uaImage
+
+op_codes = uaEmulator.op_codes
+Halt = uaEmulator.Halt
+
+maxStackDepth = 64
+maxStacks = 10000
+otherStack = ("[other]",)
+
+# Names addresses after the closest label at or before them.
+class SymbolTable:
+    def __init__(self, symbols = None):
+        self.names = {}
+        for name, address in (symbols or {}).items():
+            # When several labels share an address, the first in alphabetical order names it.
+            if address not in self.names or name < self.names[address]:
+                self.names[address] = name
+        self.addresses = sorted(self.names)
+
+    def name (self, address):
+        i = bisect.bisect_right(self.addresses, address) - 1
+        if i < 0:
+            return "{:04X}".format(address)
+        start = self.addresses[i]
+        if start == address:
+            return self.names[start]
+        return "{}+0x{:02X}".format(self.names[start], address - start)
+
+class Profiler:
+    def __init__(self):
+        self.opCodeCounts = [0] * 32
+        self.addressCounts = [0] * uaEmulator.memorySize
+        self.callCounts = {}
+        self.stackCounts = {}
+        self.instructions = 0
+        self.root = None
+        # The shadow call stack; a list of (frame address, call target) pairs, and the key
+        # of the current stack in stackCounts.
+        self.frames = []
+        self.stackKey = None
+
+    # Add instructions executed in the current call stack to its count.
+    def countStack (self, instructions):
+        if instructions:
+            stackCounts = self.stackCounts
+            key = self.stackKey
+            if key not in stackCounts and len(stackCounts) >= maxStacks:
+                key = otherStack
+            stackCounts[key] = stackCounts.get(key, 0) + instructions
+
+    def setStack (self):
+        self.stackKey = (self.root,) + tuple(target for frame, target in self.frames[:maxStackDepth - 1])
+
+    def enterCall (self, frame, target):
+        self.callCounts[target] = self.callCounts.get(target, 0) + 1
+        self.frames.append((frame, target))
+        if len(self.frames) < maxStackDepth:
+            self.stackKey += (target,)
+
+    def leaveCall (self, frame):
+        frames = self.frames
+        for i in range(len(frames) - 1, -1, -1):
+            if frames[i][0] == frame:
+                del frames[i:]
+                self.setStack()
+                return
+
+    # Run a machine like Machine.run, profiling every instruction executed. Profiling can go on
+    # over several calls. Returns the exit code, or None if the program is still running.
+    def run (self, m, maxInstructions = None):
+        if self.root is None:
+            self.root = m.ip
+            self.setStack()
+        decode = m.decode
+        opCodeCounts = self.opCodeCounts
+        addressCounts = self.addressCounts
+        iCall = op_codes.iCall
+        iRet = op_codes.iRet
+        count = 0
+        stackStart = 0
+        try:
+            while not m.halted:
+                if maxInstructions is not None and count >= maxInstructions:
+                    break
+                address = m.ip
+                instruction = decode(address)
+                if m.pendingError is not None and not instruction.testsErrorFlag:
+                    m.halt(m.pendingError)
+                    break
+                m.ip = instruction.nextAddress
+                opCode = instruction.opCode
+                addressCounts[address] += 1
+                opCodeCounts[opCode] += 1
+                if opCode == iCall or opCode == iRet:
+                    # The call belongs to the caller and the ret to the routine returning.
+                    frame = m.sp
+                    count += 1
+                    instruction.handler(m, instruction)
+                    self.countStack(count - stackStart)
+                    stackStart = count
+                    if opCode == iCall:
+                        self.enterCall(m.sp, instruction.immediate)
+                    else:
+                        self.leaveCall(frame)
+                else:
+                    count += 1
+                    instruction.handler(m, instruction)
+        except Halt as halt:
+            m.halt(halt.exitCode)
+        finally:
+            self.countStack(count - stackStart)
+            self.instructions += count
+            m.instructionCount += count
+        return m.exitCode
+
+    # The routines which were called, with the number of calls and the instructions executed in
+    # them; 'self' counts the instructions of the routine itself and 'total' those of the
+    # routines it called as well. Sorted by total, most first. The program's entry point is
+    # included as a routine.
+    def routines (self):
+        selfCounts = {}
+        totalCounts = {}
+        for stack, count in self.stackCounts.items():
+            if stack == otherStack:
+                continue
+            selfCounts[stack[-1]] = selfCounts.get(stack[-1], 0) + count
+            for target in set(stack):
+                totalCounts[target] = totalCounts.get(target, 0) + count
+        routines = []
+        for target, total in totalCounts.items():
+            routines.append({"address": target, "calls": self.callCounts.get(target, 0),
+                             "self": selfCounts.get(target, 0), "total": total})
+        routines.sort(key=lambda routine: (-routine["total"], routine["address"]))
+        return routines
+
+    # The instruction addresses executed and their counts, most executed first.
+    def hotSpots (self):
+        counts = self.addressCounts
+        addresses = [address for address in range(len(counts)) if counts[address]]
+        addresses.sort(key=lambda address: (-counts[address], address))
+        return [(address, counts[address]) for address in addresses]
+
+    def opCodes (self):
+        counts = [(uaEmulator.opCodeNames.get(opCode, "{:02X}".format(opCode)), count)
+                  for opCode, count in enumerate(self.opCodeCounts) if count]
+        counts.sort(key=lambda item: (-item[1], item[0]))
+        return counts
+
+    def stackNames (self, stack, symbols):
+        return [symbols.name(target) if isinstance(target, int) else target for target in stack]
+
+    # The mnemonic of the instruction at an address, as it is in memory now.
+    def mnemonic (self, m, address):
+        return uaEmulator.opCodeNames.get(m.memory[address] >> 3, "?")
+
+    def report (self, m, symbols, top = 30):
+        total = self.instructions or 1
+        lines = ["{:,} instructions executed".format(self.instructions), "", "Op-codes"]
+        for name, count in self.opCodes():
+            lines.append("    {:<8}{:>14,}{:>8.2f}%".format(name, count, count * 100 / total))
+
+        lines += ["", "Hot spots"]
+        hotSpots = self.hotSpots()
+        for address, count in hotSpots[:top]:
+            lines.append("    {:04X}  {:<28}{:<8}{:>14,}{:>8.2f}%".format(
+                address, symbols.name(address), self.mnemonic(m, address), count, count * 100 / total))
+        if len(hotSpots) > top:
+            lines.append("    ... {} more addresses".format(len(hotSpots) - top))
+
+        lines += ["", "Routines", "    {:<34}{:>10}{:>14}{:>9}{:>14}{:>9}".format(
+            "", "calls", "self", "", "total", "")]
+        for routine in self.routines()[:top]:
+            lines.append("    {:04X}  {:<28}{:>10,}{:>14,}{:>8.2f}%{:>14,}{:>8.2f}%".format(
+                routine["address"], symbols.name(routine["address"]), routine["calls"],
+                routine["self"], routine["self"] * 100 / total, routine["total"], routine["total"] * 100 / total))
+        return "\n".join(lines) + "\n"
+
+    def toJSON (self, m, symbols):
+        return {
+            "instructions": self.instructions,
+            "exitCode": m.exitCode,
+            "opCodes": dict(self.opCodes()),
+            "addresses": [{"address": address, "name": symbols.name(address), "mnemonic": self.mnemonic(m, address),
+                           "count": count} for address, count in self.hotSpots()],
+            "routines": [dict(routine, name=symbols.name(routine["address"])) for routine in self.routines()],
+            "stacks": [{"stack": self.stackNames(stack, symbols), "count": count}
+                       for stack, count in sorted(self.stackCounts.items(), key=lambda item: -item[1])],
+        }
+
+    def collapsedStacks (self, symbols):
+        lines = ["{} {}".format(";".join(self.stackNames(stack, symbols)), count) for stack, count in self.stackCounts.items()]
+        lines.sort()
+        return "\n".join(lines) + "\n" if lines else ""
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Profile a UA program.")
+    argParser.add_argument("program", help="a binary image or hex code written by the assembler")
+    argParser.add_argument("-m", "--map", help="a symbol map of the program, to report addresses by label")
+    argParser.add_argument("-f", "--format", choices=("text", "json", "collapsed"), default="text",
+                           help="the format of the report (default: text)")
+    argParser.add_argument("-o", "--output", help="write the report to this file instead of stderr")
+    argParser.add_argument("-n", "--max-instructions", type=int, default=None,
+                           help="stop after this many instructions")
+    argParser.add_argument("-t", "--top", type=int, default=30,
+                           help="the number of addresses and routines in a text report (default: 30)")
+    args = argParser.parse_args()
+
+    machine = uaEmulator.Machine()
+    try:
+        machine.loadProgramFile(args.program)
+        symbols = {}
+        if args.map:
+            with open(args.map) as f:
+                symbols = uaImage.parseSymbolMap(f.read())
+    except (OSError, uaImage.ImageFormatError, ValueError) as error:
+        print("Could not load {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+    symbols = SymbolTable(symbols)
+
+    profiler = Profiler()
+    start = time.perf_counter()
+    exitCode = profiler.run(machine, args.max_instructions)
+    elapsed = time.perf_counter() - start
+    machine.io.flush()
+
+    if args.format == "json":
+        report = json.dumps(profiler.toJSON(machine, symbols), indent=2) + "\n"
+    elif args.format == "collapsed":
+        report = profiler.collapsedStacks(symbols)
+    else:
+        report = profiler.report(machine, symbols, args.top)
+        report += "\nProfiled in {:.3f} s.\n".format(elapsed)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    else:
+        sys.stderr.write(report)
+
+    if exitCode is None:
+        print("The program was stopped after {} instructions.".format(machine.instructionCount), file=sys.stderr)
+        exit(0)
+    sys.exit(exitCode)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# This program keeps the assembler resident so that assembling a file doesn't pay for starting
+# Python, compiling the assembler's patterns and building its tables every time. It serves
+# assembly requests over a Unix socket or over its stdin and stdout, and uaClient.py is a client
+# with the same options as the assembler's command line.
+#
+# Requests and responses are JSON objects, one per line. A request holds
+#
+#     source    the source code to assemble
+#     format    "bin" for a binary image (the default), "hex" for hex code or "object" for a
+#               relocatable object
+#     map       true to return a symbol map of the program's labels as well
+#     optimize  true to run the peephole optimizer, like the assembler's '-O'
+#     id        anything; it's returned unchanged in the response
+#
+# and the response
+#
+#     ok        true if the source was assembled
+#     output    the image, hex code or object, base64 encoded
+#     map       the symbol map, if one was asked for
+#     errors    if ok is false; a list of objects with the type, line and message of each error
+#     text      if ok is false; the errors as the assembler prints them
+#     id        the request's id
+#
+# Every request is assembled by a new Assembler, so requests can't see each other's names, and a
+# Unix socket server assembles the requests of different connections at the same time. Responses
+# to the same source code and options are remembered, so rebuilding a file which hasn't changed
+# costs a hash and a dictionary lookup.
+#
+# usage: python uaServer.py [--socket path | --stdio]
+import argparse
+import base64
+import collections
+import hashlib
+import json
+import os
+import socketserver
+import sys
+import threading
+import traceback
+
+import uaAssembler
+import uaImage
+import uaObject
+
+formats = ("bin", "hex", "object")
+
+# The socket clients connect to when they aren't given one.
+def defaultSocketPath ():
+    return os.environ.get("UA_ASSEMBLER_SOCKET",
+                          os.path.join(os.environ.get("TMPDIR", "/tmp"), "uaAssembler-{}.sock".format(os.getuid())))
+
+def errorList (error):
+    errors = error.errors if isinstance(error, uaAssembler.UnresolvedNamesError) else [error]
+    return [{"type": e.errorType, "line": e.lineNumber, "message": e.message} for e in errors]
+
+# Assemble the source code of a request. Returns the response, without the id.
+def assembleRequest (request):
+    sourceCode = request.get("source")
+    outputFormat = request.get("format", "bin")
+    if not isinstance(sourceCode, str) or outputFormat not in formats:
+        return {"ok": False, "errors": [{"type": "Request", "line": 0,
+                                         "message": "A request needs the source code and a format of bin, hex or object."}]}
+
+    assembler = uaAssembler.Assembler(bool(request.get("optimize")))
+    try:
+        if outputFormat == "object":
+            output = uaObject.packObject(assembler.assembleObject(sourceCode))
+        elif outputFormat == "hex":
+            output = uaImage.formatHex(assembler.assemble(sourceCode)).encode("ascii")
+        else:
+            program = assembler.assemble(sourceCode)
+            output = uaImage.packImage([uaImage.Section(0, uaImage.sectionCode, program)], assembler.entryPoint())
+    except uaAssembler.AssemblyError as error:
+        return {"ok": False, "errors": errorList(error), "text": str(error)}
+
+    response = {"ok": True, "output": base64.b64encode(output).decode("ascii")}
+    if request.get("map"):
+        response["map"] = uaImage.formatSymbolMap(assembler.labels())
+    return response
+
+# The responses to the most recent requests, keyed by a hash of the request.
+class ResponseCache:
+    def __init__(self, size = 256):
+        self.size = size
+        self.responses = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key (self, request):
+        return hashlib.sha256(json.dumps([request.get("source"), request.get("format", "bin"),
+                                          bool(request.get("map")), bool(request.get("optimize"))]).encode()).digest()
+
+    def get (self, key):
+        with self.lock:
+            response = self.responses.get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.responses.move_to_end(key)
+            return response
+
+    def put (self, key, response):
+        with self.lock:
+            self.responses[key] = response
+            if len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+class Server:
+    def __init__(self, cacheSize = 256):
+        self.cache = ResponseCache(cacheSize)
+
+    # Handle one line of a request. Returns the line of the response.
+    def handleLine (self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("not an object")
+        except ValueError as error:
+            return json.dumps({"ok": False, "errors": [{"type": "Request", "line": 0,
+                                                        "message": "The request isn't a JSON object: {}".format(error)}]})
+        key = self.cache.key(request)
+        response = self.cache.get(key)
+        if response is None:
+            try:
+                response = assembleRequest(request)
+                self.cache.put(key, response)
+            except Exception as error:
+                # A bug in the assembler mustn't take the server down with it. The error is logged
+                # and reported to the client, and the response isn't remembered.
+                traceback.print_exc(file=sys.stderr)
+                response = {"ok": False, "errors": [{"type": "Internal", "line": 0,
+                                                     "message": "{}: {}".format(type(error).__name__, error)}]}
+        if "id" in request:
+            response = dict(response, id=request["id"])
+        return json.dumps(response)
+
+    # Serve requests from one stream until it ends.
+    def serveStream (self, reader, writer):
+        for line in reader:
+            if line.strip():
+                writer.write((self.handleLine(line) + "\n").encode())
+                writer.flush()
+
+    def serveStdio (self):
+        self.serveStream(sys.stdin.buffer, sys.stdout.buffer)
+
+    def serveSocket (self, path):
+        server = self
+
+        class Handler (socketserver.StreamRequestHandler):
+            def handle (self):
+                server.serveStream(self.rfile, self.wfile)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as socketServer:
+            socketServer.daemon_threads = True
+            try:
+                socketServer.serve_forever()
+            finally:
+                os.unlink(path)
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Serve assembly requests from a resident assembler.")
+    transport = argParser.add_mutually_exclusive_group()
+    transport.add_argument("--socket", help="the Unix socket to listen on (default: {})".format(defaultSocketPath()))
+    transport.add_argument("--stdio", action="store_true", help="read requests from stdin and write responses to stdout")
+    argParser.add_argument("--cache-size", type=int, default=256, help="the number of responses to remember (default: 256)")
+    args = argParser.parse_args()
+
+    server = Server(args.cache_size)
+    if args.stdio:
+        server.serveStdio()
+        return
+    path = args.socket or defaultSocketPath()
+    print("Serving assembly requests on {}.".format(path), file=sys.stderr)
+    try:
+        server.serveSocket(path)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
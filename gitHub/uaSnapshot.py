@@ -0,0 +1,122 @@
+# The snapshot format the emulator saves the state of a machine in (see Machine.snapshot.) A
+# snapshot holds everything a program can see: memory, the data-pool, the special registers, the
+# flags (which include the mode), a pending error and the I/O channel with its read and write
+# positions. The contents of files and the emulator's caches aren't part of it. All multi-byte
+# fields are big-endian.
+#
+#     header (88 bytes)
+#         0   4   magic number, the ASCII characters "UASN"
+#         4   1   format version (currently 1)
+#         5   1   state flags (stateHalted, stateErrorPending, stateExited)
+#         6   20  ip, sp, ap, wl, flg, ar0, ar1, ar2, ar3 and the interrupt handler, 2 bytes each
+#         26  1   rs
+#         27  1   the exit code of the pending error
+#         28  1   the exit code the machine halted with
+#         29  1   unused
+#         30  2   I/O channel
+#         32  8   number of instructions executed
+#         40  8   I/O read position
+#         48  8   I/O write position
+#         56  32  page map; a bit for each 256 byte page of memory, from the most significant bit
+#                 of the first byte, set for the pages stored in the snapshot
+#
+#     the data-pool (256 bytes)
+#
+#     the pages of memory whose bits are set, in order of address; the others are all zero
+#
+# Memory is mostly zero, so leaving out the zero pages keeps snapshots of small programs small.
+# Reading a snapshot builds its memory once; restoring it into a machine is then a copy of the 64
+# KiB memory and the data-pool, however many machines it's restored into.
+import struct
+
+magicNumber = b"UASN"
+formatVersion = 1
+headerFormat = struct.Struct(">4sBB10HBBBxHQQQ32s")
+pageSize = 0x100
+addressSpaceSize = 0x10000
+dataPoolSize = 0x100
+
+# State flags.
+stateHalted = 0x01
+stateErrorPending = 0x02
+stateExited = 0x04
+
+# The registers in the order of the header.
+registerNames = ("ip", "sp", "ap", "wl", "flg", "ar0", "ar1", "ar2", "ar3", "interruptHandler")
+
+# 'registers' maps the names in registerNames and "rs" to their values, 'memory' and 'dataPool'
+# are bytes objects of the whole memory and data-pool and 'exitCode' and 'pendingError' are exit
+# codes or None.
+class Snapshot:
+    def __init__(self, registers, memory, dataPool, halted = False, exitCode = None, pendingError = None,
+                 instructionCount = 0, channel = 0, readPosition = 0, writePosition = 0):
+        self.registers = registers
+        self.memory = memory
+        self.dataPool = dataPool
+        self.halted = halted
+        self.exitCode = exitCode
+        self.pendingError = pendingError
+        self.instructionCount = instructionCount
+        self.channel = channel
+        self.readPosition = readPosition
+        self.writePosition = writePosition
+
+class SnapshotFormatError(Exception):
+    pass
+
+def packSnapshot (snapshot):
+    memory = snapshot.memory
+    zeroPage = bytes(pageSize)
+    pages = [address for address in range(0, addressSpaceSize, pageSize) if memory[address:address + pageSize] != zeroPage]
+    pageMap = bytearray(addressSpaceSize // pageSize // 8)
+    for address in pages:
+        page = address // pageSize
+        pageMap[page >> 3] |= 0x80 >> (page & 7)
+
+    state = ((stateHalted if snapshot.halted else 0) | (stateErrorPending if snapshot.pendingError is not None else 0) |
+             (stateExited if snapshot.exitCode is not None else 0))
+    header = headerFormat.pack(magicNumber, formatVersion, state, *(snapshot.registers[name] for name in registerNames),
+                               snapshot.registers["rs"], snapshot.pendingError or 0, snapshot.exitCode or 0,
+                               snapshot.channel, snapshot.instructionCount, snapshot.readPosition,
+                               snapshot.writePosition, bytes(pageMap))
+    return b"".join([header, bytes(snapshot.dataPool)] + [bytes(memory[address:address + pageSize]) for address in pages])
+
+def readSnapshot (data):
+    view = memoryview(data)
+    if len(view) < headerFormat.size + dataPoolSize:
+        raise SnapshotFormatError("The file is too short to be a UA snapshot.")
+    fields = headerFormat.unpack_from(view, 0)
+    magic, version, state = fields[:3]
+    if magic != magicNumber:
+        raise SnapshotFormatError("The file is not a UA snapshot.")
+    if version != formatVersion:
+        raise SnapshotFormatError("UA snapshot format version {} is not supported.".format(version))
+    registers = dict(zip(registerNames, fields[3:13]))
+    rs, pendingError, exitCode, channel, instructionCount, readPosition, writePosition, pageMap = fields[13:]
+    registers["rs"] = rs
+
+    offset = headerFormat.size
+    dataPool = bytes(view[offset:offset + dataPoolSize])
+    offset += dataPoolSize
+    memory = bytearray(addressSpaceSize)
+    for page in range(addressSpaceSize // pageSize):
+        if pageMap[page >> 3] & (0x80 >> (page & 7)):
+            if offset + pageSize > len(view):
+                raise SnapshotFormatError("The snapshot is truncated.")
+            memory[page * pageSize:(page + 1) * pageSize] = view[offset:offset + pageSize]
+            offset += pageSize
+
+    return Snapshot(registers, bytes(memory), dataPool, bool(state & stateHalted),
+                    exitCode if state & stateExited else None, pendingError if state & stateErrorPending else None,
+                    instructionCount, channel, readPosition, writePosition)
+
+def isSnapshot (data):
+    return bytes(data[:len(magicNumber)]) == magicNumber
+
+def loadSnapshotFile (path):
+    with open(path, "rb") as f:
+        return readSnapshot(f.read())
+
+def saveSnapshotFile (path, snapshot):
+    with open(path, "wb") as f:
+        f.write(packSnapshot(snapshot))
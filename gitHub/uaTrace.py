@@ -0,0 +1,571 @@
+# This program records what a UA program does, one instruction at a time, so that how it got to a
+# surprising exit code can be looked at afterwards. Every instruction executed is recorded as a
+# fixed size binary record of its address, op-code and operand fields, what it wrote and the
+# flags register after it. The input read by 'in' is recorded too, so a run can be replayed
+# exactly, without the console input or the files it read.
+#
+#     python uaTrace.py record program.bin trace.uat      run a program, recording a trace
+#     python uaTrace.py replay program.bin trace.uat      run it again on the recorded input and
+#                                                         check that it does the same
+#     python uaTrace.py last trace.uat [-c N]             the last N instructions before the exit
+#     python uaTrace.py writes trace.uat LOCATION         every write to a memory address or label,
+#                                                         data-pool address (w00-w7F, p00-p7F) or register
+#
+# What an instruction wrote is the first memory write it made, if it wrote to memory (mov to
+# memory, call, in and mw writing the memory window back), and otherwise its destination operand,
+# the first one for mul and div; ap for alloc and wl for mw. Writes to wi0-wi3, pi0-pi3 and the
+# SIMD groups are data-pool writes. Memory is what's in memory, as in the
+# debugger, so data-pool writes to the memory window only show up as memory writes when mw writes
+# the window back.
+#
+# Overhead: like the profiler and the debugger the tracer runs the program with its own loop, so
+# the emulator's loops have no hooks in them. It runs basic blocks out of the machine's block
+# cache like '-e blocks', with a WriteRecordingCache catching the memory writes as the cache is
+# told about them. Each instruction costs one struct.pack_into into a preallocated buffer of
+# bufferRecords records; when the buffer is full it is written to the trace file in one go, or
+# with '--last', it wraps around so that only the last bufferRecords instructions are kept.
+# Tracing runs at about the speed of the interpreter, 1.7 times as long as '-e blocks'; printing
+# a line of text for every instruction takes 2.5 times as long (see benchmarks/traceBenchmark.py.)
+#
+#     header (38 bytes)
+#         0   4   magic number, the ASCII characters "UATR"
+#         4   1   format version (currently 1)
+#         5   1   record size (21)
+#         6   2   unused
+#         8   8   number of records
+#         16  8   number of instructions executed before the first record
+#         24  8   number of instructions executed when the trace ended
+#         32  4   number of inputs
+#         36  2   the exit code, or -1 if the program hadn't exited
+#
+#     records, oldest first
+#         0   2   ip; the address of the instruction
+#         2   1   the first byte of the instruction; the op-code and operand type bits
+#         3   3   the operand fields, zero for those the instruction doesn't have
+#         6   1   what the instruction wrote (writeNone, writePool, writeRegister, writeMemory)
+#         7   2   the number of bytes it wrote, up to 0xFFFF
+#         9   2   the data-pool address, operand ID of the register or memory address written
+#         11  8   the value written, unsigned; the first 8 bytes of longer writes
+#         19  2   the flags register after the instruction
+#
+#     inputs, in the order they were read; the kind (inputRead, inputOpen), the size (4 bytes)
+#     and the bytes. A read is what a read of the console or a file returned, an open whether
+#     selecting a file managed to open it (1 or 0).
+#
+# usage: python uaTrace.py record|replay|last|writes ...
+import argparse
+import struct
+import sys
+
+import uaAssembler
+import uaDebugger
+import uaDisassembler
+import uaEmulator
+import uaImage
+import uaProfiler
+
+# NumPy is optional. Without it queries look at the records one at a time.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+op_codes = uaEmulator.op_codes
+oper_ID = uaEmulator.oper_ID
+Halt = uaEmulator.Halt
+
+magicNumber = b"UATR"
+formatVersion = 1
+headerFormat = struct.Struct(">4sBBxxQQQIh")
+recordFormat = struct.Struct(">HB3sBHHQH")
+inputFormat = struct.Struct(">BI")
+bufferRecords = 0x10000
+
+# What an instruction wrote.
+writeNone = 0
+writePool = 1
+writeRegister = 2
+writeMemory = 3
+
+# Kinds of input.
+inputRead = 0
+inputOpen = 1
+
+# The instructions whose first operand is their destination.
+destinationOpCodes = frozenset((op_codes.iAdd, op_codes.iSub, op_codes.iMul, op_codes.iDiv, op_codes.iAnd, op_codes.iOr,
+                                op_codes.iNor, op_codes.iXor, op_codes.iNot, op_codes.iMov))
+# The registers alloc and mw write.
+registerOpCodes = {op_codes.iAlloc: oper_ID.ap, op_codes.iMw: oper_ID.wl}
+
+class TraceFormatError(Exception):
+    pass
+
+# A block cache which also remembers the first memory write since 'written' was last cleared.
+# Machine.store tells the block cache about every write to memory.
+class WriteRecordingCache(uaEmulator.BlockCache):
+    def __init__(self):
+        super().__init__()
+        self.written = None
+
+    def checkWrite (self, memory, address, data):
+        if self.written is None:
+            self.written = (address, data)
+        super().checkWrite(memory, address, data)
+
+# I/O which records the input a program reads. Reads all go through read(), so that reads of
+# files which would go straight into memory are recorded too.
+class RecordingIO(uaEmulator.IOState):
+    def __init__(self, stdin, stdout):
+        super().__init__(stdin, stdout, directReadSize=sys.maxsize)
+        self.inputs = []
+
+    def open (self, path):
+        file = super().open(path)
+        self.inputs.append((inputOpen, b"\x01" if file is not None else b"\x00"))
+        return file
+
+    def read (self, size):
+        data = super().read(size)
+        self.inputs.append((inputRead, bytes(data)))
+        return data
+
+# I/O which plays back the recorded input of a trace in place of the console and files. Output is
+# thrown away.
+class ReplayIO(uaEmulator.IOState):
+    def __init__(self, inputs):
+        super().__init__(None, None, directReadSize=sys.maxsize)
+        self.inputs = inputs
+        self.remaining = iter(inputs)
+
+    def nextInput (self, kind):
+        try:
+            inputKind, data = next(self.remaining)
+        except StopIteration:
+            raise TraceFormatError("The program read more input than the trace recorded.")
+        if inputKind != kind:
+            raise TraceFormatError("The program read input in another order than the trace recorded.")
+        return data
+
+    def open (self, path):
+        return path if self.nextInput(inputOpen) == b"\x01" else None
+
+    def read (self, size):
+        return self.nextInput(inputRead)
+
+    def flush (self):
+        self.output = bytearray()
+
+    def close (self):
+        self.output = bytearray()
+        self.file = None
+
+class Tracer:
+    # With a file, opened for writing in binary mode, every record is kept; the buffer is written
+    # to the file whenever it is full. Without one the buffer keeps the last 'capacity' records.
+    def __init__(self, file = None, capacity = bufferRecords):
+        self.file = file
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * recordFormat.size)
+        self.offset = 0
+        self.wrapped = False
+        self.spilled = 0
+        # The record of every decoded instruction by block; see prepare.
+        self.prepared = {}
+        if file is not None:
+            file.write(bytes(headerFormat.size))
+
+    # What is recorded for an instruction before its write; the address, first byte and operand
+    # fields, and the kind of destination it has, where it is, its size (None for the word length)
+    # and the operand type and argument to read it with.
+    def prepare (self, m, instruction):
+        address = instruction.address
+        byte0 = m.memory[address]
+        count = len(instruction.operands)
+        fields = bytes(m.memory[(address + 1 + i) & 0xFFFF] for i in range(count)).ljust(3, b"\x00")
+        opCode = instruction.opCode
+        if opCode in destinationOpCodes and instruction.operands:
+            operandType, arg = instruction.operands[0]
+            operandID = fields[0]
+        elif opCode in registerOpCodes:
+            operandID = registerOpCodes[opCode]
+            operandType, arg = uaEmulator.operandTable[operandID], None
+        else:
+            return address, byte0, fields, writeNone, 0, 0, None, None
+        kind = operandType.kind
+        if kind == uaEmulator.KIND_POOL:
+            return address, byte0, fields, writePool, arg, None, None, None
+        if kind == uaEmulator.KIND_SIMD:
+            return address, byte0, fields, writePool, operandType.fixedArg, uaEmulator.SIMDGroupSize, None, None
+        if kind == uaEmulator.KIND_REGISTER and operandType.read is uaEmulator.readPoolRegister:
+            return address, byte0, fields, writePool, operandType.fixedArg, 2, None, None
+        if kind == uaEmulator.KIND_REGISTER or kind == uaEmulator.KIND_FLAG:
+            return (address, byte0, fields, writeRegister, operandID, operandType.width, operandType,
+                    operandType.fixedArg)
+        return address, byte0, fields, writeNone, 0, 0, None, None
+
+    # Write a full buffer to the file, or start filling it again from the start.
+    def spill (self):
+        if self.file is not None:
+            self.file.write(self.buffer)
+            self.spilled += self.capacity
+        else:
+            self.wrapped = True
+        self.offset = 0
+
+    # Run a machine like Machine.runBlocks, recording every instruction executed. Tracing can go on
+    # over several calls. Returns the exit code, or None if the program is still running. Reads
+    # which IOState makes straight into memory aren't seen; the machine's io should be a
+    # RecordingIO or ReplayIO.
+    def run (self, m, maxInstructions = None):
+        cache = m.blockCache
+        if not isinstance(cache, WriteRecordingCache):
+            cache = m.blockCache = WriteRecordingCache()
+            self.prepared = {}
+        blocks = cache.blocks
+        preparedBlocks = self.prepared
+        prepare = self.prepare
+        buffer = self.buffer
+        bufferSize = len(buffer)
+        recordSize = recordFormat.size
+        packRecord = recordFormat.pack_into
+        offset = self.offset
+        count = 0
+        try:
+            while not m.halted:
+                remaining = maxInstructions - count if maxInstructions is not None else sys.maxsize
+                if remaining <= 0:
+                    break
+                block = blocks.get(m.ip)
+                if block is None:
+                    cache.misses += 1
+                    block = cache.build(m, m.ip)
+                else:
+                    cache.hits += 1
+                prepared = preparedBlocks.get(block)
+                if prepared is None:
+                    prepared = preparedBlocks[block] = [prepare(m, instruction) for instruction in block.instructions]
+                instructions = block.instructions
+                end = min(len(instructions), remaining)
+                writesMemory = block.writesMemory
+                for i in range(end):
+                    instruction = instructions[i]
+                    if m.pendingError is not None and not instruction.testsErrorFlag:
+                        m.halt(m.pendingError)
+                        return m.exitCode
+                    m.ip = instruction.nextAddress
+                    cache.written = None
+                    try:
+                        instruction.handler(m, instruction)
+                    finally:
+                        address, byte0, fields, kind, where, size, operandType, arg = prepared[i]
+                        written = cache.written
+                        if written is not None:
+                            kind = writeMemory
+                            where, data = written
+                            size = min(len(data), 0xFFFF)
+                            value = int.from_bytes(data[:8], "big")
+                        elif kind == writePool:
+                            if size is None:
+                                size = m.wordBytes
+                            value = int.from_bytes(m.dataPool[where:where + min(size, 8)], "big")
+                        elif kind == writeRegister:
+                            value = operandType.read(m, arg, size)
+                        else:
+                            value = 0
+                        packRecord(buffer, offset, address, byte0, fields, kind, size, where, value, m.flg)
+                        offset += recordSize
+                        if offset == bufferSize:
+                            self.spill()
+                            offset = 0
+                    count += 1
+                    if writesMemory[i] and not block.valid:
+                        del preparedBlocks[block]
+                        break
+        except Halt as halt:
+            count += 1
+            m.halt(halt.exitCode)
+        finally:
+            m.instructionCount += count
+            self.offset = offset
+        return m.exitCode
+
+    # The records in the buffer, oldest first.
+    def records (self):
+        if self.wrapped:
+            return bytes(self.buffer[self.offset:] + self.buffer[:self.offset])
+        return bytes(self.buffer[:self.offset])
+
+    # Finish the trace of a machine. With a file, the rest of the records, the inputs of the
+    # machine's RecordingIO and the header are written to it; otherwise the whole trace is returned
+    # as bytes.
+    def finish (self, m):
+        records = self.records()
+        count = self.spilled + len(records) // recordFormat.size
+        first = m.instructionCount - count
+        inputs = getattr(m.io, "inputs", [])
+        header = headerFormat.pack(magicNumber, formatVersion, recordFormat.size, count, first, m.instructionCount,
+                                   len(inputs), m.exitCode if m.exitCode is not None else -1)
+        data = b"".join([records] + [inputFormat.pack(kind, len(data)) + data for kind, data in inputs])
+        if self.file is None:
+            return header + data
+        self.file.write(data)
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.flush()
+        return None
+
+# A trace read back. 'records' is a memoryview of the packed records and 'first' the number of
+# instructions executed before the first of them.
+class Trace:
+    def __init__(self, records, first, instructions, exitCode, inputs):
+        self.records = records
+        self.first = first
+        self.instructions = instructions
+        self.exitCode = exitCode
+        self.inputs = inputs
+
+    def __len__ (self):
+        return len(self.records) // recordFormat.size
+
+    # The record at an index, unpacked.
+    def record (self, index):
+        return recordFormat.unpack_from(self.records, index * recordFormat.size)
+
+    # The indexes of the last 'count' records.
+    def last (self, count):
+        return range(max(len(self) - count, 0), len(self))
+
+    # The indexes of the records of writes of 'kind' covering 'address'; for registers, writes to
+    # the register with that operand ID.
+    def writes (self, kind, address):
+        if numpy is not None:
+            fields = numpy.frombuffer(self.records, recordDType)
+            if kind == writeRegister:
+                hits = (fields["kind"] == kind) & (fields["address"] == address)
+            else:
+                offsets = (address - fields["address"].astype(numpy.int32)) & 0xFFFF
+                hits = (fields["kind"] == kind) & (offsets < fields["size"])
+            return numpy.flatnonzero(hits).tolist()
+        indexes = []
+        for index, (ip, byte0, operands, recordKind, size, where, value, flags) in enumerate(
+                recordFormat.iter_unpack(self.records)):
+            if recordKind != kind:
+                continue
+            if where == address if kind == writeRegister else (address - where) & 0xFFFF < size:
+                indexes.append(index)
+        return indexes
+
+if numpy is not None:
+    recordDType = numpy.dtype([("ip", ">u2"), ("byte0", "u1"), ("operands", "u1", 3), ("kind", "u1"), ("size", ">u2"),
+                               ("address", ">u2"), ("value", ">u8"), ("flags", ">u2")])
+
+def readTrace (data):
+    view = memoryview(data)
+    if len(view) < headerFormat.size:
+        raise TraceFormatError("The file is too short to be a UA trace.")
+    magic, version, recordSize, count, first, instructions, inputCount, exitCode = headerFormat.unpack_from(view, 0)
+    if magic != magicNumber:
+        raise TraceFormatError("The file is not a UA trace.")
+    if version != formatVersion or recordSize != recordFormat.size:
+        raise TraceFormatError("UA trace format version {} is not supported.".format(version))
+    offset = headerFormat.size + count * recordSize
+    if offset > len(view):
+        raise TraceFormatError("The trace is truncated.")
+    records = view[headerFormat.size:offset]
+    inputs = []
+    for _ in range(inputCount):
+        if offset + inputFormat.size > len(view):
+            raise TraceFormatError("The trace is truncated.")
+        kind, size = inputFormat.unpack_from(view, offset)
+        offset += inputFormat.size
+        inputs.append((kind, bytes(view[offset:offset + size])))
+        offset += size
+    return Trace(records, first, instructions, exitCode if exitCode >= 0 else None, inputs)
+
+def loadTraceFile (path):
+    with open(path, "rb") as f:
+        return readTrace(f.read())
+
+operandNames = uaDisassembler.operandNames
+# The registers and flags instructions write by name; wi0-wi3 and pi0-pi3 are in the data-pool.
+registerIDs = {name: operandID for operandID, name in operandNames.items()
+               if uaEmulator.operandTable[operandID] is not None
+               and uaEmulator.operandTable[operandID].kind in (uaEmulator.KIND_REGISTER, uaEmulator.KIND_FLAG)
+               and uaEmulator.operandTable[operandID].read is not uaEmulator.readPoolRegister}
+
+# Describe a record as text.
+def formatRecord (trace, index, symbols):
+    ip, byte0, fields, kind, size, where, value, flags = trace.record(index)
+    opCode = byte0 >> 3
+    info = uaDisassembler.opCodeInfo[opCode]
+    operands = []
+    if info is not None and info.format == uaDisassembler.FORMAT_OPERANDS:
+        for i in range(info.operandCount):
+            field = fields[i]
+            if not byte0 & (0b100 >> i):
+                operands.append(uaDisassembler.poolOperandName(field))
+            elif field in uaDisassembler.literalOperandPrefixes:
+                operands.append(uaDisassembler.literalOperandPrefixes[field] + "x")
+            elif field == oper_ID.litAddr:
+                operands.append("@")
+            else:
+                # The payload isn't recorded; register offsets are written as '@ar0+'.
+                name = operandNames.get(field, "?{:02X}".format(field))
+                operands.append(name + "+" if uaDisassembler.payloadSizes.get(field) else name)
+    text = "{:>10}  {:<20} {:04X}  {:<24}".format(trace.first + index + 1, symbols.name(ip), ip,
+                                                  " ".join([uaEmulator.opCodeNames.get(opCode, "?")] + operands))
+    if kind == writeMemory:
+        text += "{:<20}".format("[{:04X}]:{}".format(where, size))
+    elif kind == writePool:
+        text += "{:<20}".format("{}:{}".format(uaDisassembler.poolOperandName(where), size))
+    elif kind == writeRegister:
+        text += "{:<20}".format(operandNames.get(where, "?"))
+    else:
+        text += " " * 20
+    if kind != writeNone:
+        text += "= {:0{}X}  ".format(value, min(size, 8) * 2)
+    return text + "flg {:04X}".format(flags)
+
+# Parse the location of a writes query into a kind of write and an address.
+def parseLocation (text, symbols):
+    if text in registerIDs:
+        return writeRegister, registerIDs[text]
+    if uaAssembler.memoryWindowAddrPattern.search(text):
+        return writePool, int(text[1:], 16)
+    if uaAssembler.parameterSpaceAddrPattern.search(text):
+        return writePool, uaEmulator.windowSize + int(text[1:], 16)
+    return writeMemory, uaDebugger.parseAddress(text, symbols)
+
+def describeEnd (trace):
+    if trace.exitCode is None:
+        return "The program was stopped after {} instructions.".format(trace.instructions)
+    return "The program exited with code 0x{:02X} after {} instructions.".format(trace.exitCode, trace.instructions)
+
+def record (args):
+    machine = uaEmulator.Machine()
+    machine.io = RecordingIO(sys.stdin.buffer, sys.stdout.buffer)
+    try:
+        machine.loadProgramFile(args.program)
+        file = open(args.trace, "wb")
+    except (OSError, uaImage.ImageFormatError, ValueError) as error:
+        print("Could not load {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+    with file:
+        tracer = Tracer(None if args.last else file, args.buffer)
+        exitCode = tracer.run(machine, args.max_instructions)
+        machine.io.close()
+        trace = tracer.finish(machine)
+        if trace is not None:
+            file.write(trace)
+    print("Trace written to {}.".format(args.trace), file=sys.stderr)
+    if exitCode is None:
+        print("The program was stopped after {} instructions.".format(machine.instructionCount), file=sys.stderr)
+        exit(0)
+    sys.exit(exitCode)
+
+# Run the program on the trace's input and compare the records the trace holds with the last ones
+# of the new run.
+def replay (args):
+    try:
+        trace = loadTraceFile(args.trace)
+        machine = uaEmulator.Machine()
+        machine.io = ReplayIO(trace.inputs)
+        machine.loadProgramFile(args.program)
+    except (OSError, uaImage.ImageFormatError, TraceFormatError, ValueError) as error:
+        print("Could not load {}: {}".format(args.program, error), file=sys.stderr)
+        exit(1)
+    tracer = Tracer(capacity=max(len(trace), 1))
+    # A program halted by a pending error halts before the instruction after the last one it
+    # executed, so one more is allowed if the program exited.
+    try:
+        tracer.run(machine, trace.instructions + (1 if trace.exitCode is not None else 0))
+    except TraceFormatError as error:
+        print("The replay diverged after {} instructions. {}".format(machine.instructionCount, error), file=sys.stderr)
+        exit(1)
+    replayed = readTrace(tracer.finish(machine))
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(tracer.finish(machine))
+
+    if (replayed.instructions, replayed.exitCode) != (trace.instructions, trace.exitCode) or \
+            bytes(replayed.records) != bytes(trace.records):
+        for index in range(min(len(trace), len(replayed))):
+            if trace.record(index) != replayed.record(index):
+                print("The replay diverged at instruction {}.".format(trace.first + index + 1), file=sys.stderr)
+                break
+        else:
+            print("The replay ended differently. {}".format(describeEnd(replayed)), file=sys.stderr)
+        exit(1)
+    print("The replay matches the trace. {}".format(describeEnd(trace)), file=sys.stderr)
+
+def loadForQuery (args):
+    try:
+        trace = loadTraceFile(args.trace)
+        symbols = {}
+        if args.map:
+            with open(args.map) as f:
+                symbols = uaImage.parseSymbolMap(f.read())
+    except (OSError, uaImage.ImageFormatError, TraceFormatError) as error:
+        print("Could not load {}: {}".format(args.trace, error), file=sys.stderr)
+        exit(1)
+    return trace, symbols
+
+def last (args):
+    trace, symbols = loadForQuery(args)
+    symbols = uaProfiler.SymbolTable(symbols)
+    for index in trace.last(args.count):
+        print(formatRecord(trace, index, symbols))
+    print(describeEnd(trace))
+
+def writes (args):
+    trace, symbols = loadForQuery(args)
+    try:
+        kind, address = parseLocation(args.location, symbols)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        exit(1)
+    symbols = uaProfiler.SymbolTable(symbols)
+    indexes = trace.writes(kind, address)
+    for index in indexes[-args.count:] if args.count else indexes:
+        print(formatRecord(trace, index, symbols))
+    print("{} write{} to {} in {} recorded instructions.".format(len(indexes), "" if len(indexes) == 1 else "s",
+                                                                  args.location, len(trace)))
+
+def main ():
+    argParser = argparse.ArgumentParser(description="Record, replay and query traces of UA programs.")
+    commands = argParser.add_subparsers(dest="command", required=True)
+
+    recordParser = commands.add_parser("record", help="run a program, recording a trace")
+    recordParser.add_argument("program", help="a binary image or hex code written by the assembler")
+    recordParser.add_argument("trace", help="the file to write the trace to")
+    recordParser.add_argument("-b", "--buffer", type=int, default=bufferRecords,
+                              help="the number of records buffered in memory (default: {})".format(bufferRecords))
+    recordParser.add_argument("--last", action="store_true", help="only keep the last buffer of records")
+    recordParser.add_argument("-n", "--max-instructions", type=int, default=None,
+                              help="stop after this many instructions")
+    recordParser.set_defaults(function=record)
+
+    replayParser = commands.add_parser("replay", help="run a program on the input of a trace and compare")
+    replayParser.add_argument("program", help="the program the trace was recorded of")
+    replayParser.add_argument("trace", help="the trace")
+    replayParser.add_argument("-o", "--output", help="also write the trace of the replay to this file")
+    replayParser.set_defaults(function=replay)
+
+    lastParser = commands.add_parser("last", help="the last instructions of a trace")
+    lastParser.add_argument("trace", help="the trace")
+    lastParser.add_argument("-c", "--count", type=int, default=20, help="how many instructions (default: 20)")
+    lastParser.add_argument("-m", "--map", help="a symbol map of the program, to report addresses by label")
+    lastParser.set_defaults(function=last)
+
+    writesParser = commands.add_parser("writes", help="the writes of a trace to a location")
+    writesParser.add_argument("trace", help="the trace")
+    writesParser.add_argument("location", help="a memory address or label, w00-w7F, p00-p7F or a register")
+    writesParser.add_argument("-c", "--count", type=int, default=None, help="only show the last COUNT writes")
+    writesParser.add_argument("-m", "--map", help="a symbol map of the program, to give and report addresses by label")
+    writesParser.set_defaults(function=writes)
+
+    args = argParser.parse_args()
+    args.function(args)
+
+if __name__ == "__main__":
+    main()